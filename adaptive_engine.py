@@ -0,0 +1,391 @@
+import hashlib
+import random
+
+import numpy as np
+
+# ==============================================================================
+# 0. Model Settings
+# ==============================================================================
+TRAIT_COLUMN = "السمة"
+QUESTION_COLUMN = "generated_question"
+PARAM_COLUMNS = ["a", "b", "c", "d"]
+
+# Likert answers (1-4) are modelled with a graded 4PL: each of the three
+# category boundaries is a 4PL curve sharing the item's a/c/d and shifted
+# from b by a fixed step. c is the lower asymptote and d the distance of the
+# upper asymptote from 1, so the default a=1, b=0, c=0, d=0 is a plain 2PL.
+BOUNDARY_OFFSETS = np.array([-1.0, 0.0, 1.0])
+NUM_CATEGORIES = len(BOUNDARY_OFFSETS) + 1
+THETA_RANGE = (-3.0, 3.0)
+# Item information is tabulated once per bank on this grid so selection is a
+# gather instead of re-evaluating the model for every remaining item.
+INFO_GRID = np.linspace(*THETA_RANGE, 25)
+_PROB_FLOOR = 1e-12
+
+# Ability scoring keeps one log-posterior row per trait over a fixed
+# quadrature grid with a standard normal prior; "eap" reports the posterior
+# mean, "map" the grid mode, and the SE is the posterior standard deviation.
+QUADRATURE = np.linspace(-4.0, 4.0, 41)
+LOG_PRIOR = -0.5 * QUADRATURE ** 2
+SCORING_METHOD = "eap"
+
+# Selection priority tiers (higher wins): keep probing the last trait after a
+# middle answer, otherwise prefer traits not yet seen, otherwise anything left.
+TIER_ANY = 0
+TIER_UNSEEN_TRAIT = 1
+TIER_LAST_TRAIT = 2
+STAY_ON_TRAIT_SCORES = (2, 3)
+# The original app read the last trait from a session key that was never
+# set, so this rule never fired; it stays off to keep the same trait coverage.
+STAY_ON_TRAIT_AFTER_MIDDLE_ANSWER = False
+
+# "max_info" picks the most informative item in the winning tier, "random"
+# draws uniformly from it (the original DataFrame.sample behaviour).
+SELECTION_STRATEGY = "max_info"
+
+# Test termination. "fixed" asks max_questions items. "adaptive" also stops
+# early, but only once each trait has MIN_ITEMS_PER_TRAIT answers (or all of
+# its items, if it has fewer): then it stops when every trait's SE is at most
+# STOP_SE_THRESHOLD, or when no unasked item would lower any trait's SE by
+# more than MIN_SE_REDUCTION. max_questions stays the hard cap.
+# Off by default: with 5 traits in 15 questions (about 3 items per trait) a
+# trait's SE rarely drops below 0.8. On the shipped bank (simulate.py
+# --sweep, 1000 respondents) thresholds below 0.8 never stop early, 0.8
+# almost never, and 0.85-1.0 average 14.6-14.7 questions at the fixed test's
+# accuracy. The threshold is the lowest that shortens any tests, for when
+# the rule is enabled with a longer MAX_QUESTIONS or fewer traits.
+STOPPING_RULE = "fixed"
+STOP_SE_THRESHOLD = 0.85
+MIN_ITEMS_PER_TRAIT = 2
+MIN_SE_REDUCTION = 0.02
+
+_jitter_rng = np.random.default_rng()
+
+# ==============================================================================
+# 1. Item Bank
+# ==============================================================================
+class ItemBank:
+    # Read-only, shared by every session: one row per question, positions are
+    # 0..size-1 and `labels` maps them back to the source DataFrame index.
+    __slots__ = (
+        "params", "trait_codes", "traits", "questions", "labels", "size",
+        "trait_order", "trait_slot", "trait_start", "trait_counts", "info_table", "routing", "fingerprint",
+        "item_keys"
+    )
+
+    def __init__(self, params, trait_codes, traits, questions, labels, trait_order=None, trait_slot=None,
+                 info_table=None, fingerprint=None, item_keys=None):
+        self.params = params
+        self.trait_codes = trait_codes
+        self.traits = traits
+        self.questions = questions
+        self.labels = labels
+        self.size = len(trait_codes)
+        # Item positions grouped into one contiguous block per trait, and each
+        # position's slot in that layout; sessions only record what they asked.
+        # A bank attached from a shared file (shared_bank.py) passes these in.
+        if trait_order is None:
+            trait_order = np.argsort(trait_codes, kind="stable").astype(np.int32)
+            trait_slot = np.empty(self.size, dtype=np.int32)
+            trait_slot[trait_order] = np.arange(self.size, dtype=np.int32)
+        self.trait_order = trait_order
+        self.trait_slot = trait_slot
+        self.trait_counts = np.bincount(trait_codes, minlength=len(traits)).astype(np.int32)
+        self.trait_start = np.concatenate([[0], np.cumsum(self.trait_counts)[:-1]]).astype(np.int32)
+        if info_table is None:
+            info_table = np.empty((len(INFO_GRID), self.size), dtype=np.float32)
+            for row, theta in zip(info_table, INFO_GRID):
+                row[:] = item_information(params, np.full(self.size, theta))
+        self.info_table = info_table
+        # Optional precomputed routing for the first questions (routing.py).
+        self.routing = None
+        # Content hash naming this bank across processes (stored sessions
+        # are matched to a bank by it, not by a registry version number).
+        self.fingerprint = fingerprint if fingerprint is not None else bank_fingerprint(
+            params, trait_codes, traits, questions, labels
+        )
+        # Per-position key that stays with an item across bank versions, for
+        # joining logged answers back to items (see item_keys).
+        if item_keys is None:
+            item_keys = compute_item_keys([traits[code] for code in trait_codes], questions)
+        self.item_keys = item_keys
+
+    @property
+    def num_traits(self):
+        return len(self.traits)
+
+    def trait_code(self, trait):
+        try:
+            return self.traits.index(trait)
+        except ValueError:
+            return -1
+
+    def trait_items(self, trait_code):
+        start = self.trait_start[trait_code]
+        return self.trait_order[start:start + self.trait_counts[trait_code]]
+
+
+def bank_fingerprint(params, trait_codes, traits, questions, labels):
+    # Nonzero 63-bit hash of everything an item position refers to.
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(np.ascontiguousarray(params, dtype=np.float64).tobytes())
+    for array in (trait_codes, labels):
+        digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+    for text in list(traits) + list(questions):
+        digest.update(text.encode("utf-8") + b"\0")
+    return int.from_bytes(digest.digest(), "little") >> 1 or 1
+
+def compute_item_keys(item_traits, questions):
+    # 63-bit hash of each item's trait and question text: unlike a row label
+    # or a bank position, it survives rows being inserted, deleted or sorted.
+    keys = np.empty(len(questions), dtype=np.uint64)
+    for pos, (trait, text) in enumerate(zip(item_traits, questions)):
+        digest = hashlib.blake2b(f"{trait}\0{text}".encode("utf-8"), digest_size=8).digest()
+        keys[pos] = int.from_bytes(digest, "little") >> 1
+    keys.flags.writeable = False
+    return keys
+
+def build_item_bank(questions_df, traits=()):
+    traits = list(traits)
+    if questions_df.empty:
+        return ItemBank(
+            np.empty((len(PARAM_COLUMNS), 0)), np.empty(0, dtype=np.int16),
+            tuple(traits), [], np.empty(0, dtype=object)
+        )
+    # Traits found in the bank but missing from the configured list still get a code.
+    for trait in questions_df[TRAIT_COLUMN].unique():
+        if trait not in traits:
+            traits.append(trait)
+    codes = {trait: i for i, trait in enumerate(traits)}
+    # One contiguous row per parameter so each of a/b/c/d is a flat vector.
+    params = np.ascontiguousarray(questions_df[PARAM_COLUMNS].to_numpy(dtype=np.float64).T)
+    trait_codes = questions_df[TRAIT_COLUMN].map(codes).to_numpy(dtype=np.int16)
+    labels = questions_df.index.to_numpy()
+    for array in (params, trait_codes, labels):
+        array.flags.writeable = False
+    return ItemBank(params, trait_codes, tuple(traits), questions_df[QUESTION_COLUMN].tolist(), labels)
+
+# ==============================================================================
+# 2. Item Response Model
+# ==============================================================================
+def _logistic(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def category_probabilities(params, theta):
+    # params: (4, n) rows a/b/c/d; theta: (n,) or (n, ...). Returns category
+    # probabilities and their derivatives w.r.t. theta, both shaped
+    # (4,) + theta.shape with the answer category on the leading axis.
+    theta = np.asarray(theta, dtype=np.float64)
+    expand = (slice(None),) + (None,) * (theta.ndim - 1)
+    a, b, c, d = (row[expand] for row in params)
+    offsets = BOUNDARY_OFFSETS.reshape((-1,) + (1,) * theta.ndim)
+    sig = _logistic(a * (theta - b - offsets))
+    scale = 1.0 - c - d
+    boundary = c + scale * sig
+    boundary_deriv = (scale * a) * sig * (1.0 - sig)
+    probs = np.empty((NUM_CATEGORIES,) + theta.shape)
+    derivs = np.empty_like(probs)
+    probs[0] = 1.0 - boundary[0]
+    probs[1:-1] = boundary[:-1] - boundary[1:]
+    probs[-1] = boundary[-1]
+    derivs[0] = -boundary_deriv[0]
+    derivs[1:-1] = boundary_deriv[:-1] - boundary_deriv[1:]
+    derivs[-1] = boundary_deriv[-1]
+    np.maximum(probs, _PROB_FLOOR, out=probs)
+    return probs, derivs
+
+def item_information(params, theta):
+    probs, derivs = category_probabilities(params, theta)
+    return np.sum(derivs * derivs / probs, axis=0)
+
+# ==============================================================================
+# 3. Ability Scoring
+# ==============================================================================
+def new_log_posterior(num_traits):
+    return np.tile(LOG_PRIOR, (num_traits, 1))
+
+def response_log_likelihood(bank, positions, scores):
+    # (k, Q) log-likelihood of each answer (1-4) at every quadrature node,
+    # evaluated for all answered items in one array operation.
+    positions = np.asarray(positions, dtype=np.intp)
+    categories = np.asarray(scores, dtype=np.intp) - 1
+    grid = np.broadcast_to(QUADRATURE, (len(positions), len(QUADRATURE)))
+    probs, _ = category_probabilities(bank.params[:, positions], grid)
+    return np.log(probs[categories, np.arange(len(positions))])
+
+def score_responses(bank, positions, scores):
+    # Full re-score: every item's likelihood is added to its trait's row at once.
+    log_posterior = new_log_posterior(bank.num_traits)
+    if len(positions):
+        np.add.at(log_posterior, bank.trait_codes[np.asarray(positions)], response_log_likelihood(bank, positions, scores))
+    return log_posterior
+
+def update_log_posterior(log_posterior, bank, pos, score):
+    # Incremental per-answer update, O(Q).
+    log_posterior[bank.trait_codes[pos]] += response_log_likelihood(bank, [pos], [score])[0]
+    return log_posterior
+
+def ability_estimates(log_posterior, method=SCORING_METHOD):
+    # The quadrature grid is the last axis, so (traits, Q) for one session
+    # and (respondents, traits, Q) for bulk scoring both work.
+    weights = np.exp(log_posterior - log_posterior.max(axis=-1, keepdims=True))
+    weights /= weights.sum(axis=-1, keepdims=True)
+    eap = weights @ QUADRATURE
+    se = np.sqrt(np.maximum(weights @ QUADRATURE ** 2 - eap ** 2, 0.0))
+    if method == "map":
+        return QUADRATURE[np.argmax(log_posterior, axis=-1)], se
+    return eap, se
+
+def current_theta(item_bank, session):
+    if session.log_posterior is None:
+        return np.zeros(item_bank.num_traits)
+    return ability_estimates(session.log_posterior)[0]
+
+def start_test(item_bank, session, bank_version=None):
+    session.start_test(item_bank, new_log_posterior(item_bank.num_traits), bank_version)
+
+def restore_test(item_bank, session):
+    # Rebuilds what a stored session leaves out (the log-posterior and the
+    # per-trait sums/counts) from its asked items and answers.
+    if session.log_posterior is not None or not session.test_started and not session.question_count:
+        return
+    positions = session.asked_positions().astype(np.intp)
+    scores = session.responses[:session.question_count]
+    codes = item_bank.trait_codes[positions]
+    session.trait_sums = np.bincount(codes, weights=scores, minlength=item_bank.num_traits).astype(np.uint16)
+    session.trait_counts = np.bincount(codes, minlength=item_bank.num_traits).astype(np.uint8)
+    session.log_posterior = score_responses(item_bank, positions, scores)
+
+def submit_answer(item_bank, session, score):
+    # Everything an answer changes in the session, shared by the Streamlit
+    # callback and headless drivers.
+    pos = session.current_item
+    if pos < 0:
+        return
+    code = item_bank.trait_codes[pos]
+    # Recorded here as well as at selection: a record loaded from a session
+    # store only has the on-screen item in current_item.
+    session.asked[session.question_count] = pos
+    session.responses[session.question_count] = score
+    session.trait_sums[code] += score
+    session.trait_counts[code] += 1
+    update_log_posterior(session.log_posterior, item_bank, pos, score)
+    session.question_count += 1
+    session.current_item = -1
+
+# ==============================================================================
+# 4. Item Selection
+# ==============================================================================
+def selection_tiers(bank, session):
+    seen = session.trait_counts[:bank.num_traits] > 0
+    tier_by_trait = np.where(seen, TIER_ANY, TIER_UNSEEN_TRAIT).astype(np.int8)
+    if STAY_ON_TRAIT_AFTER_MIDDLE_ANSWER and session.last_score in STAY_ON_TRAIT_SCORES:
+        tier_by_trait[bank.trait_codes[session.asked[session.question_count - 1]]] = TIER_LAST_TRAIT
+    return tier_by_trait
+
+def candidate_traits(bank, session, tier_by_trait):
+    # Traits of the highest tier that still has items; the rule cascade
+    # (last trait -> unseen traits -> anything) falls out of this.
+    remaining = bank.trait_counts - session.trait_counts
+    open_tiers = tier_by_trait[remaining > 0]
+    if not len(open_tiers):
+        return [], remaining
+    return np.flatnonzero((tier_by_trait == open_tiers.max()) & (remaining > 0)).tolist(), remaining
+
+def draw_random(bank, session, traits, remaining):
+    # Uniform over the candidate traits' unasked items: pick a trait weighted
+    # by what it has left, then rejection-sample its block. A session excludes
+    # at most MAX_QUESTIONS items, so this is O(1) expected.
+    asked = set(session.asked_positions().tolist())
+    weights = [int(remaining[code]) for code in traits]
+    while True:
+        pick = random.randrange(sum(weights))
+        for code, weight in zip(traits, weights):
+            if pick < weight:
+                break
+            pick -= weight
+        items = bank.trait_items(code)
+        pos = int(items[random.randrange(len(items))])
+        if pos not in asked:
+            return pos
+
+def select_max_info(bank, session, theta_by_trait, traits, jitter=True):
+    # Argmax of the tabulated information at each trait's nearest grid theta,
+    # with the session's asked items masked out; a tiny jitter spreads
+    # exposure across items with identical parameters.
+    best_pos, best_info = -1, -np.inf
+    for code in traits:
+        pos, info = most_informative_item(bank, session, theta_by_trait[code], code, jitter=jitter)
+        if info > best_info:
+            best_pos, best_info = pos, info
+    return best_pos
+
+def most_informative_item(bank, session, theta, code, jitter=False):
+    # (position, information) of the trait's best unasked item at the grid
+    # theta nearest `theta`; (-1, -inf) once the trait has none left.
+    items = bank.trait_items(code)
+    if not len(items):
+        return -1, -np.inf
+    info = bank.info_table[np.abs(theta - INFO_GRID).argmin(), items]
+    if jitter:
+        info = info + _jitter_rng.random(len(items)) * 1e-6
+    else:
+        info = info.astype(np.float64)
+    asked = session.asked_positions()
+    asked_here = asked[bank.trait_codes[asked] == code]
+    info[bank.trait_slot[asked_here] - bank.trait_start[code]] = -np.inf
+    i = int(np.argmax(info))
+    return int(items[i]), info[i]
+
+def select_next_item(bank, session, strategy=SELECTION_STRATEGY, jitter=True):
+    traits, remaining = candidate_traits(bank, session, selection_tiers(bank, session))
+    if not traits:
+        return -1
+    if strategy == "random":
+        return draw_random(bank, session, traits, remaining)
+    return select_max_info(bank, session, current_theta(bank, session), traits, jitter)
+
+def get_next_question_logic(item_bank, session, strategy=SELECTION_STRATEGY):
+    if session.trait_counts is None:
+        start_test(item_bank, session)
+    pos = -1
+    if session.question_count < session.max_questions:
+        # Early questions come from the bank's routing table when it was
+        # built for this strategy; deeper ones are selected live.
+        routing = item_bank.routing
+        if routing is not None and routing.strategy == strategy:
+            pos = routing.lookup(session)
+        if pos < 0:
+            pos = select_next_item(item_bank, session, strategy)
+    if pos < 0:
+        return None, "تم الانتهاء من جميع الأسئلة المتاحة."
+    session.asked[session.question_count] = pos
+    session.current_item = pos
+    return item_bank.questions[pos], None
+
+# ==============================================================================
+# 5. Stopping Rule
+# ==============================================================================
+def should_stop(item_bank, session, rule=STOPPING_RULE, se_threshold=STOP_SE_THRESHOLD,
+                min_items_per_trait=MIN_ITEMS_PER_TRAIT, min_se_reduction=MIN_SE_REDUCTION):
+    if session.question_count >= session.max_questions:
+        return True
+    if rule != "adaptive" or session.log_posterior is None:
+        return False
+    # Only traits the bank has items for can be measured.
+    traits = np.flatnonzero(item_bank.trait_counts > 0)
+    # The coverage floor comes first, so a loose threshold cannot end the
+    # test after the prior alone.
+    needed = np.minimum(item_bank.trait_counts[traits], min_items_per_trait)
+    if np.any(session.trait_counts[traits] < needed):
+        return False
+    thetas, standard_errors = ability_estimates(session.log_posterior)
+    if np.all(standard_errors[traits] <= se_threshold):
+        return True
+    for code in traits:
+        _, info = most_informative_item(item_bank, session, thetas[code], code)
+        # SE after one more item, treating information as additive precision.
+        se = standard_errors[code]
+        if info > 0 and se - 1.0 / np.sqrt(1.0 / se ** 2 + info) > min_se_reduction:
+            return False
+    return True
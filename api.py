@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import json
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+
+from adaptive_engine import (
+    get_next_question_logic, restore_test, should_stop, start_test, submit_answer
+)
+from bank_registry import BankRegistry
+from metrics import MetricsExporter, gauge, timed
+from response_log import start_response_log
+from result_store import RESULTS_DB_PATH, ResultStore
+from results import RESULT_HEADERS, build_result_row, calculate_results
+from routing import start_routing_build
+from session_record import SessionRecord
+from session_store import SESSION_DB_PATH, open_session_store
+from settings import CHOICES, CHOICE_VALUES, GOOGLE_SHEET_ID, MAX_QUESTIONS, TRAITS
+from shared_bank import load_shared_bank
+from sheets_writer import start_batch_writer
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Settings
+# ==============================================================================
+# Headless JSON API over the same engine as the Streamlit app, for clients
+# that do not need a websocket session and a script rerun per click. One
+# asyncio (tornado) process keeps sessions in a session store (in memory,
+# or with --session-store sqlite in a file several API processes share);
+# engine calls run inline on the event loop, and everything that can block
+# (session store reads and writes, which wait on SQLite locks held by other
+# processes, and the result save) runs on an executor. Requests for one
+# session are handled one at a time. Results go to the
+# same write-ahead store as the app; with --credentials this process also
+# syncs it to the sheet, otherwise whichever process syncs the store does.
+#   POST /sessions                      {"name", "age", "location"} -> first question
+#   GET  /sessions/<id>/question        current question, or {"done": true}
+#   POST /sessions/<id>/answers         {"item", "answer": 1-4 or choice text} -> next question
+#   GET  /sessions/<id>/results         scores, saved once per session
+API_PORT = 8600
+# Expired sessions are evicted from the store every SWEEP_INTERVAL_SECONDS.
+SWEEP_INTERVAL_SECONDS = 60.0
+IO_WORKERS = 4
+DONE_MESSAGE = "تم الانتهاء من الاختبار."
+
+def load_bank(file_path):
+    bank = load_shared_bank(file_path, TRAITS)
+    start_routing_build(bank, max_questions=MAX_QUESTIONS)
+    return bank
+
+def sheets_opener(credentials_path, sheet_id=GOOGLE_SHEET_ID):
+    # Worksheet factory for the batch writer, from a service-account file.
+    def open_worksheet():
+        import gspread
+        sheet = gspread.service_account(filename=credentials_path).open_by_key(sheet_id).sheet1
+        if not sheet.row_values(1):
+            sheet.append_row(RESULT_HEADERS)
+        return sheet
+    return open_worksheet
+
+# ==============================================================================
+# 1. Engine Service
+# ==============================================================================
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class TestService:
+    # The engine calls behind each endpoint; every change to a session is
+    # saved back to the store before the reply. Each request holds its
+    # session's lock from load to save, so a retried submit or a second
+    # results request in this process sees the first one's changes.
+    def __init__(self, registry, result_store, writer=None, response_log=None, io_workers=IO_WORKERS,
+                 store=None):
+        self.registry = registry
+        self.result_store = result_store
+        self.writer = writer
+        self.response_log = response_log
+        self.store = store if store is not None else open_session_store()
+        self.executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="api-io")
+        # Per-token asyncio locks, dropped once no request holds them.
+        self._locks = weakref.WeakValueDictionary()
+        gauge("api_sessions", lambda: len(self.store))
+
+    def lock(self, token):
+        lock = self._locks.get(token)
+        if lock is None:
+            lock = self._locks[token] = asyncio.Lock()
+        return lock
+
+    async def blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def session(self, token):
+        session = await self.blocking(self.store.load, token)
+        if session is None:
+            raise ApiError(404, "الجلسة غير موجودة أو انتهت صلاحيتها.")
+        return session
+
+    def bank_for(self, session):
+        # By content: the session may have been stored by another process,
+        # whose registry numbers its versions differently.
+        found = self.registry.find(session.bank_fingerprint) if session.bank_fingerprint is not None else None
+        if found is None:
+            raise ApiError(410, "⚠️ تم تحديث بنك الأسئلة، يرجى بدء الاختبار من جديد.")
+        session.bank_version, bank = found
+        restore_test(bank, session)
+        return bank
+
+    def question(self, bank, session):
+        if not session.test_started:
+            return {"done": True, "message": DONE_MESSAGE}
+        pos = session.current_item
+        return {
+            "done": False,
+            "item": pos,
+            "number": session.question_count + 1,
+            "max_questions": session.max_questions,
+            "text": bank.questions[pos],
+            "choices": CHOICES,
+            "values": CHOICE_VALUES,
+        }
+
+    @timed(name="api_start_session")
+    async def start_session(self, name, age, location):
+        session = SessionRecord(MAX_QUESTIONS)
+        error = session.register(name, age, location)
+        if error:
+            raise ApiError(400, error)
+        version, bank = self.registry.current()
+        start_test(bank, session, version)
+        _, error = get_next_question_logic(bank, session)
+        if error:
+            raise ApiError(503, error)
+        session.test_started = True
+        session.page = "test"
+        await self.blocking(self.store.save, session.token, session)
+        return session.token, self.question(bank, session)
+
+    async def current_question(self, token):
+        async with self.lock(token):
+            session = await self.session(token)
+            return self.question(self.bank_for(session), session)
+
+    @timed(name="api_submit_answer")
+    async def answer(self, token, item, answer):
+        async with self.lock(token):
+            return await self._answer(token, item, answer)
+
+    async def _answer(self, token, item, answer):
+        session = await self.session(token)
+        bank = self.bank_for(session)
+        if not session.test_started:
+            raise ApiError(409, DONE_MESSAGE)
+        if item != session.current_item:
+            # A retried or stale submit: the client is told the current question.
+            raise ApiError(409, "هذا ليس السؤال الحالي.")
+        if answer in CHOICES:
+            answer = CHOICE_VALUES[CHOICES.index(answer)]
+        if isinstance(answer, bool) or answer not in CHOICE_VALUES:
+            raise ApiError(400, "يرجى اختيار إجابة صحيحة.")
+        pos = session.current_item
+        submit_answer(bank, session, answer)
+        if self.response_log is not None:
+            self.response_log.record_answer(session, bank, pos)
+        if should_stop(bank, session) or get_next_question_logic(bank, session)[1]:
+            session.test_started = False
+            session.page = "results"
+        await self.blocking(self.store.save, token, session)
+        return self.question(bank, session)
+
+    async def results(self, token):
+        async with self.lock(token):
+            return await self._results(token)
+
+    async def _results(self, token):
+        session = await self.session(token)
+        bank = self.bank_for(session)
+        if session.test_started:
+            raise ApiError(409, "الاختبار لم ينته بعد.")
+        trait_scores, dominant_trait, dominant_score, summary = calculate_results(session, session.user_info, bank.traits)
+        if not session.results_saved:
+            # Marked (and stored) first so requests for the same results in
+            # other processes save once.
+            session.results_saved = True
+            await self.blocking(self.store.save, token, session)
+            row = build_result_row(session.user_info, trait_scores, dominant_trait)
+            try:
+                await self.blocking(self.save, row)
+            except Exception as e:
+                session.results_saved = False
+                await self.blocking(self.store.save, token, session)
+                logger.error("Saving API results failed: %s", e)
+                raise ApiError(503, f"❌ فشل في حفظ النتائج: {e}")
+        return {
+            "scores": {trait: round(score, 2) for trait, score in trait_scores.items()},
+            "dominant_trait": dominant_trait,
+            "dominant_score": round(dominant_score, 2),
+            "abilities": {
+                trait: {"theta": summary[f"ثيتا {trait}"], "se": summary[f"الخطأ المعياري {trait}"]}
+                for trait in TRAITS
+            },
+            "questions_answered": session.question_count,
+        }
+
+    def save(self, row):
+        if self.writer is not None:
+            self.writer.submit(row)
+        else:
+            self.result_store.append(row)
+
+    def sweep(self):
+        return self.store.evict_expired()
+
+# ==============================================================================
+# 2. HTTP Handlers
+# ==============================================================================
+class JsonHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+
+    def body(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise ApiError(400, "طلب غير صالح.")
+        if not isinstance(body, dict):
+            raise ApiError(400, "طلب غير صالح.")
+        return body
+
+    def reply(self, payload, status=200):
+        self.set_status(status)
+        self.finish(json.dumps(payload, ensure_ascii=False))
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None))[1]
+        if isinstance(error, ApiError):
+            self.set_status(error.status)
+            self.finish(json.dumps({"error": error.message}, ensure_ascii=False))
+        else:
+            self.finish(json.dumps({"error": self._reason}, ensure_ascii=False))
+
+    def log_exception(self, typ, value, tb):
+        if not isinstance(value, ApiError):
+            super().log_exception(typ, value, tb)
+
+
+class SessionsHandler(JsonHandler):
+    async def post(self):
+        body = self.body()
+        age = body.get("age")
+        if not isinstance(age, int):
+            raise ApiError(400, "❌ يرجى إدخال عمر صحيح (13-120).")
+        token, question = await self.service.start_session(body.get("name"), age, body.get("location"))
+        self.reply({"session": token, "question": question}, 201)
+
+
+class QuestionHandler(JsonHandler):
+    async def get(self, token):
+        self.reply(await self.service.current_question(token))
+
+
+class AnswersHandler(JsonHandler):
+    async def post(self, token):
+        body = self.body()
+        self.reply(await self.service.answer(token, body.get("item"), body.get("answer")))
+
+
+class ResultsHandler(JsonHandler):
+    async def get(self, token):
+        self.reply(await self.service.results(token))
+
+
+def log_request(handler):
+    # Per-request access logging would cost more than the engine call; only
+    # server errors are logged.
+    if handler.get_status() >= 500:
+        logger.error("%d %s %.1fms", handler.get_status(), handler.request.uri, 1000.0 * handler.request.request_time())
+
+def make_app(service):
+    args = {"service": service}
+    return tornado.web.Application([
+        (r"/sessions", SessionsHandler, args),
+        (r"/sessions/([\w-]+)/question", QuestionHandler, args),
+        (r"/sessions/([\w-]+)/answers", AnswersHandler, args),
+        (r"/sessions/([\w-]+)/results", ResultsHandler, args),
+    ], log_function=log_request)
+
+
+async def serve(args):
+    registry = BankRegistry(args.bank, load_bank).start()
+    result_store = ResultStore(args.results_db)
+    writer = None
+    if args.credentials:
+        writer = start_batch_writer(sheets_opener(args.credentials), outbox=result_store)
+    store = open_session_store(args.session_store, args.session_db)
+    service = TestService(registry, result_store, writer, start_response_log(), store=store)
+    MetricsExporter(port=args.metrics_port).start()
+    make_app(service).listen(args.port, args.host)
+    logger.info("Adaptive test API listening on %s:%d", args.host, args.port)
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        await service.blocking(service.sweep)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the adaptive test over a JSON API.")
+    parser.add_argument("--bank", default="edit.xlsx")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--results-db", default=RESULTS_DB_PATH)
+    parser.add_argument("--session-store", choices=["memory", "sqlite"], default="memory",
+                        help="sqlite shares in-flight tests with other processes using --session-db")
+    parser.add_argument("--session-db", default=SESSION_DB_PATH)
+    parser.add_argument("--credentials", help="service-account JSON; syncs results to the sheet from this process")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args))
@@ -1,44 +1,27 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import random
-import gspread
-from google.oauth2.service_account import Credentials
-from datetime import datetime
 import numpy as np
-
-# ==============================================================================
-# 0. General Settings and Constants
-# ==============================================================================
-GOOGLE_SHEET_ID = "1dzXIAD7xYUX_QM37flfqQTetaui-vycwANgvIzsOoaY"
-MAX_QUESTIONS = 15
-CHOICES = ["لا أوافق إطلاقًا", "أوافق إلى حد ما", "أوافق", "أوافق بشدة"]
-CHOICE_VALUES = [1, 2, 3, 4]
-
-# Trait Definitions
-TRAITS = [
-    "الانبساط (ذاتي)",
-    "العصبية (ذاتي)",
-    "التوافق (ذاتي)",
-    "الضمير (ذاتي)",
-    "الانفتاح (ذاتي)"
-]
-
-TRAIT_DESCRIPTIONS = {
-    "الانبساط (ذاتي)": "يقيس الانبساط مدى تفاعلك مع العالم الخارجي. الأشخاص ذوو الدرجات العالية يميلون إلى أن يكونوا اجتماعيين ونشيطين ومتحمسين.",
-    "العصبية (ذاتي)": "تشير العصبية إلى مدى استقرارك العاطفي. الأشخاص ذوو الدرجات العالية قد يكونون أكثر عرضة للقلق والتقلبات المزاجية.",
-    "التوافق (ذاتي)": "يعكس التوافق مدى ميلك للتعاون والتعاطف. الأشخاص ذوو الدرجات العالية يكونون عادةً طيبين ومتعاونين وجديرين بالثقة.",
-    "الضمير (ذاتي)": "يقيس الضمير مدى تنظيمك ومسؤوليتك. الأشخاص ذوو الدرجات العالية يتميزون بالاجتهاد والانضباط والتخطيط.",
-    "الانفتاح (ذاتي)": "يشير الانفتاح إلى مدى اهتمامك بالتجارب الجديدة والأفكار الإبداعية. الأشخاص ذوو الدرجات العالية فضوليون ومبتكرون ومتقبلون للتغيير."
-}
-
-TRAIT_COLORS = {
-    "الانبساط (ذاتي)": '#FFD700',
-    "العصبية (ذاتي)": '#FF6347',
-    "التوافق (ذاتي)": '#3CB371',
-    "الضمير (ذاتي)": '#4169E1',
-    "الانفتاح (ذاتي)": '#9370DB'
-}
+from streamlit.errors import StreamlitAPIException
+from bank_registry import BankRegistry
+from shared_bank import load_shared_bank
+from result_store import RESULTS_DB_PATH, ResultStore
+from routing import start_routing_build
+from sheets_writer import start_batch_writer
+from response_log import start_response_log
+from norms import NormsService
+from adaptive_engine import build_item_bank, get_next_question_logic, restore_test, should_stop, start_test, submit_answer
+from results import RESULT_HEADERS, build_result_row, calculate_results
+from session_record import LIVE_SESSIONS, SessionRecord
+from session_store import open_session_store, start_session_sweeper
+from metrics import MetricsExporter, SamplingProfiler, external_call, external_failure, gauge, timed, timer
+from warmup import start_warmup
+from settings import (
+    GOOGLE_SHEET_ID, MAX_QUESTIONS, CHOICES, CHOICE_VALUES, TRAITS, TRAIT_DESCRIPTIONS, TRAIT_COLORS,
+    WARMUP_HEAVY_IMPORTS, REPORT_CACHE_SIZE, METRICS_FILE, METRICS_PORT, PROFILE_FILE, SESSION_STORE
+)
+# plotly, gspread and google.oauth2 are imported where they are used, so a
+# cold start reaches the onboarding form without loading them.
 
 # ==============================================================================
 # 1. Data Management and External Services Functions
@@ -51,6 +34,9 @@ def get_google_sheets_client():
     if _sheets_client is not None:
         return _sheets_client
     try:
+        external_call("sheets", "authorize")
+        import gspread
+        from google.oauth2.service_account import Credentials
         scope = [
             'https://spreadsheets.google.com/feeds',
             'https://www.googleapis.com/auth/drive'
@@ -64,124 +50,138 @@ def get_google_sheets_client():
         _sheets_client = client
         return client
     except Exception as e:
+        external_failure("sheets", "authorize")
         st.error(f"❌ خطأ أثناء الاتصال بـ Google Sheets: {e}")
         return None
 
+@timed
 def setup_google_sheet(sheet_id):
     client = get_google_sheets_client()
     if not client:
         return None
     try:
+        external_call("sheets", "open")
         sheet = client.open_by_key(sheet_id).sheet1
-        if not sheet.get_all_values():
-            headers = ['Timestamp', 'الاسم', 'السن', 'العنوان', 'السمة الأساسية'] + [f"درجة {trait}" for trait in TRAITS] + ["الدرجة العليا"]
-            sheet.append_row(headers)
+        # Only the header row is read, so the check costs the same however many results the sheet holds.
+        if not sheet.row_values(1):
+            sheet.append_row(RESULT_HEADERS)
         return sheet
     except Exception as e:
+        external_failure("sheets", "open")
         st.error(f"❌ خطأ في فتح أو إعداد Google Sheet: {e}")
         return None
 
+@st.cache_resource
+def get_results_worksheet(sheet_id):
+    # Worksheet handle with verified headers, shared by the whole process.
+    # Failures raise so they are not cached; the writer clears the cache when
+    # a write fails and the next batch re-opens and re-checks the sheet.
+    sheet = setup_google_sheet(sheet_id)
+    if sheet is None:
+        raise ConnectionError("Google Sheet is not available.")
+    return sheet
+
+@st.cache_resource
+def get_result_store():
+    return ResultStore(RESULTS_DB_PATH)
+
+@st.cache_resource
+def get_results_writer():
+    # One background writer per process: rows are committed to the local
+    # result store first and synced to the sheet in bulk with append_rows.
+    writer = start_batch_writer(
+        lambda: get_results_worksheet(GOOGLE_SHEET_ID),
+        outbox=get_result_store(),
+        on_write_error=get_results_worksheet.clear
+    )
+    gauge("sheets_queue_depth", writer.pending)
+    return writer
+
+@st.cache_resource
+def get_response_log():
+    # Item-level answers for calibration, buffered in memory and flushed to
+    # part files in the background; see response_log.py.
+    response_log = start_response_log()
+    gauge("response_log_buffered_rows", response_log.buffered)
+    return response_log
+
+@st.cache_resource
+def get_session_store():
+    # In-flight tests by token, so a reconnect or another replica can resume
+    # them; idle ones expire in the background.
+    store = open_session_store(SESSION_STORE)
+    start_session_sweeper(store)
+    gauge("stored_sessions", lambda: len(store))
+    return store
+
+@st.cache_resource
+def get_norms_service():
+    # Population percentiles, refreshed from the sheet in the background;
+    # requests only read the latest snapshot.
+    service = NormsService(
+        lambda: get_results_worksheet(GOOGLE_SHEET_ID),
+        on_read_error=get_results_worksheet.clear
+    ).start()
+    gauge("norms_rows", lambda: service.snapshot().rows_read)
+    return service
+
 def save_results_to_gsheets(user_data, results, dominant_trait):
-    sheet = setup_google_sheet(GOOGLE_SHEET_ID)
-    if not sheet:
-        return False
     try:
-        max_score = max(results.values()) if results else 0.0
-        row = [
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            user_data.get('name', 'N/A'),
-            user_data.get('age', 'N/A'),
-            user_data.get('location', 'N/A'),
-            dominant_trait
-        ] + [f"{results.get(trait, 0.0):.2f}" for trait in TRAITS] + [f"{max_score:.2f}"]
-        sheet.append_row(row)
+        get_results_writer().submit(build_result_row(user_data, results, dominant_trait))
         return True
     except Exception as e:
         st.error(f"❌ فشل في حفظ النتائج: {e}")
         return False
 
-@st.cache_data
+@timed
 def load_questions_data(file_path="edit.xlsx"):
-    try:
-        df = pd.read_excel(file_path)
-        df = df[df["generated_question"].notnull()]
-        if "السمة" not in df.columns:
-            raise ValueError("ملف الأسئلة يجب أن يحتوي على عمود 'السمة'.")
-        if 'a' not in df.columns:
-            df['a'] = 1.0
-        if 'b' not in df.columns:
-            df['b'] = 0.0
-        if 'c' not in df.columns:
-            df['c'] = 0.0
-        if 'd' not in df.columns:
-            df['d'] = 0.0
-        return df
-    except FileNotFoundError:
-        st.error(f"❌ ملف '{file_path}' غير موجود.")
-        return pd.DataFrame()
-    except Exception as e:
-        st.error(f"❌ خطأ أثناء تحميل الأسئلة: {e}")
-        return pd.DataFrame()
-
-def get_next_question_logic(questions_df, session_state):
-    asked_ids = session_state.get("asked_ids", set())
-    last_trait = session_state.get("last_question_trait")
-    last_score = session_state.get("last_score")
-    remaining_questions = questions_df[~questions_df.index.isin(asked_ids)]
-    if remaining_questions.empty:
-        return None, "تم الانتهاء من جميع الأسئلة المتاحة."
-    q = None
-    if session_state["question_count"] == 0:
-        q = remaining_questions.sample(1).iloc[0]
-    else:
-        if last_score in [2, 3] and last_trait:
-            trait_specific_remaining = remaining_questions[remaining_questions["السمة"] == last_trait]
-            if not trait_specific_remaining.empty:
-                q = trait_specific_remaining.sample(1).iloc[0]
-        if q is None:
-            answered_traits_keys = session_state.get("answered_traits", {}).keys()
-            new_trait_questions = remaining_questions[~remaining_questions["السمة"].isin(answered_traits_keys)]
-            if not new_trait_questions.empty:
-                q = new_trait_questions.sample(1).iloc[0]
-            else:
-                q = remaining_questions.sample(1).iloc[0]
-    if q is None:
-        q = remaining_questions.sample(1).iloc[0]
-    session_state["current_question_id"] = q.name
-    session_state["current_question_text"] = q["generated_question"]
-    session_state["current_question_trait"] = q["السمة"]
-    session_state["asked_ids"].add(q.name)
-    return q["generated_question"], None
+    # Attaches to (or builds) the shared memory-mapped item bank, whose routing
+    # table for the first questions follows in the background; the registry
+    # calls it again from its watcher thread whenever the spreadsheet changes.
+    bank = load_shared_bank(file_path, TRAITS)
+    start_routing_build(bank, max_questions=MAX_QUESTIONS)
+    return bank
+
+@st.cache_resource
+def start_import_warmup():
+    # Once per process; see warmup.py.
+    return start_warmup()
+
+@st.cache_resource
+def start_metrics():
+    # Once per process: the exporter, the session gauges and, if configured,
+    # the sampling profiler.
+    gauge("active_sessions", lambda: len(LIVE_SESSIONS))
+    gauge("tests_in_progress", lambda: sum(1 for record in list(LIVE_SESSIONS) if record.test_started))
+    exporter = MetricsExporter(METRICS_FILE, METRICS_PORT).start()
+    profiler = SamplingProfiler(PROFILE_FILE).start() if PROFILE_FILE else None
+    return exporter, profiler
+
+@st.cache_resource
+def get_bank_registry(file_path="edit.xlsx"):
+    return BankRegistry(file_path, load_questions_data).start()
 
 # ==============================================================================
 # 2. Report Generation Functions
 # ==============================================================================
-def calculate_results(answered_traits, user_info):
-    trait_scores = {}
-    for trait, scores in answered_traits.items():
-        trait_scores[trait] = sum(scores) / len(scores) if scores else 0.0
-    dominant_trait = max(trait_scores, key=trait_scores.get) if trait_scores else "غير محدد"
-    dominant_score = trait_scores.get(dominant_trait, 0.0)
-    summary_for_save = {
-        "name": user_info.get("name", ""),
-        "age": user_info.get("age", ""),
-        "location": user_info.get("location", ""),
-        "test_date": user_info.get("test_date", "")
-    }
-    for trait in TRAITS:
-        summary_for_save[f"درجة {trait}"] = round(trait_scores.get(trait, 0.0), 2)
-    return trait_scores, dominant_trait, dominant_score, summary_for_save
+def score_key(results, traits):
+    # Rounded score vector used as the cache key of a result's report pieces.
+    return tuple(round(results.get(trait, 0.0), 2) for trait in traits)
 
-def generate_report(results, traits, trait_colors, user_info):
+@st.cache_resource(max_entries=REPORT_CACHE_SIZE)
+def build_report_figure(traits, scores, trait_colors, display_name):
+    # Building a plotly figure takes tens of milliseconds; results pages that
+    # rerun or are revisited reuse it from this bounded LRU cache.
+    import plotly.express as px
     df = pd.DataFrame({
         'السمة': [trait.replace(" (ذاتي)", "") for trait in traits],
-        'الدرجة': [results.get(trait, 0.0) for trait in traits]
+        'الدرجة': list(scores)
     })
     fig = px.bar(
         df,
         x='السمة',
         y='الدرجة',
-        title=f'نتائج سمات الشخصية لـ {user_info.get("name", "المستخدم")}',
+        title=f'نتائج سمات الشخصية لـ {display_name}',
         labels={'السمة': 'السمة', 'الدرجة': 'الدرجة'},
         color='السمة',
         color_discrete_map=trait_colors,
@@ -192,101 +192,154 @@ def generate_report(results, traits, trait_colors, user_info):
         font=dict(color='#FAFAFA'),
         showlegend=False
     )
+    return fig
+
+@timed
+def generate_report(results, traits, trait_colors, user_info):
+    fig = build_report_figure(
+        tuple(traits), score_key(results, traits), trait_colors, user_info.get("name", "المستخدم")
+    )
     st.plotly_chart(fig, use_container_width=True)
 
+@st.cache_resource(max_entries=REPORT_CACHE_SIZE)
+def build_trait_rows(scores):
+    # Label, bar fraction and description HTML for each trait's progress bar,
+    # computed once per result.
+    rows = []
+    for trait, score in zip(TRAITS, scores):
+        percentage = (score / 4) * 100  # Convert score (1-4) to percentage (0-100)
+        color = TRAIT_COLORS[trait]
+        rows.append((
+            f'<div class="progress-label" style="color: {color};">{trait.replace(" (ذاتي)", "")}: {score:.2f}</div>',
+            percentage / 100,
+            f'<div class="trait-description">{TRAIT_DESCRIPTIONS[trait]}</div>'
+        ))
+    return tuple(rows)
+
 # ==============================================================================
 # 3. Session State Initialization
 # ==============================================================================
-if 'page' not in st.session_state:
-    st.session_state.page = 'onboarding'
-if 'user_info' not in st.session_state:
-    st.session_state.user_info = {}
-if 'answered_traits' not in st.session_state:
-    st.session_state.answered_traits = {}
-if 'current_question_id' not in st.session_state:
-    st.session_state.current_question_id = None
-if 'current_question_text' not in st.session_state:
-    st.session_state.current_question_text = ""
-if 'current_question_trait' not in st.session_state:
-    st.session_state.current_question_trait = ""
-if 'asked_ids' not in st.session_state:
-    st.session_state.asked_ids = set()
-if 'question_count' not in st.session_state:
-    st.session_state.question_count = 0
-if 'test_started' not in st.session_state:
-    st.session_state.test_started = False
-if 'user_registered' not in st.session_state:
-    st.session_state.user_registered = False
-if 'last_score' not in st.session_state:
-    st.session_state.last_score = None
-if 'show_results_page' not in st.session_state:
-    st.session_state.show_results_page = False
-if 'registration_status' not in st.session_state:
-    st.session_state.registration_status = ""
-if 'results_saved_to_sheets' not in st.session_state:
-    st.session_state.results_saved_to_sheets = False
+# One fixed-size record per session (see session_record.py) instead of a
+# key per field; widget keys are the only other session_state entries. A
+# new session first looks for a stored test under the ?session= token.
+def load_session():
+    token = st.query_params.get("session")
+    stored = get_session_store().load(token) if token else None
+    return stored if stored is not None else SessionRecord(MAX_QUESTIONS)
+
+def persist_session():
+    # Called before every rerun that changes the record; only the new answers
+    # are written (see session_store.py).
+    get_session_store().save(session.token, session)
+    st.query_params["session"] = session.token
+
+start_metrics()
+if 'test' not in st.session_state:
+    st.session_state.test = load_session()
+session = st.session_state.test
 
 # ==============================================================================
 # 4. Load Questions Data
 # ==============================================================================
-QUESTIONS_DF = load_questions_data("edit.xlsx")
+try:
+    BANK_REGISTRY = get_bank_registry("edit.xlsx")
+except FileNotFoundError:
+    st.error("❌ ملف 'edit.xlsx' غير موجود.")
+    BANK_REGISTRY = None
+except Exception as e:
+    st.error(f"❌ خطأ أثناء تحميل الأسئلة: {e}")
+    BANK_REGISTRY = None
+
+def get_session_item_bank():
+    # A test in progress keeps the bank it started with, found by content so
+    # a session stored by another process resumes only on the same items;
+    # everyone else gets the newest one.
+    if BANK_REGISTRY is None:
+        return None, build_item_bank(pd.DataFrame(), TRAITS)
+    if session.bank_fingerprint is not None:
+        found = BANK_REGISTRY.find(session.bank_fingerprint)
+        if found is not None:
+            session.bank_version = found[0]
+            return found
+        session.bank_version = None
+        session.bank_fingerprint = None
+        if session.test_started:
+            session.test_started = False
+            st.warning("⚠️ تم تحديث بنك الأسئلة، يرجى بدء الاختبار من جديد.")
+    return BANK_REGISTRY.current()
+
+ITEM_BANK_VERSION, ITEM_BANK = get_session_item_bank()
+if session.log_posterior is None and (session.test_started or session.question_count):
+    # A stored session: rebuild its scores from the answers, if its bank
+    # is still live; otherwise it has to start over. (A finished test is
+    # stored with its scores and never gets here.)
+    if session.bank_fingerprint == ITEM_BANK.fingerprint:
+        restore_test(ITEM_BANK, session)
+    else:
+        if session.page == 'results':
+            st.warning("⚠️ انتهت صلاحية نتائج هذا الاختبار بعد تحديث بنك الأسئلة، يرجى إعادة الاختبار.")
+        session.question_count = 0
+        session.page = 'test' if session.user_registered else 'onboarding'
 
 # ==============================================================================
 # 5. Application Logic Processing Functions
 # ==============================================================================
 def register_user_callback(name, age, location):
-    if not name or not age or not location:
-        st.session_state.registration_status = "❌ يرجى ملء جميع الحقول."
-        st.session_state.user_registered = False
-        st.rerun()
-        return
-    if age < 13 or age > 120:
-        st.session_state.registration_status = "❌ يرجى إدخال عمر صحيح (13-120)."
-        st.session_state.user_registered = False
+    error = session.register(name, age, location)
+    if error:
+        session.registration_status = error
+        session.user_registered = False
         st.rerun()
         return
-    st.session_state.user_info = {
-        "name": name,
-        "age": age,
-        "location": location,
-        "test_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    st.session_state.user_registered = True
-    st.session_state.registration_status = f"✅ تم تسجيل المستخدم: {name}"
-    st.session_state.page = 'test'
+    session.registration_status = f"✅ تم تسجيل المستخدم: {name}"
+    session.page = 'test'
+    persist_session()
     st.rerun()
 
+def rerun_question_loop():
+    # Fragment-scoped reruns are only allowed when the fragment itself was
+    # rerun; a full-script run that reaches the form (e.g. AppTest) reruns
+    # the whole app instead.
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
 def submit_answer_callback(answer_selected):
-    if st.session_state.current_question_id is None or not st.session_state.test_started:
+    # Runs inside the question-loop fragment: moving to the next question only
+    # reruns the fragment, leaving the test page is a full app rerun.
+    if session.current_item < 0 or not session.test_started:
         st.warning("❌ لا يوجد سؤال حالي أو الاختبار لم يبدأ.")
         st.rerun()
         return
     if answer_selected not in CHOICES:
         st.warning("يرجى اختيار إجابة صحيحة.")
-        st.rerun()
+        rerun_question_loop()
         return
-    trait = st.session_state.current_question_trait
     score = CHOICE_VALUES[CHOICES.index(answer_selected)]
-    if trait not in st.session_state.answered_traits:
-        st.session_state.answered_traits[trait] = []
-    st.session_state.answered_traits[trait].append(score)
-    st.session_state.last_score = score
-    st.session_state.question_count += 1
-    if st.session_state.question_count >= MAX_QUESTIONS:
-        st.session_state.test_started = False
-        st.session_state.show_results_page = True
-        st.session_state.page = 'results'
-        st.rerun()
-    else:
-        question_text, error_message = get_next_question_logic(QUESTIONS_DF, st.session_state)
-        if error_message:
-            st.error(error_message)
-        st.rerun()
+    pos = session.current_item
+    submit_answer(ITEM_BANK, session, score)
+    get_response_log().record_answer(session, ITEM_BANK, pos)
+    if not should_stop(ITEM_BANK, session):
+        with timer("get_next_question_logic"):
+            question_text, error_message = get_next_question_logic(ITEM_BANK, session)
+        if not error_message:
+            persist_session()
+            rerun_question_loop()
+            return
+        st.error(error_message)
+    # The stopping rule ended the test (or the bank ran out): show the results.
+    session.test_started = False
+    session.page = 'results'
+    persist_session()
+    st.rerun()
 
 def reset_test_callback():
+    get_session_store().delete(session.token)
+    st.query_params.pop("session", None)
     for key in list(st.session_state.keys()):
         del st.session_state[key]
-    st.session_state.page = 'onboarding'
+    st.session_state.test = SessionRecord(MAX_QUESTIONS)
     st.rerun()
 
 # ==============================================================================
@@ -494,8 +547,24 @@ st.sidebar.markdown("""
 if st.sidebar.button("بدء اختبار جديد", key="nav_start_test"):
     reset_test_callback()
 
+# The question loop is a fragment: answering re-executes and re-sends only
+# this region instead of the whole script (CSS, sidebar, page branches).
+@st.fragment
+def question_loop():
+    progress_percentage = session.question_count / MAX_QUESTIONS
+    st.progress(progress_percentage, text=f"التقدم: {session.question_count} / {MAX_QUESTIONS} سؤال")
+    with st.container():
+        st.markdown(f"<h2>السؤال {session.question_count + 1}</h2>", unsafe_allow_html=True)
+        st.markdown(f'<div class="question-box">{ITEM_BANK.questions[session.current_item]}</div>', unsafe_allow_html=True)
+        with st.form("question_form"):
+            color = TRAIT_COLORS.get(ITEM_BANK.traits[ITEM_BANK.trait_codes[session.current_item]], '#00B3B3')
+            st.markdown(f'<div class="dynamic-label" style="color: {color};">اختر إجابتك:</div>', unsafe_allow_html=True)
+            answer = st.radio("", CHOICES, key=f"q_{session.question_count}", index=None, format_func=lambda x: x)
+            if st.form_submit_button("السؤال التالي"):
+                submit_answer_callback(answer)
+
 # Page Logic
-if st.session_state.page == 'onboarding':
+if session.page == 'onboarding':
     st.markdown("""
     <div class="brain-icon-container">
         🧠
@@ -513,88 +582,82 @@ if st.session_state.page == 'onboarding':
             submitted = st.form_submit_button("تسجيل المعلومات")
             if submitted:
                 register_user_callback(name, age, location)
-    if st.session_state.registration_status:
-        if "✅" in st.session_state.registration_status:
-            st.success(st.session_state.registration_status)
+    if session.registration_status:
+        if "✅" in session.registration_status:
+            st.success(session.registration_status)
         else:
-            st.error(st.session_state.registration_status)
+            st.error(session.registration_status)
 
-elif st.session_state.page == 'test':
+elif session.page == 'test':
     st.markdown("<h1 style='text-align: center;'>اختبار الشخصية</h1>", unsafe_allow_html=True)
-    if QUESTIONS_DF.empty:
+    if ITEM_BANK.size == 0:
         st.error("❌ لا توجد أسئلة متاحة في ملف 'edit.xlsx'. تأكد من وجود الملف وأنه يحتوي على الأعمدة الصحيحة.")
         st.stop()
     
-    if not st.session_state.test_started:
+    if not session.test_started:
         st.markdown("### يمكنك الآن بدء الاختبار!")
         if st.button("ابدأ الاختبار", key="start_test_button"):
-            if not st.session_state.user_registered:
-                st.session_state.registration_status = "❌ يرجى تسجيل معلوماتك أولاً."
+            if not session.user_registered:
+                session.registration_status = "❌ يرجى تسجيل معلوماتك أولاً."
                 st.rerun()
             else:
-                st.session_state.answered_traits = {}
-                st.session_state.asked_ids = set()
-                st.session_state.question_count = 0
-                st.session_state.last_score = None
-                st.session_state.test_started = True
-                st.session_state.show_results_page = False
-                question_text, error_message = get_next_question_logic(QUESTIONS_DF, st.session_state)
+                start_test(ITEM_BANK, session, ITEM_BANK_VERSION)
+                session.test_started = True
+                with timer("get_next_question_logic"):
+                    question_text, error_message = get_next_question_logic(ITEM_BANK, session)
                 if error_message:
                     st.error(error_message)
-                    st.session_state.test_started = False
-                else:
-                    st.session_state.current_question_text = question_text
+                    session.test_started = False
+                persist_session()
                 st.rerun()
     else:
-        progress_percentage = st.session_state.question_count / MAX_QUESTIONS
-        st.progress(progress_percentage, text=f"التقدم: {st.session_state.question_count} / {MAX_QUESTIONS} سؤال")
-        with st.container():
-            st.markdown(f"<h2>السؤال {st.session_state.question_count + 1}</h2>", unsafe_allow_html=True)
-            st.markdown(f'<div class="question-box">{st.session_state.current_question_text}</div>', unsafe_allow_html=True)
-            with st.form("question_form"):
-                color = TRAIT_COLORS.get(st.session_state.current_question_trait, '#00B3B3')
-                st.markdown(f'<div class="dynamic-label" style="color: {color};">اختر إجابتك:</div>', unsafe_allow_html=True)
-                answer = st.radio("", CHOICES, key=f"q_{st.session_state.question_count}", index=None, format_func=lambda x: x)
-                if st.form_submit_button("السؤال التالي"):
-                    submit_answer_callback(answer)
-
-elif st.session_state.page == 'results':
+        question_loop()
+
+elif session.page == 'results':
     st.markdown("<h1 style='text-align: center;'>نتائج اختبار الشخصية</h1>", unsafe_allow_html=True)
-    trait_scores, dominant_trait, dominant_score, summary_for_save = calculate_results(
-        st.session_state.answered_traits, st.session_state.user_info
-    )
+    with timer("calculate_results"):
+        # A finished test whose bank was replaced keeps its stored scores;
+        # its trait codes start with TRAITS like every bank's.
+        traits = ITEM_BANK.traits if session.bank_fingerprint == ITEM_BANK.fingerprint else TRAITS
+        trait_scores, dominant_trait, dominant_score, summary_for_save = calculate_results(
+            session, session.user_info, traits
+        )
     with st.container():
-        st.markdown(f"<h3 style='color: #FAFAFA;'>مرحباً، {st.session_state.user_info.get('name', 'المستخدم')}!</h3>", unsafe_allow_html=True)
-        st.write(f"السن: **{st.session_state.user_info.get('age', 'N/A')}** | العنوان: **{st.session_state.user_info.get('location', 'N/A')}**")
+        st.markdown(f"<h3 style='color: #FAFAFA;'>مرحباً، {session.user_info.get('name', 'المستخدم')}!</h3>", unsafe_allow_html=True)
+        st.write(f"السن: **{session.user_info.get('age', 'N/A')}** | العنوان: **{session.user_info.get('location', 'N/A')}**")
         st.markdown("<p style='font-size: 1.1em; color: #FAFAFA;'>إليك ملخص لسماتك الشخصية بناءً على إجاباتك:</p>", unsafe_allow_html=True)
-    generate_report(trait_scores, TRAITS, TRAIT_COLORS, st.session_state.user_info)
+    generate_report(trait_scores, TRAITS, TRAIT_COLORS, session.user_info)
     
     # Display progress bars for each trait with bordered containers and descriptions
     st.markdown("### درجات السمات الفردية")
-    for trait in TRAITS:
-        score = trait_scores.get(trait, 0.0)
-        percentage = (score / 4) * 100  # Convert score (1-4) to percentage (0-100)
-        color = TRAIT_COLORS[trait]
-        description = TRAIT_DESCRIPTIONS[trait]
+    scores = score_key(trait_scores, TRAITS)
+    norms = get_norms_service().snapshot()
+    for trait_index, (label_html, fraction, description_html) in enumerate(build_trait_rows(scores)):
+        percentile = None
+        if scores[trait_index]:
+            percentile = norms.percentile(trait_index, scores[trait_index], session.user_info.get('age'))
         with st.container():
             st.markdown(f'<div class="trait-container">', unsafe_allow_html=True)
-            st.markdown(
-                f'<div class="progress-label" style="color: {color};">{trait.replace(" (ذاتي)", "")}: {score:.2f}</div>',
-                unsafe_allow_html=True
-            )
-            st.progress(percentage / 100)
-            st.markdown(
-                f'<div class="trait-description">{description}</div>',
-                unsafe_allow_html=True
-            )
+            st.markdown(label_html, unsafe_allow_html=True)
+            st.progress(fraction)
+            if percentile is not None:
+                st.caption(f"درجتك أعلى من {percentile:.0f}% من المشاركين")
+            st.markdown(description_html, unsafe_allow_html=True)
             st.markdown('</div>', unsafe_allow_html=True)
     
     # Display the dominant trait with its score
     st.markdown("### السمة الأساسية")
     st.write(f"بناءً على أعلى درجة، سمة الشخصية الأساسية لك هي: **{dominant_trait.replace(' (ذاتي)', '')}** بدرجة **{dominant_score:.2f}**.")
 
-    if not st.session_state.results_saved_to_sheets:
-        save_results_to_gsheets(st.session_state.user_info, trait_scores, dominant_trait)
-        st.session_state.results_saved_to_sheets = True
+    if not session.results_saved:
+        session.results_saved = save_results_to_gsheets(
+            session.user_info, trait_scores, dominant_trait
+        )
+        if session.results_saved:
+            persist_session()
     if st.button("إعادة تعيين الاختبار", key="reset_test_btn"):
         reset_test_callback()
+
+# Runs after the page above has been sent, so it never delays the first paint.
+if WARMUP_HEAVY_IMPORTS:
+    start_import_warmup()
@@ -0,0 +1,24 @@
+import contextlib
+import os
+import tempfile
+
+# ==============================================================================
+# Atomic File Replacement
+# ==============================================================================
+# Files that other processes read while they are being regenerated are
+# written to a temporary file in the target's directory and renamed over it.
+# Readers see either the old file or the complete new one, never a partial
+# write; on any error the temporary file is removed and the target is left
+# untouched.
+
+@contextlib.contextmanager
+def atomic_write(path, mode="wb", encoding=None):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Versioned Question-Bank Registry
+# ==============================================================================
+# Holds the live item bank plus a few older versions. A daemon thread polls
+# the source file and, when it changes, builds the next version off the
+# request path and swaps it in atomically. Sessions pin the version they
+# started with, so their item positions stay valid until they finish. Only
+# the newest MAX_LIVE_VERSIONS are kept, so memory stays bounded.
+MAX_LIVE_VERSIONS = 3
+POLL_INTERVAL_SECONDS = 5.0
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class BankRegistry:
+    def __init__(self, source, build, max_versions=MAX_LIVE_VERSIONS, poll_interval=POLL_INTERVAL_SECONDS):
+        self.source = source
+        self.build = build
+        self.max_versions = max_versions
+        self.poll_interval = poll_interval
+        self._versions = OrderedDict()
+        self._current = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file_state = _file_state(source)
+        self._publish(build(source))
+
+    @property
+    def current_version(self):
+        return self._current
+
+    def current(self):
+        with self._lock:
+            return self._current, self._versions[self._current]
+
+    def get(self, version):
+        # None once the version has been evicted.
+        with self._lock:
+            return self._versions.get(version)
+
+    def find(self, fingerprint):
+        # (version, bank) of the live bank with this content, or None.
+        with self._lock:
+            for version, bank in reversed(self._versions.items()):
+                if bank.fingerprint == fingerprint:
+                    return version, bank
+        return None
+
+    def live_versions(self):
+        with self._lock:
+            return list(self._versions)
+
+    def _publish(self, bank):
+        with self._lock:
+            version = self._current + 1
+            self._versions[version] = bank
+            self._current = version
+            while len(self._versions) > self.max_versions:
+                self._versions.popitem(last=False)
+        return version
+
+    def reload(self):
+        with self._reload_lock:
+            self._file_state = _file_state(self.source)
+            return self._publish(self.build(self.source))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="bank-registry-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            state = _file_state(self.source)
+            if state is None or state == self._file_state:
+                continue
+            try:
+                version = self.reload()
+                logger.info("Question bank %s reloaded as version %d", self.source, version)
+            except Exception as e:
+                # Keep serving the current version; the next edit triggers another attempt.
+                logger.error("Question bank reload failed, keeping version %d: %s", self._current, e)
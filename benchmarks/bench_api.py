@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench_rerun_payload import free_port, server_cpu_seconds
+
+# ==============================================================================
+# Throughput of the headless JSON API (api.py). Starts the server in its own
+# process with a throwaway result store and response log, then keeps
+# --concurrency keep-alive HTTP/1.1 connections each taking whole tests
+# (start, answer until done, results). Reports requests per second, latency
+# percentiles per endpoint and the server's CPU time per request.
+# Usage: python benchmarks/bench_api.py [--tests 500] [--concurrency 32] [--output report.json]
+# ==============================================================================
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+        )
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length)) if length else None
+
+
+async def take_test(conn, rng, latencies):
+    async def call(kind, method, path, payload=None):
+        start = time.perf_counter()
+        status, body = await conn.request(method, path, payload)
+        latencies.setdefault(kind, []).append(time.perf_counter() - start)
+        if status >= 400:
+            raise RuntimeError(f"{method} {path} -> {status}: {body}")
+        return body
+    created = await call("start", "POST", "/sessions", {"name": "bench", "age": 30, "location": "bench"})
+    token, question = created["session"], created["question"]
+    while not question["done"]:
+        question = await call("answer", "POST", f"/sessions/{token}/answers",
+                              {"item": question["item"], "answer": int(rng.integers(1, 5))})
+    await call("results", "GET", f"/sessions/{token}/results")
+
+
+async def run(port, tests, concurrency, seed):
+    rng = np.random.default_rng(seed)
+    latencies = {}
+    queue = asyncio.Queue()
+    for _ in range(tests):
+        queue.put_nowait(None)
+
+    async def worker():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        conn = Connection(reader, writer)
+        while not queue.empty():
+            queue.get_nowait()
+            await take_test(conn, rng, latencies)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+def wait_ready(port, server):
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("api server exited")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/sessions/none/question", timeout=1)
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("api server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bank", default="edit.xlsx")
+    parser.add_argument("--tests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "api.py"), "--bank", os.path.join(ROOT, args.bank),
+             "--port", str(port), "--host", "127.0.0.1", "--results-db", os.path.join(workdir, "results.db")],
+            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_ready(port, server)
+            cpu = server_cpu_seconds(server.pid)
+            seconds, latencies = asyncio.run(run(port, args.tests, args.concurrency, args.seed))
+            cpu = server_cpu_seconds(server.pid) - cpu
+        finally:
+            server.terminate()
+            server.wait()
+
+    requests = sum(len(samples) for samples in latencies.values())
+    report = {
+        "tests": args.tests,
+        "concurrency": args.concurrency,
+        "requests": requests,
+        "requests_per_second": round(requests / seconds, 1),
+        "server_cpu_us_per_request": round(cpu / requests * 1e6, 1),
+        "latency_ms": {
+            kind: {
+                "p50": round(float(np.percentile(samples, 50)) * 1e3, 2),
+                "p99": round(float(np.percentile(samples, 99)) * 1e3, 2),
+            }
+            for kind, samples in latencies.items()
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
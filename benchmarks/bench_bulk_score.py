@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from adaptive_engine import category_probabilities
+from bulk_score import score_file
+from settings import TRAITS
+from shared_bank import load_shared_bank
+
+# ==============================================================================
+# Throughput of the bulk scoring command (bulk_score.py). A paper form of
+# --items items drawn from the bank (spread over the traits) is answered by
+# simulated respondents with a N(0, 1) theta per trait; the responses are
+# written to a CSV and scored with trait means only and with --theta, and
+# the report gives the wall time, respondents per second and the
+# correlation of the estimated theta with the true one.
+# Usage: python benchmarks/bench_bulk_score.py [--respondents 1000000] [--items 60] [--workers 4]
+#        [--output report.json]
+# ==============================================================================
+
+
+def simulate_form(bank, num_respondents, num_items, rng):
+    positions = np.sort(rng.choice(bank.size, size=num_items, replace=False))
+    thetas = rng.normal(size=(num_respondents, bank.num_traits))
+    answers = np.empty((num_respondents, num_items), dtype=np.uint8)
+    for j, pos in enumerate(positions):
+        probs, _ = category_probabilities(bank.params[:, [pos]], thetas[:, bank.trait_codes[pos]][:, None])
+        cumulative = np.cumsum(probs[:, :, 0] / probs[:, :, 0].sum(axis=0), axis=0)
+        answers[:, j] = 1 + (rng.random(num_respondents) > cumulative[:-1]).sum(axis=0)
+    return positions, answers, thetas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--respondents", type=int, default=1_000_000)
+    parser.add_argument("--items", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    bank = load_shared_bank(os.path.join(ROOT, "edit.xlsx"), TRAITS)
+    positions, answers, thetas = simulate_form(bank, args.respondents, args.items, rng)
+    report = {"respondents": args.respondents, "items": args.items, "workers": args.workers}
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "responses.csv")
+        frame = pd.DataFrame(answers, columns=[str(label) for label in bank.labels[positions]])
+        frame.insert(0, "name", np.char.add("respondent ", np.arange(args.respondents).astype(str)))
+        frame.to_csv(source, index=False)
+        del frame
+        report["input_mib"] = round(os.path.getsize(source) / 2 ** 20, 1)
+        for mode, with_theta in (("means", False), ("theta", True)):
+            output = os.path.join(directory, f"scores-{mode}.csv")
+            start = time.perf_counter()
+            rows, _, _ = score_file(source, bank, output, with_theta, args.workers)
+            seconds = time.perf_counter() - start
+            report[mode] = {"seconds": round(seconds, 1), "respondents_per_second": round(rows / seconds)}
+            if with_theta:
+                scored = pd.read_csv(output, usecols=[f"ثيتا {trait}" for trait in TRAITS]).to_numpy()
+                asked = np.bincount(bank.trait_codes[positions], minlength=len(TRAITS))[:len(TRAITS)] > 0
+                report[mode]["theta_correlation"] = {
+                    trait: round(float(np.corrcoef(scored[:, code], thetas[:, code])[0, 1]), 3)
+                    for code, trait in enumerate(TRAITS) if asked[code]
+                }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
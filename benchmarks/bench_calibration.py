@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from adaptive_engine import PARAM_COLUMNS, TRAIT_COLUMN, category_probabilities
+from calibrate import calibrate, spool_responses
+from question_bank import PARAM_DEFAULTS
+from settings import MAX_QUESTIONS, TRAITS
+from bench_selection import make_questions_df
+
+# ==============================================================================
+# Parameter recovery and run time of the offline calibration (calibrate.py).
+# A synthetic bank with known a/b (and c/d with --fit abcd) answers as
+# simulated respondents: each session draws a N(0, 1) theta per trait and
+# answers MAX_QUESTIONS random items. The responses are spooled to disk like
+# the logged ones and calibration starts from the spreadsheet defaults; the
+# report gives the RMSE to the true parameters before and after, the spool
+# and calibration wall times and the peak RSS of the process.
+# Usage: python benchmarks/bench_calibration.py [--responses 1000000] [--bank-size 300] [--fit ab]
+#        [--workers 5] [--output report.json]
+# ==============================================================================
+
+
+def simulate_responses(questions_df, num_responses, rng):
+    # (item, category, session) arrays like a calibrate.logged_responses batch.
+    sessions = np.repeat(np.arange(num_responses // MAX_QUESTIONS, dtype=np.uint64), MAX_QUESTIONS)
+    items = rng.integers(len(questions_df), size=len(sessions)).astype(np.int32)
+    trait_codes = questions_df[TRAIT_COLUMN].map({t: i for i, t in enumerate(TRAITS)}).to_numpy()
+    thetas = rng.normal(size=(len(sessions) // MAX_QUESTIONS, len(TRAITS)))
+    theta = thetas[sessions.astype(np.intp), trait_codes[items]]
+    params = questions_df[PARAM_COLUMNS].to_numpy().T
+    probs, _ = category_probabilities(params[:, items], theta)
+    cumulative = np.cumsum(probs / probs.sum(axis=0), axis=0)
+    categories = (rng.random(len(items)) > cumulative[:-1]).sum(axis=0).astype(np.int8)
+    return items, categories, sessions
+
+
+def rmse(estimate, truth):
+    return {name: round(float(np.sqrt(np.mean((estimate[:, i] - truth[:, i]) ** 2))), 4)
+            for i, name in enumerate(PARAM_COLUMNS)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--responses", type=int, default=1_000_000)
+    parser.add_argument("--bank-size", type=int, default=300)
+    parser.add_argument("--fit", choices=["ab", "abcd"], default="ab")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    truth_df = make_questions_df(args.bank_size, args.seed, TRAITS)
+    if args.fit == "ab":
+        truth_df["c"] = 0.0
+        truth_df["d"] = 0.0
+    start = time.perf_counter()
+    items, categories, sessions = simulate_responses(truth_df, args.responses, rng)
+    simulate_seconds = time.perf_counter() - start
+
+    placeholder_df = truth_df.copy()
+    for column, default in PARAM_DEFAULTS.items():
+        placeholder_df[column] = default
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        responses = spool_responses(placeholder_df, [(items, categories, sessions)], len(items), directory)
+        spool_seconds = time.perf_counter() - start
+        del items, categories, sessions
+        start = time.perf_counter()
+        params, calibrated, reports = calibrate(placeholder_df, responses, args.fit, args.workers)
+        seconds = time.perf_counter() - start
+
+    truth = truth_df[PARAM_COLUMNS].to_numpy()
+    report = {
+        "responses": sum(data.num_responses for data in responses.values()),
+        "bank_size": args.bank_size,
+        "fit": args.fit,
+        "workers": args.workers,
+        "simulate_seconds": round(simulate_seconds, 2),
+        "spool_seconds": round(spool_seconds, 2),
+        "calibrate_seconds": round(seconds, 2),
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "calibrated_items": int(calibrated.sum()),
+        "rmse_placeholder": rmse(placeholder_df[PARAM_COLUMNS].to_numpy(), truth),
+        "rmse_calibrated": rmse(params, truth),
+        "traits": [{key: value for key, value in r.items() if key != "trait"} for r in reports],
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
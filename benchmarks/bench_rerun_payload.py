@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from tornado.websocket import websocket_connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ==============================================================================
+# Per-answer cost of the question loop against a real `streamlit run` server.
+# A minimal websocket client speaks the browser protocol (BackMsg/ForwardMsg,
+# including the browser's cache of large messages), registers, starts the
+# test and answers every question but the last. For each answer it records
+# the ForwardMsg bytes sent back (before websocket compression), the round
+# trip and the server process CPU time read from /proc. Run it against the
+# current app and an older copy to compare full-script with fragment reruns.
+# Usage: python benchmarks/bench_rerun_payload.py [--app app.py] [--sessions 5] [--output report.json]
+# ==============================================================================
+DONE_STATUSES = (
+    ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR,
+    ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+)
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app, "--server.headless", "true", "--server.port", str(port),
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("streamlit server did not start")
+
+
+def server_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+class BrowserClient:
+    def __init__(self, port):
+        self.url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        self.conn = None
+        self.cached_hashes = set()
+        self.widgets = {}
+
+    async def connect(self):
+        self.conn = await websocket_connect(self.url, subprotocols=["streamlit"])
+
+    async def rerun(self, widget_states=(), fragment_id=""):
+        msg = BackMsg()
+        msg.rerun_script.fragment_id = fragment_id
+        msg.rerun_script.cached_message_hashes.extend(self.cached_hashes)
+        for state in widget_states:
+            msg.rerun_script.widget_states.widgets.add().CopyFrom(state)
+        start = time.perf_counter()
+        await self.conn.write_message(msg.SerializeToString(), binary=True)
+        received = 0
+        while True:
+            raw = await self.conn.read_message()
+            if raw is None:
+                raise ConnectionError("server closed the websocket")
+            received += len(raw)
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            if forward.metadata.cacheable:
+                self.cached_hashes.add(forward.hash)
+            if forward.HasField("delta") and forward.delta.HasField("new_element"):
+                self.remember(forward.delta)
+            if forward.WhichOneof("type") == "script_finished" and forward.script_finished in DONE_STATUSES:
+                return received, time.perf_counter() - start
+
+    def remember(self, delta):
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        widget = getattr(element, kind)
+        if hasattr(widget, "id") and widget.id:
+            self.widgets[(kind, getattr(widget, "label", ""))] = (widget.id, delta.fragment_id)
+
+    def widget(self, kind, label=""):
+        return self.widgets[(kind, label)]
+
+    async def close(self):
+        self.conn.close()
+
+
+def widget_state(widget_id, **value):
+    state = BackMsg().rerun_script.widget_states.widgets.add()
+    state.id = widget_id
+    for field, field_value in value.items():
+        setattr(state, field, field_value)
+    return state
+
+
+async def run_session(client, pid, rng, samples):
+    await client.connect()
+    await client.rerun()
+    await client.rerun([
+        widget_state(client.widget("text_input", "الاسم الكامل")[0], string_value="bench"),
+        widget_state(client.widget("number_input", "السن")[0], int_value=30),
+        widget_state(client.widget("text_input", "العنوان")[0], string_value="bench"),
+        widget_state(client.widget("button", "تسجيل المعلومات")[0], trigger_value=True),
+    ])
+    await client.rerun([widget_state(client.widget("button", "ابدأ الاختبار")[0], trigger_value=True)])
+    # Every answer except the last, which leaves the test page.
+    for _ in range(samples):
+        radio_id, fragment_id = client.widget("radio")
+        button_id, _ = client.widget("button", "السؤال التالي")
+        cpu = server_cpu_seconds(pid)
+        received, seconds = await client.rerun([
+            widget_state(radio_id, int_value=int(rng.integers(4))),
+            widget_state(button_id, trigger_value=True),
+        ], fragment_id)
+        yield received, seconds, server_cpu_seconds(pid) - cpu
+    await client.close()
+
+
+async def measure(port, pid, sessions, answers, seed):
+    rng = np.random.default_rng(seed)
+    payloads, latencies, cpu = [], [], []
+    for _ in range(sessions):
+        async for received, seconds, cpu_seconds in run_session(BrowserClient(port), pid, rng, answers):
+            payloads.append(received)
+            latencies.append(seconds)
+            cpu.append(cpu_seconds)
+    return {
+        "answers": len(payloads),
+        "bytes_per_answer": {"mean": round(float(np.mean(payloads)), 1), "p95": float(np.percentile(payloads, 95))},
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)) * 1e3, 2),
+            "p95": round(float(np.percentile(latencies, 95)) * 1e3, 2),
+        },
+        "server_cpu_ms_per_answer": round(float(np.sum(cpu)) / len(cpu) * 1e3, 2),
+    }
+
+
+def main():
+    from settings import MAX_QUESTIONS
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(args.app, port)
+    try:
+        report = asyncio.run(measure(port, server.pid, args.sessions, MAX_QUESTIONS - 1, args.seed))
+    finally:
+        server.terminate()
+        server.wait()
+    report["app"] = args.app
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, ROOT)
+    main()
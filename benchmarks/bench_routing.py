@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from adaptive_engine import build_item_bank, get_next_question_logic, start_test, submit_answer
+from question_bank import load_question_bank
+from routing import build_routing_table
+from session_record import SessionRecord
+from settings import MAX_QUESTIONS, TRAITS
+from bench_selection import make_questions_df
+
+# ==============================================================================
+# Memory of the precomputed routing table (routing.py) against the selection
+# time it saves. For each depth K the table is built, then the same
+# simulated sessions answer their first K questions with the table and with
+# live selection; the report gives the routed share of nodes, table bytes,
+# build time and per-question and per-session get_next_question_logic time.
+# The default bank is synthetic with distinct parameters; a placeholder bank
+# (every item a=1, b=0) has exact ties and routes nothing.
+# Usage: python benchmarks/bench_routing.py [--bank edit.xlsx | --bank-size 300] [--depths 1 2 4 6 8]
+#        [--sessions 300] [--output report.json]
+# ==============================================================================
+
+
+def time_first_questions(bank, depth, sessions, seed):
+    rng = np.random.default_rng(seed)
+    elapsed = 0.0
+    for _ in range(sessions):
+        session = SessionRecord(MAX_QUESTIONS)
+        start_test(bank, session)
+        for _ in range(depth):
+            start = time.perf_counter()
+            get_next_question_logic(bank, session)
+            elapsed += time.perf_counter() - start
+            submit_answer(bank, session, int(rng.integers(1, 5)))
+    return elapsed / (sessions * depth)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bank", help="question spreadsheet (default: synthetic bank)")
+    parser.add_argument("--bank-size", type=int, default=300)
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 2, 4, 6, 8])
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    questions = load_question_bank(args.bank) if args.bank else make_questions_df(args.bank_size, args.seed, TRAITS)
+    bank = build_item_bank(questions, TRAITS)
+    rows = []
+    for depth in args.depths:
+        start = time.perf_counter()
+        table = build_routing_table(bank, depth, MAX_QUESTIONS)
+        build_seconds = time.perf_counter() - start
+        bank.routing = None
+        live = time_first_questions(bank, depth, args.sessions, args.seed)
+        bank.routing = table
+        routed = time_first_questions(bank, depth, args.sessions, args.seed)
+        rows.append({
+            "depth": depth,
+            "nodes": len(table.items),
+            "routed_nodes": int((table.items >= 0).sum()),
+            "table_kib": round(table.nbytes / 1024, 1),
+            "build_seconds": round(build_seconds, 2),
+            "live_us_per_question": round(live * 1e6, 1),
+            "routed_us_per_question": round(routed * 1e6, 1),
+            "saved_us_per_session": round((live - routed) * 1e6 * depth, 1),
+        })
+    bank.routing = None
+
+    print(f"{'depth':>5} {'routed':>13} {'KiB':>7} {'build s':>8} {'live us':>8} {'routed us':>10} {'saved us/session':>17}")
+    for row in rows:
+        print(f"{row['depth']:>5} {row['routed_nodes']:>6}/{row['nodes']:<6} {row['table_kib']:>7} {row['build_seconds']:>8} "
+              f"{row['live_us_per_question']:>8} {row['routed_us_per_question']:>10} {row['saved_us_per_session']:>17}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"bank": args.bank or f"synthetic:{args.bank_size}", "depths": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
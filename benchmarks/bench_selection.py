@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from adaptive_engine import QUESTION_COLUMN, TRAIT_COLUMN, build_item_bank, get_next_question_logic, submit_answer
+from session_record import SessionRecord
+
+# ==============================================================================
+# Micro-benchmark: per-question selection latency as the item bank grows.
+# Usage: python benchmarks/bench_selection.py [--sizes 300 3000 30000] [--sessions 50]
+# ==============================================================================
+TRAITS = [f"trait_{i}" for i in range(5)]
+MAX_QUESTIONS = 15
+
+
+def make_questions_df(size, seed=0, traits=TRAITS):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        QUESTION_COLUMN: [f"question {i}" for i in range(size)],
+        TRAIT_COLUMN: rng.choice(traits, size),
+        "a": rng.uniform(0.5, 2.5, size),
+        "b": rng.normal(0.0, 1.0, size),
+        "c": rng.uniform(0.0, 0.2, size),
+        "d": rng.uniform(0.0, 0.1, size),
+    })
+
+
+def legacy_next_question(questions_df, session_state):
+    # The DataFrame-scanning selection this engine replaced, kept for comparison.
+    asked_ids = session_state.get("asked_ids", set())
+    last_trait = session_state.get("last_question_trait")
+    last_score = session_state.get("last_score")
+    remaining_questions = questions_df[~questions_df.index.isin(asked_ids)]
+    if remaining_questions.empty:
+        return None, "done"
+    q = None
+    if session_state["question_count"] == 0:
+        q = remaining_questions.sample(1).iloc[0]
+    else:
+        if last_score in [2, 3] and last_trait:
+            trait_specific_remaining = remaining_questions[remaining_questions[TRAIT_COLUMN] == last_trait]
+            if not trait_specific_remaining.empty:
+                q = trait_specific_remaining.sample(1).iloc[0]
+        if q is None:
+            answered_traits_keys = session_state.get("answered_traits", {}).keys()
+            new_trait_questions = remaining_questions[~remaining_questions[TRAIT_COLUMN].isin(answered_traits_keys)]
+            if not new_trait_questions.empty:
+                q = new_trait_questions.sample(1).iloc[0]
+            else:
+                q = remaining_questions.sample(1).iloc[0]
+    session_state["current_question_id"] = q.name
+    session_state["current_question_trait"] = q[TRAIT_COLUMN]
+    session_state["asked_ids"].add(q.name)
+    return q[QUESTION_COLUMN], None
+
+
+def new_legacy_state():
+    return {"asked_ids": set(), "answered_traits": {}, "question_count": 0, "last_score": None}
+
+def legacy_answer(questions_df, state, score):
+    state["answered_traits"].setdefault(state["current_question_trait"], []).append(score)
+    state["last_score"] = score
+    state["question_count"] += 1
+
+
+def run_sessions(select, answer, new_state, source, sessions, seed=0):
+    rng = np.random.default_rng(seed)
+    timings = []
+    for _ in range(sessions):
+        state = new_state()
+        for _ in range(MAX_QUESTIONS):
+            start = time.perf_counter()
+            select(source, state)
+            timings.append(time.perf_counter() - start)
+            answer(source, state, int(rng.integers(1, 5)))
+    return np.array(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[300, 3_000, 30_000, 300_000])
+    parser.add_argument("--sessions", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'bank size':>10} {'method':>10} {'p50 us':>10} {'p95 us':>10}")
+    for size in args.sizes:
+        questions_df = make_questions_df(size)
+        bank = build_item_bank(questions_df, TRAITS)
+        new_record = lambda: SessionRecord(MAX_QUESTIONS)
+        methods = {
+            "pandas": (legacy_next_question, legacy_answer, new_legacy_state, questions_df),
+            "random": (lambda b, s: get_next_question_logic(b, s, "random"), submit_answer, new_record, bank),
+            "max_info": (lambda b, s: get_next_question_logic(b, s, "max_info"), submit_answer, new_record, bank),
+        }
+        for name, (select, answer, new_state, source) in methods.items():
+            timings = run_sessions(select, answer, new_state, source, args.sessions)
+            print(f"{size:>10} {name:>10} {np.percentile(timings, 50):>10.1f} {np.percentile(timings, 95):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
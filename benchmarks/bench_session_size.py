@@ -0,0 +1,89 @@
+import argparse
+import os
+import pickle
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from adaptive_engine import build_item_bank, get_next_question_logic, new_log_posterior, submit_answer
+from session_record import SessionRecord
+from settings import MAX_QUESTIONS, TRAITS
+from bench_selection import make_questions_df
+
+# ==============================================================================
+# Bytes per session: the old one-key-per-field session_state layout (asked
+# label set, per-trait answer lists, question text/trait copies, a per-session
+# ItemPool over the whole bank) against the fixed-size SessionRecord, both
+# measured after a full test. "deep" follows containers, slots and numpy
+# buffers; "pickle" is the serialized size.
+# Usage: python benchmarks/bench_session_size.py [--sizes 300 3000 30000]
+# ==============================================================================
+USER_INFO = {"name": "مستخدم تجريبي", "age": 30, "location": "القاهرة", "test_date": "2026-01-01 12:00:00"}
+
+
+def deep_sizeof(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = obj.nbytes + sys.getsizeof(np.empty(0)) if isinstance(obj, np.ndarray) else sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+
+def legacy_session(bank, record):
+    # What the old keys held for the same answers; the pool is the per-session
+    # index it kept over the whole bank (order + slot int32, available bool).
+    answered_traits = {}
+    for pos, score in zip(record.asked_positions(), record.responses[:record.question_count]):
+        answered_traits.setdefault(bank.traits[bank.trait_codes[pos]], []).append(int(score))
+    last = int(record.asked[record.question_count - 1])
+    return {
+        "page": "test", "user_info": dict(USER_INFO), "answered_traits": answered_traits,
+        "current_question_id": bank.labels[last].item(), "current_question_text": bank.questions[last],
+        "current_question_trait": bank.traits[bank.trait_codes[last]],
+        "asked_ids": {bank.labels[pos].item() for pos in record.asked_positions()},
+        "item_pool": (
+            bank.trait_order.copy(), bank.trait_slot.copy(), bank.trait_counts.copy(), np.ones(bank.size, dtype=bool)
+        ),
+        "current_item_pos": last, "trait_log_posterior": record.log_posterior.copy(), "bank_version": 1,
+        "question_count": record.question_count, "test_started": True, "user_registered": True,
+        "last_score": record.last_score, "show_results_page": False, "registration_status": "✅ تم تسجيل المستخدم",
+        "results_saved_to_sheets": False,
+    }
+
+
+def finished_record(bank, seed):
+    rng = np.random.default_rng(seed)
+    record = SessionRecord(MAX_QUESTIONS)
+    record.user_info = dict(USER_INFO)
+    record.registration_status = "✅ تم تسجيل المستخدم"
+    record.start_test(bank, new_log_posterior(bank.num_traits), 1)
+    for _ in range(MAX_QUESTIONS):
+        get_next_question_logic(bank, record, "random")
+        submit_answer(bank, record, int(rng.integers(1, 5)))
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[300, 3_000, 30_000])
+    args = parser.parse_args()
+
+    print(f"{'bank size':>10} {'layout':>8} {'deep B':>10} {'pickle B':>10}")
+    for size in args.sizes:
+        bank = build_item_bank(make_questions_df(size, traits=TRAITS), TRAITS)
+        record = finished_record(bank, size)
+        for name, state in (("legacy", legacy_session(bank, record)), ("record", record)):
+            print(f"{size:>10} {name:>8} {deep_sizeof(state):>10} {len(pickle.dumps(state)):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from adaptive_engine import build_item_bank, get_next_question_logic, restore_test, start_test, submit_answer
+from session_record import SessionRecord
+from session_store import MemorySessionStore, SqliteSessionStore, encode_session
+from settings import MAX_QUESTIONS, TRAITS
+from bench_selection import make_questions_df
+
+# ==============================================================================
+# Cost of keeping in-flight tests in a session store (session_store.py).
+# Each simulated session registers, then answers MAX_QUESTIONS questions;
+# after every answer it is saved, and before the next one it is loaded back
+# (and, for the SQLite store, rebuilt with restore_test) as a request landing
+# on another replica would. Each session's final stored state is checked
+# against a record that answered the same items in memory. Reports the
+# stored size against a pickle of the same record and the per-answer save
+# and load+restore times per store.
+# Usage: python benchmarks/bench_session_store.py [--sessions 500] [--bank-size 300] [--output report.json]
+# ==============================================================================
+
+
+def record_fields(session):
+    return {name: getattr(session, name) for name in SessionRecord.__slots__ if name != "__weakref__"}
+
+
+def check_round_trip(bank, stored, reference):
+    # The stored session must match a reference record that answered the
+    # same items without going through the store: the same asked positions
+    # (none -1, none repeated) and the same scores.
+    count = reference.question_count
+    asked = stored.asked_positions()
+    if stored.question_count != count or not np.array_equal(asked, reference.asked_positions()):
+        raise AssertionError(f"asked {asked.tolist()} != {reference.asked_positions().tolist()}")
+    if asked.min() < 0 or len(np.unique(asked)) != count:
+        raise AssertionError(f"asked positions invalid or repeated: {asked.tolist()}")
+    if stored.current_item != reference.current_item or stored.asked[count] != reference.asked[count]:
+        raise AssertionError("on-screen item lost")
+    restore_test(bank, stored)
+    if not (np.array_equal(stored.trait_counts, reference.trait_counts)
+            and np.array_equal(stored.log_posterior, reference.log_posterior)):
+        raise AssertionError("restored scores differ from the reference")
+
+
+def run(store, bank, num_sessions, seed):
+    # Every session is checked with check_round_trip before its timings count.
+    random.seed(seed)
+    save_seconds = []
+    load_seconds = []
+    for _ in range(num_sessions):
+        session = SessionRecord(MAX_QUESTIONS)
+        session.register("مستخدم", 30, "القاهرة")
+        start_test(bank, session)
+        session.test_started = True
+        session.page = "test"
+        get_next_question_logic(bank, session)
+        reference = SessionRecord(MAX_QUESTIONS)
+        start_test(bank, reference)
+        store.save(session.token, session)
+        for _ in range(MAX_QUESTIONS - 1):
+            start = time.perf_counter()
+            session = store.load(session.token)
+            restore_test(bank, session)
+            load_seconds.append(time.perf_counter() - start)
+            score = random.randint(1, 4)
+            reference.current_item = session.current_item
+            submit_answer(bank, reference, score)
+            submit_answer(bank, session, score)
+            get_next_question_logic(bank, session)
+            reference.current_item = session.current_item
+            reference.asked[reference.question_count] = session.current_item
+            start = time.perf_counter()
+            store.save(session.token, session)
+            save_seconds.append(time.perf_counter() - start)
+        check_round_trip(bank, store.load(session.token), reference)
+    return {
+        "save_us_p50": round(1e6 * float(np.percentile(save_seconds, 50)), 1),
+        "save_us_p99": round(1e6 * float(np.percentile(save_seconds, 99)), 1),
+        "load_us_p50": round(1e6 * float(np.percentile(load_seconds, 50)), 1),
+        "load_us_p99": round(1e6 * float(np.percentile(load_seconds, 99)), 1),
+    }, session
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--bank-size", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    bank = build_item_bank(make_questions_df(args.bank_size, args.seed, TRAITS), TRAITS)
+    memory, session = run(MemorySessionStore(), bank, args.sessions, args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = SqliteSessionStore(os.path.join(directory, "sessions.db"))
+        sqlite, _ = run(store, bank, args.sessions, args.seed)
+        store.close()
+    report = {
+        "sessions": args.sessions,
+        "answers_per_session": MAX_QUESTIONS - 1,
+        "encoded_bytes": len(encode_session(session)),
+        "pickle_bytes": len(pickle.dumps(record_fields(session))),
+        "memory": memory,
+        "sqlite": sqlite,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
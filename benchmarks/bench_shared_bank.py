@@ -0,0 +1,100 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from adaptive_engine import QUESTION_COLUMN, build_item_bank
+from question_bank import read_compiled_bank, write_compiled_bank
+from settings import TRAITS
+from shared_bank import attach_shared_bank, write_shared_bank
+from bench_selection import make_questions_df
+
+# ==============================================================================
+# Per-worker memory of the item bank: every worker building its own bank from
+# the compiled .npz (the previous load path: a pandas frame, then a private
+# ItemBank with Python question strings) against attaching to the shared
+# memory-mapped file. The workers load concurrently, read every question and
+# the whole information table, and then report from /proc/self/smaps_rollup:
+# private dirty bytes (memory only that worker holds) and PSS (shared pages
+# split between the processes mapping them), as the change since start-up.
+# Usage: python benchmarks/bench_shared_bank.py [--sizes 10000 100000 300000] [--workers 4]
+#        [--output report.json]
+# ==============================================================================
+QUESTION_TEXT = "ما مدى تأثير دعم الرفيق المهني على قدرتك في التعامل مع ضغوط العمل اليومية؟"
+
+
+def memory_kib():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Private_Dirty"], fields["Pss"]
+
+
+def worker(mode, path, barrier, results):
+    start_dirty, start_pss = memory_kib()
+    if mode == "private":
+        bank = build_item_bank(read_compiled_bank(path)[0], TRAITS)
+    else:
+        bank = attach_shared_bank(path)
+    text_bytes = sum(len(text) for text in bank.questions)
+    float(bank.info_table.sum() + bank.params.sum())
+    barrier.wait()
+    dirty, pss = memory_kib()
+    results.put((dirty - start_dirty, pss - start_pss, text_bytes))
+    barrier.wait()
+
+
+def measure(mode, path, workers):
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, path, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {
+        "private_dirty_mib_per_worker": round(np.mean([row[0] for row in rows]) / 1024, 1),
+        "pss_mib_per_worker": round(np.mean([row[1] for row in rows]) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            df = make_questions_df(size, 0, TRAITS)
+            df[QUESTION_COLUMN] = [f"{QUESTION_TEXT} {i}" for i in range(size)]
+            compiled = os.path.join(directory, f"bank-{size}.bank.npz")
+            shared = os.path.join(directory, f"bank-{size}.bank.mmap")
+            write_compiled_bank(df, compiled, {})
+            write_shared_bank(build_item_bank(df, TRAITS), shared, {})
+            del df
+            entry = {"items": size, "workers": args.workers, "shared_file_mib": round(os.path.getsize(shared) / 2 ** 20, 1)}
+            entry["private"] = measure("private", compiled, args.workers)
+            entry["shared"] = measure("shared", shared, args.workers)
+            report.append(entry)
+            print(json.dumps(entry))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
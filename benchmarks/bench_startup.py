@@ -0,0 +1,88 @@
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# ==============================================================================
+# Cold-start benchmark: fresh-process time until the first question is ready,
+# parsing edit.xlsx ("excel") versus reusing the compiled bank ("compiled").
+# Usage: python benchmarks/bench_startup.py [--runs 5] [--app | --first-paint]
+# --app measures a full headless render of app.py up to the first question,
+# --first-paint the first render of the onboarding form.
+# ==============================================================================
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENGINE_SCRIPT = """
+import time
+start = time.perf_counter()
+from adaptive_engine import build_item_bank, get_next_question_logic
+from question_bank import load_question_bank
+from session_record import SessionRecord
+bank = build_item_bank(load_question_bank("edit.xlsx"))
+get_next_question_logic(bank, SessionRecord(15))
+print(time.perf_counter() - start)
+"""
+
+APP_SCRIPT = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+from session_record import SessionRecord
+at = AppTest.from_file("app.py", default_timeout=120)
+session = SessionRecord(15)
+session.page = "test"
+session.user_registered = True
+at.session_state["test"] = session
+at.run()
+at.button(key="start_test_button").click().run()
+assert at.session_state["test"].current_item >= 0
+print(time.perf_counter() - start)
+"""
+
+FIRST_PAINT_SCRIPT = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+assert at.text_input(key="name_input")
+print(time.perf_counter() - start)
+"""
+
+
+def run_once(workdir, script, compiled):
+    if not compiled:
+        for name in os.listdir(workdir):
+            if name.endswith((".bank.npz", ".bank.mmap")):
+                os.remove(os.path.join(workdir, name))
+    env = dict(os.environ, PYTHONPATH=workdir)
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app", action="store_true")
+    parser.add_argument("--first-paint", action="store_true")
+    args = parser.parse_args()
+    script = FIRST_PAINT_SCRIPT if args.first_paint else APP_SCRIPT if args.app else ENGINE_SCRIPT
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in os.listdir(ROOT):
+            if name.endswith(".py") or name == "edit.xlsx":
+                shutil.copy2(os.path.join(ROOT, name), workdir)
+        print(f"{'mode':>10} {'median s':>10} {'min s':>10}")
+        for mode, compiled in (("excel", False), ("compiled", True)):
+            run_once(workdir, script, True)  # warm the OS file cache and build the artifact
+            timings = [run_once(workdir, script, compiled) for _ in range(args.runs)]
+            print(f"{mode:>10} {statistics.median(timings):>10.3f} {min(timings):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
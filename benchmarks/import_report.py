@@ -0,0 +1,115 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ==============================================================================
+# Import-time report: what a cold process pays to import app.py's top-level
+# imports, measured with `python -X importtime` in a fresh interpreter. The
+# import list is read from app.py itself, so an eager import added there shows
+# up here. Reports the total, the slowest modules (cumulative and self time)
+# and the cost per top-level package; --baseline compares against an earlier
+# --output and --budget-ms exits non-zero when the total goes over budget.
+# Usage: python benchmarks/import_report.py [--app app.py] [--top 15] [--runs 3] [--output imports.json]
+#        [--baseline imports.json] [--budget-ms 1500] [--module extra.module ...]
+# ==============================================================================
+APP_PATH = os.path.join(ROOT, "app.py")
+
+
+def top_level_imports(path=APP_PATH):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    statements = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return [ast.unparse(node) for node in statements]
+
+
+def parse_importtime(stderr):
+    # Lines look like "import time:   self [us] | cumulative | imported package",
+    # with nesting shown by indentation of the module name.
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1e3,
+            "cumulative_ms": int(cumulative_us) / 1e3,
+        })
+    return modules
+
+
+def measure(statements):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "\n".join(statements)],
+        cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def summarize(runs):
+    # Per module, the fastest of the runs, which is the least noisy estimate.
+    best = {}
+    for modules in runs:
+        for entry in modules:
+            known = best.get(entry["module"])
+            if known is None or entry["cumulative_ms"] < known["cumulative_ms"]:
+                best[entry["module"]] = entry
+    modules = list(best.values())
+    packages = {}
+    for entry in modules:
+        package = entry["module"].split(".")[0]
+        packages[package] = packages.get(package, 0.0) + entry["self_ms"]
+    return {
+        "total_ms": round(sum(entry["self_ms"] for entry in modules), 1),
+        "modules": sorted(modules, key=lambda entry: entry["cumulative_ms"], reverse=True),
+        "packages": dict(sorted(((k, round(v, 1)) for k, v in packages.items()), key=lambda item: -item[1])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default=APP_PATH, help="read the import list from this file")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--module", action="append", default=[], help="also import this module")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--budget-ms", type=float, help="exit with status 1 if the total is above this")
+    args = parser.parse_args()
+
+    statements = top_level_imports(args.app) + [f"import {name}" for name in args.module]
+    report = summarize([measure(statements) for _ in range(args.runs)])
+    report["imports"] = statements
+
+    print(f"Total import time: {report['total_ms']:.1f} ms ({len(report['modules'])} modules)")
+    print(f"\n{'cumulative ms':>14} {'self ms':>8}  slowest modules")
+    for entry in report["modules"][:args.top]:
+        print(f"{entry['cumulative_ms']:>14.1f} {entry['self_ms']:>8.1f}  {'  ' * entry['depth']}{entry['module']}")
+    print(f"\n{'self ms':>14}  per top-level package")
+    for package, self_ms in list(report["packages"].items())[:args.top]:
+        print(f"{self_ms:>14.1f}  {package}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        before = baseline["total_ms"]
+        print(f"\nTotal vs baseline: {before:.1f} -> {report['total_ms']:.1f} ms "
+              f"({(report['total_ms'] - before) / before:+.1%})")
+        for package in sorted(set(report["packages"]) - set(baseline["packages"])):
+            print(f"  new package: {package} ({report['packages'][package]:.1f} ms)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        print(f"\nImport time {report['total_ms']:.1f} ms is over the {args.budget_ms:.0f} ms budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
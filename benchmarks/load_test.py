@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from session_record import SessionRecord
+from settings import CHOICES, MAX_QUESTIONS
+from sheets_writer import LocalWorksheet
+
+# ==============================================================================
+# Multi-session load test for app.py using headless AppTest sessions.
+# Each simulated user goes onboarding -> test -> results in its own AppTest.
+# AppTest swaps process-global runtime state on every run, so concurrent
+# sessions run in separate worker processes (one session at a time each);
+# a single Streamlit server executes reruns under one GIL, so its capacity is
+# roughly 1 / mean rerun time, reported as "reruns/s per process". Google
+# credentials and gspread are stubbed with an in-memory worksheet. Reports
+# rerun latency per page, memory per in-flight session and the concurrency
+# level where host throughput stops scaling.
+# Usage: python benchmarks/load_test.py [--levels 1 2 4 8] [--users-per-level 16]
+# ==============================================================================
+APP_PATH = os.path.join(ROOT, "app.py")
+FAKE_GCP_SECRETS = {"type": "service_account", "project_id": "load-test"}
+SATURATION_GAIN = 1.10
+
+
+class _FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.sheet1 = worksheet
+
+
+class _FakeClient:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def open_by_key(self, key):
+        return _FakeSpreadsheet(self.worksheet)
+
+
+def stub_google_sheets(worksheet):
+    # app.py looks these up at call time, so patching them here affects every
+    # session and the background Sheets writer thread alike.
+    import gspread
+    import streamlit as st
+    from google.oauth2 import service_account
+    service_account.Credentials.from_service_account_info = classmethod(lambda cls, info, **kwargs: object())
+    gspread.authorize = lambda creds: _FakeClient(worksheet)
+    st.secrets = {"gcp": FAKE_GCP_SECRETS}
+
+
+def init_worker():
+    os.chdir(ROOT)
+    stub_google_sheets(LocalWorksheet())
+    run_user(-1, defaultdict(list), 0)  # warm imports, caches and the bank registry
+
+
+def timed_run(at, timings, page, action=None):
+    start = time.perf_counter()
+    (action or at.run)()
+    timings[page].append(time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(f"{page}: {at.exception[0].value}")
+
+
+def click(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button.click().run
+    raise LookupError(label)
+
+
+def run_user(user_id, timings, rng_seed):
+    from streamlit.testing.v1 import AppTest
+    rng = np.random.default_rng(rng_seed)
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    timed_run(at, timings, "onboarding")
+    at.text_input("name_input").input(f"user-{user_id}")
+    at.number_input("age_input").set_value(int(rng.integers(18, 70)))
+    at.text_input("location_input").input("load test")
+    timed_run(at, timings, "register", click(at, "تسجيل المعلومات"))
+    timed_run(at, timings, "start_test", at.button(key="start_test_button").click().run)
+    # The stopping rule may end the test before MAX_QUESTIONS.
+    for i in range(MAX_QUESTIONS):
+        at.radio(key=f"q_{i}").set_value(CHOICES[int(rng.integers(len(CHOICES)))])
+        timed_run(at, timings, "answer", click(at, "السؤال التالي"))
+        if at.session_state["test"].page == "results":
+            timings["last_answer_to_results"].append(timings["answer"].pop())
+            break
+    timed_run(at, timings, "results_rerender")
+    return at
+
+
+def run_users(user_ids):
+    timings = defaultdict(list)
+    for user_id in user_ids:
+        run_user(user_id, timings, user_id)
+    return timings
+
+
+def run_level(concurrency, users):
+    timings = defaultdict(list)
+    batches = [list(range(i, users, concurrency)) for i in range(concurrency)]
+    with ProcessPoolExecutor(max_workers=concurrency, initializer=init_worker) as pool:
+        # Workers are warmed by the initializer before the clock starts.
+        list(pool.map(time.sleep, [0.0] * concurrency))
+        start = time.perf_counter()
+        for worker_timings in pool.map(run_users, batches):
+            for page, values in worker_timings.items():
+                timings[page].extend(values)
+        wall = time.perf_counter() - start
+    all_reruns = [value for values in timings.values() for value in values]
+    return {
+        "concurrency": concurrency,
+        "users": users,
+        "wall_seconds": round(wall, 3),
+        "reruns_per_second": round(len(all_reruns) / wall, 1),
+        "reruns_per_second_per_process": round(1.0 / float(np.mean(all_reruns)), 1),
+        "pages": {
+            page: {
+                "p50_ms": round(float(np.percentile(values, 50)) * 1e3, 1),
+                "p95_ms": round(float(np.percentile(values, 95)) * 1e3, 1),
+            }
+            for page, values in timings.items()
+        },
+    }
+
+
+def memory_per_session(sessions):
+    # Sessions are parked mid-test, the state a busy server holds most of.
+    from streamlit.testing.v1 import AppTest
+    tracemalloc.start()
+    base = tracemalloc.take_snapshot()
+    parked = []
+    for user_id in range(sessions):
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        session = SessionRecord(MAX_QUESTIONS)
+        session.page = "test"
+        session.user_registered = True
+        at.session_state["test"] = session
+        at.run()
+        at.button(key="start_test_button").click().run()
+        parked.append(at)
+    used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(base, "filename"))
+    tracemalloc.stop()
+    return round(used / sessions / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--users-per-level", type=int, default=16)
+    parser.add_argument("--memory-sessions", type=int, default=20)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    init_worker()
+    levels = []
+    print(f"{'users':>6} {'procs':>5} {'reruns/s':>9} {'per proc':>9} {'answer p50':>11} {'answer p95':>11} "
+          f"{'results p95':>12}")
+    for concurrency in args.levels:
+        level = run_level(concurrency, max(args.users_per_level, concurrency))
+        levels.append(level)
+        pages = level["pages"]
+        print(f"{level['users']:>6} {concurrency:>5} {level['reruns_per_second']:>9} "
+              f"{level['reruns_per_second_per_process']:>9} "
+              f"{pages['answer']['p50_ms']:>9}ms {pages['answer']['p95_ms']:>9}ms "
+              f"{pages['last_answer_to_results']['p95_ms']:>10}ms")
+
+    saturation = levels[-1]["concurrency"]
+    for previous, level in zip(levels, levels[1:]):
+        if level["reruns_per_second"] < previous["reruns_per_second"] * SATURATION_GAIN:
+            saturation = previous["concurrency"]
+            break
+    kib = memory_per_session(args.memory_sessions)
+    print(f"Host throughput stops scaling beyond ~{saturation} concurrent worker processes.")
+    print(f"Memory per in-flight session: {kib} KiB (traced Python allocations)")
+    print("Per-page latency at the highest level:")
+    for page, stats in levels[-1]["pages"].items():
+        print(f"  {page:>24}: p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"levels": levels, "saturation_concurrency": saturation, "kib_per_session": kib}, f, indent=2)
+
+
+if __name__ == "__main__":
+    # AppTest replaces sys.modules["__main__"] with the app, so run through the
+    # importable module to keep worker functions picklable.
+    import load_test
+    load_test.main()
@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from adaptive_engine import (
+    SELECTION_STRATEGY, STOPPING_RULE, STOP_SE_THRESHOLD, ability_estimates, build_item_bank,
+    category_probabilities, get_next_question_logic, should_stop, submit_answer
+)
+from question_bank import load_question_bank
+from results import build_result_row, calculate_results
+from session_record import SessionRecord
+from settings import MAX_QUESTIONS, TRAITS
+from sheets_writer import LocalWorksheet, SheetsBatchWriter
+from bench_selection import make_questions_df
+
+# ==============================================================================
+# Offline simulated-respondent benchmark for the adaptive engine.
+# Synthetic respondents with known trait thetas are driven through
+# get_next_question_logic / submit_answer / calculate_results and the Sheets
+# save path (batch writer + in-memory worksheet), using the app's
+# SessionRecord as the session state. Results are written as JSON for
+# comparison between commits. --sweep reruns the simulation per SE threshold
+# of the adaptive stopping rule (plus the fixed-length rule) and tabulates
+# test length against accuracy.
+# Usage: python benchmarks/simulate.py [--respondents 2000] [--bank edit.xlsx | --bank-size 5000]
+#        [--stopping adaptive|fixed] [--se-threshold 0.7] [--sweep 0.6 0.7 0.8]
+#        [--output bench_simulation.json] [--compare previous.json]
+# ==============================================================================
+DEFAULT_OUTPUT = "bench_simulation.json"
+
+
+def load_bank(args):
+    if args.bank_size:
+        questions_df = make_questions_df(args.bank_size, args.seed, TRAITS)
+        return build_item_bank(questions_df, TRAITS), f"synthetic:{args.bank_size}"
+    return build_item_bank(load_question_bank(args.bank), TRAITS), args.bank
+
+
+def sample_answer(bank, pos, true_theta, rng):
+    probs, _ = category_probabilities(bank.params[:, [pos]], [true_theta[bank.trait_codes[pos]]])
+    probs = probs[:, 0] / probs[:, 0].sum()
+    return int(rng.choice(4, p=probs)) + 1
+
+
+def run_respondent(bank, true_theta, rng, args, timings):
+    state = SessionRecord(args.max_questions)
+    while not should_stop(bank, state, args.stopping, args.se_threshold):
+        start = time.perf_counter()
+        _, error = get_next_question_logic(bank, state, args.strategy)
+        timings["select"].append(time.perf_counter() - start)
+        if error:
+            break
+        score = sample_answer(bank, state.current_item, true_theta, rng)
+        start = time.perf_counter()
+        submit_answer(bank, state, score)
+        timings["answer"].append(time.perf_counter() - start)
+    return state
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1e6
+    if not len(values):
+        return {}
+    return {f"p{p}_us": round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)}
+
+
+def accuracy(true_thetas, estimates, answered_mask):
+    report = {}
+    for i, trait in enumerate(TRAITS):
+        covered = answered_mask[:, i]
+        if covered.sum() < 3:
+            continue
+        truth, estimate = true_thetas[covered, i], estimates[covered, i]
+        report[trait] = {
+            "respondents": int(covered.sum()),
+            "correlation": round(float(np.corrcoef(truth, estimate)[0, 1]), 4),
+            "rmse": round(float(np.sqrt(np.mean((truth - estimate) ** 2))), 4),
+        }
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def simulate(args):
+    rng = np.random.default_rng(args.seed)
+    bank, bank_name = load_bank(args)
+    worksheet = LocalWorksheet(latency=args.sheets_latency)
+    writer = SheetsBatchWriter(lambda: worksheet)
+    timings = {"select": [], "answer": [], "results": [], "save": []}
+    true_thetas = rng.standard_normal((args.respondents, len(TRAITS)))
+    estimates = np.zeros_like(true_thetas)
+    answered_mask = np.zeros(true_thetas.shape, dtype=bool)
+    questions_asked = 0
+    lengths = []
+
+    wall_start = time.perf_counter()
+    for r in range(args.respondents):
+        state = run_respondent(bank, true_thetas[r], rng, args, timings)
+        lengths.append(state.question_count)
+        questions_asked += state.question_count
+        start = time.perf_counter()
+        trait_scores, dominant_trait, _, _ = calculate_results(state, {"name": f"sim-{r}"}, bank.traits)
+        timings["results"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        writer.submit(build_result_row({"name": f"sim-{r}"}, trait_scores, dominant_trait))
+        timings["save"].append(time.perf_counter() - start)
+        if state.log_posterior is not None:
+            estimates[r] = ability_estimates(state.log_posterior)[0][:len(TRAITS)]
+            answered_mask[r] = state.trait_counts[:len(TRAITS)] > 0
+    wall = time.perf_counter() - wall_start
+    writer.flush(timeout=60)
+    writer.close()
+
+    per_question = np.add(timings["select"][:len(timings["answer"])], timings["answer"])
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "respondents": args.respondents, "bank": bank_name, "bank_size": bank.size,
+            "strategy": args.strategy, "max_questions": args.max_questions, "seed": args.seed,
+            "stopping": args.stopping, "se_threshold": args.se_threshold,
+        },
+        "latency": {
+            "per_question": percentiles(per_question),
+            "select": percentiles(timings["select"]),
+            "answer": percentiles(timings["answer"]),
+            "calculate_results": percentiles(timings["results"]),
+            "save": percentiles(timings["save"]),
+        },
+        "throughput": {
+            "wall_seconds": round(wall, 3),
+            "respondents_per_second": round(args.respondents / wall, 1),
+            "questions_per_second": round(questions_asked / wall, 1),
+            "mean_test_length": round(questions_asked / args.respondents, 2),
+            "test_length_percentiles": {f"p{p}": float(np.percentile(lengths, p)) for p in (5, 50, 95)},
+        },
+        "memory": {"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)},
+        "sheets": {"rows_written": writer.rows_written, "api_calls": writer.api_calls},
+        "accuracy": accuracy(true_thetas, estimates, answered_mask),
+    }
+
+
+def overall_accuracy(report):
+    stats = report["accuracy"].values()
+    return (
+        round(float(np.mean([s["correlation"] for s in stats])), 3),
+        round(float(np.mean([s["rmse"] for s in stats])), 3),
+    )
+
+
+def sweep(args):
+    # One simulation per stopping configuration, same seed and respondents.
+    configs = [("fixed", args.se_threshold)] + [("adaptive", threshold) for threshold in args.sweep]
+    rows = []
+    print(f"{'rule':>9} {'SE stop':>8} {'mean len':>9} {'p5-p95':>9} {'mean r':>7} {'rmse':>6} {'q/s':>8}")
+    for rule, threshold in configs:
+        args.stopping, args.se_threshold = rule, threshold
+        report = simulate(args)
+        r, rmse = overall_accuracy(report)
+        throughput = report["throughput"]
+        lengths = throughput["test_length_percentiles"]
+        rows.append({
+            "stopping": rule, "se_threshold": threshold, "mean_test_length": throughput["mean_test_length"],
+            "mean_correlation": r, "mean_rmse": rmse,
+        })
+        print(f"{rule:>9} {threshold if rule == 'adaptive' else '-':>8} {throughput['mean_test_length']:>9} "
+              f"{lengths['p5']:>4.0f}-{lengths['p95']:<4.0f} {r:>7} {rmse:>6} {throughput['questions_per_second']:>8}")
+    return rows
+
+
+def compare(report, previous):
+    # Relative change of the headline numbers against an earlier run.
+    pairs = [
+        ("per-question p95 us", report["latency"]["per_question"].get("p95_us"),
+         previous["latency"]["per_question"].get("p95_us")),
+        ("questions/s", report["throughput"]["questions_per_second"], previous["throughput"]["questions_per_second"]),
+        ("peak RSS MB", report["memory"]["peak_rss_mb"], previous["memory"]["peak_rss_mb"]),
+    ]
+    for name, now, before in pairs:
+        if now is not None and before:
+            print(f"{name:>22}: {before} -> {now} ({(now - before) / before:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--respondents", type=int, default=2000)
+    parser.add_argument("--bank", default=os.path.join(ROOT, "edit.xlsx"))
+    parser.add_argument("--bank-size", type=int, help="use a synthetic bank of this size instead of --bank")
+    parser.add_argument("--strategy", default=SELECTION_STRATEGY)
+    parser.add_argument("--max-questions", type=int, default=MAX_QUESTIONS)
+    parser.add_argument("--stopping", default=STOPPING_RULE, choices=["adaptive", "fixed"])
+    parser.add_argument("--se-threshold", type=float, default=STOP_SE_THRESHOLD)
+    parser.add_argument("--sweep", type=float, nargs="+", help="SE thresholds to compare against fixed length")
+    parser.add_argument("--sheets-latency", type=float, default=0.0, help="seconds per fake append_rows call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    if args.sweep:
+        rows = sweep(args)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"sweep": rows}, f, indent=2)
+        return
+    report = simulate(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps({k: report[k] for k in ("latency", "throughput", "memory")}, indent=2))
+    for trait, stats in report["accuracy"].items():
+        print(f"{trait}: r={stats['correlation']:.3f} rmse={stats['rmse']:.3f} (n={stats['respondents']})")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from adaptive_engine import LOG_PRIOR, NUM_CATEGORIES, QUADRATURE, ability_estimates, category_probabilities
+from results import RESULT_HEADERS
+from settings import CHOICES, CHOICE_VALUES, TRAITS
+from shared_bank import load_shared_bank
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Input Layout and Settings
+# ==============================================================================
+# Batch scoring of complete response sheets (paper forms, offline
+# collection) without a session per respondent. The input has one row per
+# respondent and one column per item, named by the item's row label in the
+# question spreadsheet (as in the response log and calibration) or by its
+# question text; cells hold 1-4 or the answer text, blank means not asked.
+# Optional name/age/location/test-date columns are copied to the output,
+# which has the sheet's column layout (RESULT_HEADERS), plus theta and SE
+# per trait with --theta.
+# The file is read in CHUNK_ROWS-row chunks; each chunk becomes a uint8
+# response matrix that a worker scores with a few matrix products: trait
+# sums and counts against a one-hot item-to-trait matrix and, for theta,
+# per-category answer masks against the items' log-probabilities on the
+# quadrature grid. Chunks are written in input order, with at most
+# MAX_PENDING_PER_WORKER chunks per worker in flight.
+CHUNK_ROWS = 20000
+MAX_PENDING_PER_WORKER = 2
+ID_COLUMNS = {
+    "name": ("name", "الاسم"),
+    "age": ("age", "السن"),
+    "location": ("location", "العنوان"),
+    "test_date": ("test_date", "Timestamp"),
+}
+UNDETERMINED_TRAIT = "غير محدد"
+THETA_HEADERS = [f"ثيتا {trait}" for trait in TRAITS] + [f"الخطأ المعياري {trait}" for trait in TRAITS]
+_ANSWER_CODES = dict(zip(CHOICES, CHOICE_VALUES))
+_ANSWER_CODES.update({str(value): value for value in CHOICE_VALUES})
+
+def match_columns(columns, bank, item_prefix=""):
+    # Item positions of the input columns that name an item, and the input
+    # column used for each id field.
+    by_name = {f"{item_prefix}{label}": pos for pos, label in enumerate(bank.labels.tolist())}
+    for pos, text in enumerate(bank.questions):
+        by_name.setdefault(text, pos)
+    item_columns, positions = [], []
+    for column in columns:
+        pos = by_name.get(str(column).strip())
+        if pos is not None:
+            item_columns.append(column)
+            positions.append(pos)
+    id_columns = {}
+    for field, names in ID_COLUMNS.items():
+        for name in names:
+            if name in columns:
+                id_columns[field] = name
+                break
+    if len(set(positions)) != len(positions):
+        raise ValueError("أكثر من عمود لنفس السؤال في ملف الإجابات.")
+    return item_columns, np.array(positions, dtype=np.intp), id_columns
+
+def response_matrix(block):
+    # (n, k) uint8 answers, 0 where blank or not a valid answer, and the
+    # number of non-blank cells that were not valid answers.
+    values = np.empty(block.shape, dtype=np.float64)
+    for j, column in enumerate(block.columns):
+        series = block[column]
+        if series.dtype == object:
+            series = series.map(lambda value: _ANSWER_CODES.get(value.strip(), np.nan) if isinstance(value, str) else value)
+        values[:, j] = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64)
+    valid = np.isin(values, CHOICE_VALUES)
+    invalid = int((~np.isnan(values) & ~valid).sum())
+    return np.where(valid, values, 0).astype(np.uint8), invalid
+
+# ==============================================================================
+# 1. Vectorized Scoring
+# ==============================================================================
+class ScoringModel:
+    # What a worker needs for the matched item columns: each column's trait
+    # as a one-hot matrix and, for theta, the per-trait column groups with
+    # their (categories, Q) log-probability tables.
+    def __init__(self, bank, positions, with_theta):
+        self.traits = bank.traits
+        codes = bank.trait_codes[positions]
+        self.trait_matrix = np.zeros((len(positions), bank.num_traits), dtype=np.float32)
+        self.trait_matrix[np.arange(len(positions)), codes] = 1.0
+        self.trait_columns = None
+        self.log_probs = None
+        if with_theta:
+            grid = np.broadcast_to(QUADRATURE, (len(positions), len(QUADRATURE)))
+            probs, _ = category_probabilities(bank.params[:, positions], grid)
+            log_probs = np.log(probs)
+            self.trait_columns = [np.flatnonzero(codes == code) for code in range(bank.num_traits)]
+            self.log_probs = [log_probs[:, columns] for columns in self.trait_columns]
+
+    def trait_means(self, answers):
+        # (n, T) means of the answered items per trait and the answer counts.
+        sums = (answers.astype(np.float32) @ self.trait_matrix).astype(np.float64)
+        counts = ((answers > 0).astype(np.float32) @ self.trait_matrix).astype(np.float64)
+        return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0), counts
+
+    def log_posterior(self, answers):
+        # (n, T, Q): the prior plus, per trait and answer category, the mask
+        # of respondents giving that answer times the items' log-probabilities.
+        log_posterior = np.empty((len(answers), len(self.traits), len(QUADRATURE)))
+        log_posterior[:] = LOG_PRIOR
+        for code, (columns, log_probs) in enumerate(zip(self.trait_columns, self.log_probs)):
+            if not len(columns):
+                continue
+            trait_answers = answers[:, columns]
+            for category in range(NUM_CATEGORIES):
+                log_posterior[:, code] += (trait_answers == category + 1).astype(np.float64) @ log_probs[category]
+        return log_posterior
+
+
+def score_chunk(model, answers, ids, timestamp):
+    # The output rows of one chunk, formatted like build_result_row.
+    means, counts = model.trait_means(answers)
+    answered = counts > 0
+    masked = np.where(answered, means, -np.inf)
+    dominant = masked.argmax(axis=1)
+    any_answered = answered.any(axis=1)
+    names = np.array(model.traits + (UNDETERMINED_TRAIT,), dtype=object)
+    n = len(answers)
+    out = {
+        RESULT_HEADERS[0]: ids["test_date"] if "test_date" in ids else np.full(n, timestamp, dtype=object),
+        RESULT_HEADERS[1]: ids.get("name", np.full(n, "N/A", dtype=object)),
+        RESULT_HEADERS[2]: ids.get("age", np.full(n, "N/A", dtype=object)),
+        RESULT_HEADERS[3]: ids.get("location", np.full(n, "N/A", dtype=object)),
+        RESULT_HEADERS[4]: names[np.where(any_answered, dominant, len(model.traits))],
+    }
+    # Rows follow TRAITS because the item bank is built with TRAITS first.
+    for code, header in enumerate(RESULT_HEADERS[5:5 + len(TRAITS)]):
+        out[header] = np.char.mod("%.2f", means[:, code])
+    out[RESULT_HEADERS[-1]] = np.char.mod("%.2f", np.where(any_answered, masked.max(axis=1), 0.0))
+    if model.log_probs is not None:
+        # Rounded first, like calculate_results, so -0.0004 prints as 0.000.
+        thetas, standard_errors = ability_estimates(model.log_posterior(answers))
+        estimates = np.hstack([thetas[:, :len(TRAITS)], standard_errors[:, :len(TRAITS)]])
+        for column, header in enumerate(THETA_HEADERS):
+            out[header] = np.char.mod("%.3f", np.round(estimates[:, column], 3) + 0.0)
+    return pd.DataFrame(out)
+
+# Each pool worker receives the model once, through the initializer.
+_worker_model = None
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+def _score_job(job):
+    return score_chunk(_worker_model, *job)
+
+# ==============================================================================
+# 2. Streaming Input and Output
+# ==============================================================================
+def read_columns(path):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+def iter_chunks(path, columns, id_columns, chunk_rows=CHUNK_ROWS):
+    id_dtypes = {column: str for column in id_columns}
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, dtype=id_dtypes, chunksize=chunk_rows)
+
+
+class ResultWriter:
+    # Appends scored chunks to a CSV (UTF-8 with BOM so spreadsheet apps show
+    # the Arabic headers) or a Parquet file, chosen by the extension.
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._parquet = None
+        self._file = None
+
+    def write(self, frame):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame.astype(str), preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            if self._file is None:
+                self._file = open(self.path, "w", encoding="utf-8-sig", newline="")
+            frame.to_csv(self._file, header=self.rows == 0, index=False)
+        self.rows += len(frame)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def score_file(source, bank, output, with_theta=False, workers=1, chunk_rows=CHUNK_ROWS, item_prefix=""):
+    # Returns (respondents, invalid cells, matched item columns).
+    columns = read_columns(source)
+    item_columns, positions, id_columns = match_columns(columns, bank, item_prefix)
+    if not item_columns:
+        raise ValueError("لا توجد أعمدة في ملف الإجابات تطابق أسئلة البنك.")
+    ignored = len(columns) - len(item_columns) - len(id_columns)
+    if ignored:
+        logger.warning("Ignoring %d columns that are neither items nor respondent fields", ignored)
+    model = ScoringModel(bank, positions, with_theta)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    invalid = 0
+
+    def jobs():
+        nonlocal invalid
+        for chunk in iter_chunks(source, item_columns + list(id_columns.values()), id_columns.values(), chunk_rows):
+            answers, bad = response_matrix(chunk[item_columns])
+            invalid += bad
+            ids = {field: chunk[column].fillna("N/A").to_numpy(dtype=object) for field, column in id_columns.items()}
+            yield answers, ids, timestamp
+
+    writer = ResultWriter(output)
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+                pending = deque()
+                for job in jobs():
+                    pending.append(pool.submit(_score_job, job))
+                    if len(pending) >= workers * MAX_PENDING_PER_WORKER:
+                        writer.write(pending.popleft().result())
+                while pending:
+                    writer.write(pending.popleft().result())
+        else:
+            for job in jobs():
+                writer.write(score_chunk(model, *job))
+    finally:
+        writer.close()
+    return writer.rows, invalid, len(item_columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a file of complete responses in bulk.")
+    parser.add_argument("responses", help="CSV or Parquet, one row per respondent and one column per item")
+    parser.add_argument("-o", "--output", help="scores as CSV or Parquet (default: <responses>.scores.csv)")
+    parser.add_argument("--bank", default="edit.xlsx")
+    parser.add_argument("--theta", action="store_true", help="also report model-based theta and its SE per trait")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--item-prefix", default="", help="prefix of item column names before the row label")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    output = args.output or os.path.splitext(args.responses)[0] + ".scores.csv"
+    rows, invalid, items = score_file(
+        args.responses, load_shared_bank(args.bank, TRAITS), output, args.theta, args.workers, args.chunk_rows,
+        args.item_prefix
+    )
+    if invalid:
+        logger.warning("%d cells were not valid answers and were treated as blank", invalid)
+    print(f"Scored {rows} respondents on {items} items to {output} in {time.perf_counter() - started:.1f}s")
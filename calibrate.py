@@ -0,0 +1,442 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from adaptive_engine import (
+    BOUNDARY_OFFSETS, LOG_PRIOR, NUM_CATEGORIES, PARAM_COLUMNS, QUADRATURE, QUESTION_COLUMN, TRAIT_COLUMN,
+    compute_item_keys
+)
+from atomic_file import atomic_write
+from question_bank import PARAM_DEFAULTS, load_question_bank
+from response_log import RESPONSE_LOG_DIR, iter_parts
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Calibration Settings
+# ==============================================================================
+# Offline re-estimation of the item parameters from the response log, one
+# trait at a time: marginal maximum likelihood by EM (Bock-Aitkin) over the
+# engine's quadrature grid and N(0, 1) ability prior. The log is read once,
+# CHUNK_RESPONSES rows at a time, and spooled to disk per trait in chunks of
+# whole respondents; every E-step maps one chunk at a time and reads
+# log-probabilities from a per-item table. Memory is bounded by a few chunks
+# (CHUNK_RESPONSES x grid size for the E-step), not by the log. The M-step
+# is a few Fisher-scoring steps for all items of the trait at once.
+CHUNK_RESPONSES = 65536
+MAX_EM_ITERATIONS = 200
+# EM stops once no parameter moves by more than this between iterations.
+CONVERGENCE_TOLERANCE = 1e-3
+M_STEP_ITERATIONS = 3
+MAX_STEP = 0.5
+MAX_STEP_HALVINGS = 6
+# Items with fewer responses keep their current parameters.
+MIN_ITEM_RESPONSES = 50
+# "ab" estimates discrimination and location with c/d fixed at their current
+# values; "abcd" also estimates the asymptotes, which needs a lot of data.
+FIT_PARAMS = "ab"
+PARAM_BOUNDS = {"a": (0.2, 4.0), "b": (-4.0, 4.0), "c": (0.0, 0.3), "d": (0.0, 0.3)}
+# Weak priors keep poorly identified items finite (Bayes modal estimation):
+# log a ~ N(0, A_PRIOR_SD), b ~ N(0, B_PRIOR_SD), c and d ~ Beta(1, ASYMPTOTE_PRIOR_BETA).
+A_PRIOR_SD = 0.5
+B_PRIOR_SD = 2.0
+ASYMPTOTE_PRIOR_BETA = 20.0
+CALIBRATED_SUFFIX = ".calibrated.xlsx"
+
+def calibrated_path(source):
+    return os.path.splitext(source)[0] + CALIBRATED_SUFFIX
+
+# ==============================================================================
+# 1. Response Data
+# ==============================================================================
+# One matched response on its way through the spool.
+SPOOL_DTYPE = np.dtype([("item", "<i4"), ("category", "i1"), ("session", "<u8")])
+# Per-trait chunk arrays, each one flat int32 file in the spool directory.
+CHUNK_ARRAYS = ("cells", "lengths", "cell_order", "chunk_cells", "cell_starts")
+
+def bank_item_keys(bank_df):
+    # ItemBank.item_keys for the rows of a question DataFrame.
+    return compute_item_keys(bank_df[TRAIT_COLUMN].astype(str), bank_df[QUESTION_COLUMN].astype(str))
+
+def count_logged_rows(directory=RESPONSE_LOG_DIR, start_date=None, end_date=None):
+    # Only reads the part headers.
+    return sum(len(part) for part in iter_parts(directory, start_date, end_date))
+
+def logged_responses(bank_df, directory=RESPONSE_LOG_DIR, start_date=None, end_date=None,
+                     chunk_responses=CHUNK_RESPONSES):
+    # (item, category, session) batches for every logged answer to an item of
+    # this bank, matched on the stable item key, so answers given under older
+    # bank versions (other rows added, removed or sorted since) still count
+    # for the right item. Parts are memory-mapped and read chunk_responses
+    # rows at a time.
+    keys = bank_item_keys(bank_df)
+    if not len(keys):
+        return
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    for part in iter_parts(directory, start_date, end_date):
+        for begin in range(0, len(part), chunk_responses):
+            rows = part[begin:begin + chunk_responses]
+            item_key = np.asarray(rows["item_key"])
+            response = np.asarray(rows["response"])
+            found = np.minimum(np.searchsorted(sorted_keys, item_key), len(keys) - 1)
+            valid = (sorted_keys[found] == item_key) & (response >= 1) & (response <= NUM_CATEGORIES)
+            yield (order[found[valid]].astype(np.int32), (response[valid] - 1).astype(np.int8),
+                   np.asarray(rows["session_id"])[valid])
+
+
+class TraitResponses:
+    # One trait's responses, spooled to flat files in chunks of whole
+    # respondents: `cells` is item * K + category per response, sorted by
+    # respondent, `lengths` the respondents' response counts, and
+    # `cell_order` (with the chunk's distinct cells and where each starts)
+    # the sort that groups a chunk's responses by cell. None of it changes
+    # between iterations; chunks() maps one chunk at a time.
+    def __init__(self, directory, num_items):
+        self.directory = directory
+        self.num_items = num_items
+        self.item_counts = np.zeros(num_items, dtype=np.int64)
+        self.num_persons = 0
+        self.num_responses = 0
+        # Per chunk, the (offset, length) of each of its arrays in the files.
+        self.extents = []
+        self._sizes = dict.fromkeys(CHUNK_ARRAYS, 0)
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.i4")
+
+    def add_chunk(self, items, categories, sessions):
+        order = np.argsort(sessions, kind="stable")
+        sessions = sessions[order]
+        cells = (items[order] * NUM_CATEGORIES + categories[order]).astype(np.int32)
+        person_starts = np.flatnonzero(np.r_[True, sessions[1:] != sessions[:-1]])
+        cell_order = np.argsort(cells, kind="stable")
+        sorted_cells = cells[cell_order]
+        cell_starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        arrays = (cells, np.diff(np.r_[person_starts, len(cells)]), cell_order, sorted_cells[cell_starts], cell_starts)
+        extent = []
+        for name, array in zip(CHUNK_ARRAYS, arrays):
+            with open(self._path(name), "ab") as f:
+                f.write(array.astype(np.int32).tobytes())
+            extent.append((self._sizes[name], len(array)))
+            self._sizes[name] += len(array)
+        self.extents.append(extent)
+        self.item_counts += np.bincount(items, minlength=self.num_items)
+        self.num_persons += len(person_starts)
+        self.num_responses += len(cells)
+
+    def chunks(self):
+        # (cells, lengths, cell_order, chunk_cells, cell_starts) per chunk,
+        # as read-only views of the mapped files.
+        if not self.extents:
+            return
+        maps = [np.memmap(self._path(name), dtype=np.int32, mode="r") for name in CHUNK_ARRAYS]
+        for extent in self.extents:
+            yield tuple(mapped[offset:offset + length] for mapped, (offset, length) in zip(maps, extent))
+
+
+def _append_to_buckets(records, paths):
+    buckets = records["session"] % np.uint64(len(paths))
+    order = np.argsort(buckets, kind="stable")
+    bounds = np.searchsorted(buckets[order], np.arange(len(paths) + 1))
+    records = records[order]
+    for bucket in np.flatnonzero(np.diff(bounds)):
+        with open(paths[bucket], "ab") as f:
+            f.write(records[bounds[bucket]:bounds[bucket + 1]].tobytes())
+
+def _add_trait_chunk(data, records, local):
+    data.add_chunk(local[records["item"]], records["category"], records["session"])
+
+def spool_responses(bank_df, batches, total_rows, directory, chunk_responses=CHUNK_RESPONSES):
+    # {trait: TraitResponses} from a stream of (item, category, session)
+    # batches (items are bank_df row positions). The first pass appends
+    # every batch to one of about total_rows / chunk_responses bucket files
+    # by session id: ids are random, so buckets hold about a chunk each and
+    # a respondent never spans two. The second pass reads one bucket at a
+    # time and writes a trait's chunk once it has chunk_responses responses
+    # waiting, so memory stays within a few chunks.
+    num_buckets = max(1, -(-total_rows // chunk_responses))
+    bucket_paths = [os.path.join(directory, f"bucket-{bucket}.bin") for bucket in range(num_buckets)]
+    waiting = []
+    waiting_rows = 0
+    for items, categories, sessions in batches:
+        records = np.empty(len(items), dtype=SPOOL_DTYPE)
+        records["item"], records["category"], records["session"] = items, categories, sessions
+        waiting.append(records)
+        waiting_rows += len(records)
+        if waiting_rows >= chunk_responses:
+            _append_to_buckets(np.concatenate(waiting), bucket_paths)
+            waiting, waiting_rows = [], 0
+    if waiting:
+        _append_to_buckets(np.concatenate(waiting), bucket_paths)
+
+    trait_codes, traits = pd.factorize(bank_df[TRAIT_COLUMN])
+    local = np.empty(len(bank_df), dtype=np.int32)
+    responses = {}
+    for code, trait in enumerate(traits):
+        member = np.flatnonzero(trait_codes == code)
+        local[member] = np.arange(len(member), dtype=np.int32)
+        trait_dir = os.path.join(directory, f"trait-{code}")
+        os.makedirs(trait_dir)
+        responses[trait] = TraitResponses(trait_dir, len(member))
+    pending = {trait: [] for trait in traits}
+    pending_rows = dict.fromkeys(traits, 0)
+    for path in bucket_paths:
+        if not os.path.exists(path):
+            continue
+        records = np.fromfile(path, dtype=SPOOL_DTYPE)
+        os.remove(path)
+        codes = trait_codes[records["item"]]
+        for code in np.unique(codes):
+            trait = traits[code]
+            pending[trait].append(records[codes == code])
+            pending_rows[trait] += len(pending[trait][-1])
+            if pending_rows[trait] >= chunk_responses:
+                _add_trait_chunk(responses[trait], np.concatenate(pending[trait]), local)
+                pending[trait], pending_rows[trait] = [], 0
+    for trait, chunk in pending.items():
+        if chunk:
+            _add_trait_chunk(responses[trait], np.concatenate(chunk), local)
+    return {trait: data for trait, data in responses.items() if data.num_responses}
+
+# ==============================================================================
+# 2. Graded 4PL Terms
+# ==============================================================================
+def category_terms(params):
+    # Category probabilities (K, J, Q) and their derivatives w.r.t. a/b/c/d
+    # (4, K, J, Q) at every quadrature node, for params shaped (4, J).
+    a, b, c, d = (row[:, None] for row in params)
+    x = QUADRATURE - b - BOUNDARY_OFFSETS[:, None, None]
+    sig = 1.0 / (1.0 + np.exp(-a * x))
+    scale = 1.0 - c - d
+    slope = scale * sig * (1.0 - sig)
+    boundary = c + scale * sig
+    boundary_derivs = np.stack([slope * x, -a * slope, 1.0 - sig, -sig])
+    probs = np.empty((NUM_CATEGORIES,) + boundary.shape[1:])
+    derivs = np.empty((4, NUM_CATEGORIES) + boundary.shape[1:])
+    probs[0] = 1.0 - boundary[0]
+    probs[1:-1] = boundary[:-1] - boundary[1:]
+    probs[-1] = boundary[-1]
+    derivs[:, 0] = -boundary_derivs[:, 0]
+    derivs[:, 1:-1] = boundary_derivs[:, :-1] - boundary_derivs[:, 1:]
+    derivs[:, -1] = boundary_derivs[:, -1]
+    np.maximum(probs, 1e-12, out=probs)
+    return probs, derivs
+
+def log_prob_table(params):
+    # (J * K, Q): row item * K + category, the layout of TraitResponses.cells.
+    probs, _ = category_terms(params)
+    return np.log(probs).transpose(1, 0, 2).reshape(-1, len(QUADRATURE))
+
+# ==============================================================================
+# 3. EM
+# ==============================================================================
+def e_step(params, data):
+    # Expected (item, category, node) counts under the current parameters,
+    # plus the marginal log-likelihood.
+    table = log_prob_table(params)
+    counts = np.zeros((data.num_items * NUM_CATEGORIES, len(QUADRATURE)))
+    log_likelihood = 0.0
+    for cells, lengths, cell_order, chunk_cells, cell_starts in data.chunks():
+        starts = np.r_[0, np.cumsum(lengths[:-1])]
+        person_ll = np.add.reduceat(table[cells], starts, axis=0) + LOG_PRIOR
+        peak = person_ll.max(axis=1, keepdims=True)
+        weights = np.exp(person_ll - peak)
+        total = weights.sum(axis=1, keepdims=True)
+        log_likelihood += float(np.sum(peak + np.log(total)))
+        weights /= total
+        # Each response carries its respondent's posterior; summing those per
+        # cell is one reduceat over the chunk's responses grouped by cell.
+        response_weights = np.repeat(weights, lengths, axis=0)
+        counts[chunk_cells] += np.add.reduceat(response_weights[cell_order], cell_starts, axis=0)
+    return counts.reshape(data.num_items, NUM_CATEGORIES, -1), log_likelihood
+
+def prior_terms(params):
+    # Gradient and curvature (as positive information) of the log prior, (4, J) each.
+    a, b, c, d = params
+    beta = ASYMPTOTE_PRIOR_BETA - 1.0
+    grad = np.stack([
+        -np.log(a) / (A_PRIOR_SD ** 2 * a) - 1.0 / a,
+        -b / B_PRIOR_SD ** 2,
+        -beta / (1.0 - c),
+        -beta / (1.0 - d),
+    ])
+    info = np.stack([
+        1.0 / (A_PRIOR_SD ** 2 * a ** 2),
+        np.full_like(b, 1.0 / B_PRIOR_SD ** 2),
+        beta / (1.0 - c) ** 2,
+        beta / (1.0 - d) ** 2,
+    ])
+    return grad, info
+
+def log_prior(params):
+    a, b, c, d = params
+    beta = ASYMPTOTE_PRIOR_BETA - 1.0
+    return (-np.log(a) ** 2 / (2 * A_PRIOR_SD ** 2) - np.log(a) - b ** 2 / (2 * B_PRIOR_SD ** 2)
+            + beta * (np.log1p(-c) + np.log1p(-d)))
+
+def expected_objective(params, counts):
+    # Per-item expected complete-data log-likelihood plus log prior, (J,).
+    probs, _ = category_terms(params)
+    return np.einsum("kjq,kjq->j", counts.transpose(1, 0, 2), np.log(probs)) + log_prior(params)
+
+def m_step(params, counts, free):
+    # Fisher scoring on the expected complete-data log-likelihood, every item
+    # at once; `free` masks the a/b/c/d rows being estimated. A step that
+    # would lower an item's objective is halved, so each EM iteration climbs.
+    lower = np.array([PARAM_BOUNDS[name][0] for name in PARAM_COLUMNS])[:, None]
+    upper = np.array([PARAM_BOUNDS[name][1] for name in PARAM_COLUMNS])[:, None]
+    node_totals = counts.sum(axis=1)
+    observed = counts.transpose(1, 0, 2)
+    fixed = ~free
+    objective = expected_objective(params, counts)
+    for _ in range(M_STEP_ITERATIONS):
+        probs, derivs = category_terms(params)
+        grad = np.einsum("kjq,pkjq->pj", observed / probs, derivs)
+        info = np.einsum("jq,pkjq,rkjq->jpr", node_totals, derivs, derivs / probs)
+        prior_grad, prior_info = prior_terms(params)
+        grad += prior_grad
+        info[:, np.arange(4), np.arange(4)] += prior_info.T
+        grad[fixed] = 0.0
+        info[:, fixed, :] = 0.0
+        info[:, :, fixed] = 0.0
+        info[:, fixed, fixed] = 1.0
+        step = np.clip(np.linalg.solve(info, grad.T[..., None])[..., 0].T, -MAX_STEP, MAX_STEP)
+        for _ in range(MAX_STEP_HALVINGS):
+            candidate = np.clip(params + step, lower, upper)
+            candidate_objective = expected_objective(candidate, counts)
+            better = candidate_objective >= objective
+            params = np.where(better, candidate, params)
+            objective = np.where(better, candidate_objective, objective)
+            if better.all():
+                break
+            step = np.where(better, 0.0, step / 2)
+    return params
+
+def fit_trait(params, data, fit=FIT_PARAMS, max_iterations=MAX_EM_ITERATIONS, tolerance=CONVERGENCE_TOLERANCE):
+    # EM for one trait's items; params (4, J) are the starting values.
+    free = np.array([name in fit for name in PARAM_COLUMNS])
+    lower = np.array([PARAM_BOUNDS[name][0] for name in PARAM_COLUMNS])[:, None]
+    upper = np.array([PARAM_BOUNDS[name][1] for name in PARAM_COLUMNS])[:, None]
+    params = np.clip(np.array(params, dtype=np.float64), lower, upper)
+    log_likelihood = None
+    for iteration in range(1, max_iterations + 1):
+        counts, log_likelihood = e_step(params, data)
+        updated = m_step(params, counts, free)
+        change = float(np.max(np.abs(updated - params))) if updated.size else 0.0
+        params = updated
+        if change < tolerance:
+            break
+    return params, {"iterations": iteration, "log_likelihood": log_likelihood, "max_change": change}
+
+def _fit_job(job):
+    trait, params, data, fit, max_iterations, tolerance = job
+    start = time.perf_counter()
+    params, report = fit_trait(params, data, fit, max_iterations, tolerance)
+    report.update(trait=trait, items=data.num_items, persons=data.num_persons, responses=data.num_responses,
+                  seconds=round(time.perf_counter() - start, 2))
+    return params, report
+
+def calibrate(bank_df, responses, fit=FIT_PARAMS, workers=1, min_responses=MIN_ITEM_RESPONSES,
+              max_iterations=MAX_EM_ITERATIONS, tolerance=CONVERGENCE_TOLERANCE):
+    # Returns the new (J, 4) parameter matrix of the whole bank, which items
+    # it re-estimated, and one report per trait, for the spool_responses()
+    # result `responses`. Traits are independent, so with workers > 1 they
+    # are fitted in a process pool.
+    params = bank_df[PARAM_COLUMNS].to_numpy(dtype=np.float64).copy()
+    trait_of_item = bank_df[TRAIT_COLUMN].to_numpy()
+    jobs, members = [], []
+    for trait, data in responses.items():
+        member = np.flatnonzero(trait_of_item == trait)
+        jobs.append((trait, params[member].T, data, fit, max_iterations, tolerance))
+        members.append(member)
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_fit_job, jobs))
+    else:
+        results = [_fit_job(job) for job in jobs]
+    calibrated = np.zeros(len(bank_df), dtype=bool)
+    reports = []
+    for member, (_, _, data, *_), (fitted, report) in zip(members, jobs, results):
+        enough = data.item_counts >= min_responses
+        params[member[enough]] = fitted.T[enough]
+        calibrated[member[enough]] = True
+        report["calibrated_items"] = int(enough.sum())
+        reports.append(report)
+    return params, calibrated, reports
+
+# ==============================================================================
+# 4. Writing the Calibrated Bank
+# ==============================================================================
+def write_calibrated_bank(source, target, bank_df, params, calibrated):
+    # The source spreadsheet with a/b/c/d replaced for the calibrated items,
+    # so load_questions_data() reads it like any other bank. Rows are found
+    # by item key, not position, in case the sheet changed since it was
+    # loaded; returns the number of rows updated.
+    df = pd.read_excel(source)
+    for column, default in PARAM_DEFAULTS.items():
+        if column not in df.columns:
+            df[column] = default
+    keys = bank_item_keys(bank_df)[calibrated]
+    if len(keys):
+        order = np.argsort(keys, kind="stable")
+        keys, fitted = keys[order], params[calibrated][order]
+        rows = df.index[df[QUESTION_COLUMN].notnull()]
+        row_keys = bank_item_keys(df.loc[rows])
+        found = np.minimum(np.searchsorted(keys, row_keys), len(keys) - 1)
+        matched = keys[found] == row_keys
+        df.loc[rows[matched], PARAM_COLUMNS] = fitted[found[matched]]
+        updated = int(matched.sum())
+    else:
+        updated = 0
+    # Written to a temporary file and renamed, so the bank registry never
+    # reloads a half-written spreadsheet when target is the live bank.
+    with atomic_write(target) as f:
+        df.to_excel(f, index=False, engine="openpyxl")
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-estimate item parameters from the response log.")
+    parser.add_argument("source", nargs="?", default="edit.xlsx")
+    parser.add_argument("-o", "--output", help="calibrated spreadsheet (default: <source>.calibrated.xlsx)")
+    parser.add_argument("--log-dir", default=RESPONSE_LOG_DIR)
+    parser.add_argument("--start-date", help="first log date to use, YYYY-MM-DD")
+    parser.add_argument("--end-date", help="last log date to use, YYYY-MM-DD")
+    parser.add_argument("--spool-dir", help="where to spool the matched responses (default: the system temp dir)")
+    parser.add_argument("--fit", choices=["ab", "abcd"], default=FIT_PARAMS)
+    parser.add_argument("--workers", type=int, default=1, help="fit traits in this many processes")
+    parser.add_argument("--min-responses", type=int, default=MIN_ITEM_RESPONSES)
+    parser.add_argument("--max-iterations", type=int, default=MAX_EM_ITERATIONS)
+    parser.add_argument("--tolerance", type=float, default=CONVERGENCE_TOLERANCE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    bank = load_question_bank(args.source)
+    with tempfile.TemporaryDirectory(prefix="calibrate-", dir=args.spool_dir) as spool_dir:
+        batches = logged_responses(bank, args.log_dir, args.start_date, args.end_date)
+        total_rows = count_logged_rows(args.log_dir, args.start_date, args.end_date)
+        responses = spool_responses(bank, batches, total_rows, spool_dir)
+        num_responses = sum(data.num_responses for data in responses.values())
+        answered = sum(int((data.item_counts > 0).sum()) for data in responses.values())
+        print(f"Loaded {num_responses} of {total_rows} logged responses, to {answered} of {len(bank)} items, "
+              f"in {time.perf_counter() - started:.1f}s")
+        if not num_responses:
+            raise SystemExit("No logged responses match this bank.")
+        params, calibrated, reports = calibrate(
+            bank, responses, args.fit, args.workers, args.min_responses, args.max_iterations, args.tolerance
+        )
+    for report in reports:
+        print(f"{report['trait']}: {report['calibrated_items']}/{report['items']} items, "
+              f"{report['persons']} respondents, {report['responses']} responses, "
+              f"{report['iterations']} EM iterations, log-likelihood {report['log_likelihood']:.1f}, {report['seconds']}s")
+    output = args.output or calibrated_path(args.source)
+    updated = write_calibrated_bank(args.source, output, bank, params, calibrated)
+    print(f"Wrote {updated} calibrated items to {output} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,329 @@
+import bisect
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Settings
+# ==============================================================================
+# Process-wide timings and counters, cheap enough to leave on: a timed call
+# costs two perf_counter reads, a bisect and a locked increment. Everything
+# is exported in the Prometheus text format, to a file rewritten every
+# EXPORT_INTERVAL_SECONDS (for node_exporter's textfile collector or a
+# sidecar) and optionally over HTTP.
+METRICS_PREFIX = "adaptivetest"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EXPORT_INTERVAL_SECONDS = 15.0
+# The optional sampling profiler records every thread's stack this often and
+# writes folded stacks ("frame;frame;frame count"), the input format of
+# flamegraph.pl and speedscope.
+PROFILE_INTERVAL_SECONDS = 0.01
+PROFILE_MAX_DEPTH = 64
+
+# ==============================================================================
+# 1. Metric Types
+# ==============================================================================
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count", "_lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; cumulated when rendered.
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+
+class Registry:
+    # Series are keyed by (name, sorted label pairs). Counters and histograms
+    # are created on first use; gauges are callbacks read at export time, so
+    # queue depths cost nothing until scraped.
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, amount=1, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def histogram(self, name, labels=(), buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        found = self._histograms.get(key)
+        if found is None:
+            with self._lock:
+                found = self._histograms.setdefault(key, Histogram(buckets))
+        return found
+
+    def gauge(self, name, read, labels=()):
+        with self._lock:
+            self._gauges[(name, labels)] = read
+
+    def counter_value(self, name, labels=()):
+        return self._counters.get((name, labels), 0)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            gauges = sorted(self._gauges.items(), key=lambda item: item[0])
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges), ("histogram", histograms)):
+            previous = None
+            for (name, labels), value in series:
+                full_name = f"{self.prefix}_{name}"
+                if name != previous:
+                    if name in self._help:
+                        lines.append(f"# HELP {full_name} {self._help[name]}")
+                    lines.append(f"# TYPE {full_name} {kind}")
+                    previous = name
+                if kind == "counter":
+                    lines.append(f"{full_name}{_labels(labels)} {value}")
+                elif kind == "gauge":
+                    try:
+                        lines.append(f"{full_name}{_labels(labels)} {float(value())}")
+                    except Exception as e:
+                        logger.warning("Gauge %s failed: %s", name, e)
+                else:
+                    counts, total, count = value.snapshot()
+                    cumulative = 0
+                    for bound, bucket_count in zip(value.buckets + (float("inf"),), counts):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{full_name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{full_name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{full_name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def label_pairs(labels):
+    return tuple(sorted(labels.items()))
+
+REGISTRY = Registry()
+REGISTRY.describe("function_seconds", "Wall time of instrumented functions.")
+REGISTRY.describe("function_errors_total", "Instrumented calls that raised.")
+REGISTRY.describe("external_calls_total", "Calls to external services.")
+REGISTRY.describe("external_call_failures_total", "Failed calls to external services.")
+
+# ==============================================================================
+# 2. Instrumentation Helpers
+# ==============================================================================
+def inc(name, amount=1, **labels):
+    REGISTRY.inc(name, amount, label_pairs(labels))
+
+def gauge(name, read, **labels):
+    REGISTRY.gauge(name, read, label_pairs(labels))
+
+
+class timer:
+    # `with timer("calculate_results"):` records the block's wall time in the
+    # function_seconds histogram and counts it as an error if it raises.
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, function):
+        self.labels = (("function", function),)
+        self.histogram = REGISTRY.histogram("function_seconds", self.labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+        if error_type is not None:
+            REGISTRY.inc("function_errors_total", 1, self.labels)
+        return False
+
+
+def timed(function=None, name=None):
+    # Decorator form of timer; the histogram is looked up once, at decoration.
+    # A coroutine function is timed from call to completion, awaits included.
+    def decorate(func):
+        labels = (("function", name or func.__name__),)
+        histogram = REGISTRY.histogram("function_seconds", labels)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    REGISTRY.inc("function_errors_total", 1, labels)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                REGISTRY.inc("function_errors_total", 1, labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate(function) if function is not None else decorate
+
+
+def external_call(service, operation):
+    # Counts one call to an external service; pair with external_failure().
+    REGISTRY.inc("external_calls_total", 1, (("operation", operation), ("service", service)))
+
+def external_failure(service, operation):
+    REGISTRY.inc("external_call_failures_total", 1, (("operation", operation), ("service", service)))
+
+# ==============================================================================
+# 3. Export
+# ==============================================================================
+def render_prometheus():
+    return REGISTRY.render()
+
+def write_metrics_file(path):
+    # Rewritten atomically so a scraper never reads half a file.
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsExporter:
+    def __init__(self, path=None, port=None, interval=EXPORT_INTERVAL_SECONDS):
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.server = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.port is not None:
+            self.server = ThreadingHTTPServer(("0.0.0.0", self.port), _MetricsHandler)
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        if self.path:
+            threading.Thread(target=self._run, name="metrics-file", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                write_metrics_file(self.path)
+            except OSError as e:
+                logger.warning("Could not write metrics file %s: %s", self.path, e)
+
+# ==============================================================================
+# 4. Sampling Profiler
+# ==============================================================================
+class SamplingProfiler:
+    # Off by default. While running, a daemon thread samples the stacks of
+    # all other threads every `interval` seconds; the cost is one
+    # sys._current_frames() walk per sample and nothing on the request path.
+    def __init__(self, path, interval=PROFILE_INTERVAL_SECONDS, max_depth=PROFILE_MAX_DEPTH,
+                 write_interval=EXPORT_INTERVAL_SECONDS):
+        self.path = path
+        self.interval = interval
+        self.max_depth = max_depth
+        self.write_interval = write_interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(frames))] += 1
+        self.samples += 1
+
+    def write(self):
+        stacks = list(self.stacks.items())
+        with atomic_write(self.path, "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self):
+        next_write = time.monotonic() + self.write_interval
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if time.monotonic() >= next_write:
+                next_write += self.write_interval
+                try:
+                    self.write()
+                except OSError as e:
+                    logger.warning("Could not write profile %s: %s", self.path, e)
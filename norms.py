@@ -0,0 +1,173 @@
+import logging
+import threading
+
+import numpy as np
+
+from metrics import external_call, external_failure
+from results import RESULT_HEADERS
+from settings import TRAITS
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Population Norms
+# ==============================================================================
+# Percentile lookups against everyone who took the test, built from the
+# results sheet. A daemon thread reads only the rows it has not seen yet, in
+# ranged reads of at most READ_CHUNK_ROWS, every REFRESH_INTERVAL_SECONDS,
+# and publishes an immutable snapshot of per-trait sorted score arrays
+# (overall and per age band). A results page only binary-searches the
+# current snapshot and never reads the sheet itself.
+REFRESH_INTERVAL_SECONDS = 300.0
+READ_CHUNK_ROWS = 500
+MAX_CHUNKS_PER_REFRESH = 20
+# Percentiles need this many respondents; an age band with fewer falls back
+# to everyone.
+MIN_SAMPLE_SIZE = 30
+AGE_BANDS = ((13, 17), (18, 24), (25, 34), (35, 49), (50, 120))
+
+_AGE_COLUMN = RESULT_HEADERS.index('السن')
+_SCORE_COLUMNS = [RESULT_HEADERS.index(f"درجة {trait}") for trait in TRAITS]
+
+def age_band(age):
+    try:
+        age = float(age)
+    except (TypeError, ValueError):
+        return None
+    for band, (low, high) in enumerate(AGE_BANDS):
+        if low <= age <= high:
+            return band
+    return None
+
+def column_letter(column):
+    letters = ""
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+def parse_rows(rows):
+    # (age band, scores) per well-formed row; a trait nobody was asked about
+    # is saved as 0.00 and left out of that trait's norms.
+    bands, scores = [], []
+    for row in rows:
+        try:
+            values = [float(row[column]) for column in _SCORE_COLUMNS]
+        except (IndexError, ValueError):
+            continue
+        bands.append(age_band(row[_AGE_COLUMN]))
+        scores.append(values)
+    return bands, np.array(scores, dtype=np.float64).reshape(-1, len(TRAITS))
+
+
+class NormsSnapshot:
+    # Read-only: `sorted_scores[band][t]` is trait t's sorted float32 array,
+    # band None meaning all respondents.
+    __slots__ = ("sorted_scores", "rows_read")
+
+    def __init__(self, sorted_scores, rows_read):
+        self.sorted_scores = sorted_scores
+        self.rows_read = rows_read
+
+    def sample_size(self, trait_index, band=None):
+        arrays = self.sorted_scores.get(band)
+        return len(arrays[trait_index]) if arrays else 0
+
+    def percentile(self, trait_index, score, age=None):
+        # Mid-rank percentile (ties count half) in O(log n); None while there
+        # are too few respondents.
+        band = age_band(age)
+        if self.sample_size(trait_index, band) < MIN_SAMPLE_SIZE:
+            band = None
+        values = self.sorted_scores[band][trait_index]
+        if len(values) < MIN_SAMPLE_SIZE:
+            return None
+        # Compared in the arrays' float32, or a stored 2.33 (2.3299999)
+        # would sort below the float64 2.33 and ties would count as below.
+        score = values.dtype.type(score)
+        below = np.searchsorted(values, score, side="left")
+        not_above = np.searchsorted(values, score, side="right")
+        return 100.0 * (below + not_above) / (2 * len(values))
+
+    def merged(self, bands, scores, rows_read):
+        # New snapshot with the given rows merged into every affected array.
+        sorted_scores = dict(self.sorted_scores)
+        keys = {None} | set(band for band in bands if band is not None)
+        band_array = np.array([-1 if band is None else band for band in bands])
+        for key in keys:
+            selected = scores if key is None else scores[band_array == key]
+            if not len(selected):
+                continue
+            old = sorted_scores.get(key) or [np.empty(0, dtype=np.float32)] * len(TRAITS)
+            arrays = []
+            for t in range(len(TRAITS)):
+                new = selected[:, t][selected[:, t] > 0].astype(np.float32)
+                arrays.append(np.sort(np.concatenate([old[t], new])) if len(new) else old[t])
+            sorted_scores[key] = arrays
+        return NormsSnapshot(sorted_scores, rows_read)
+
+
+class NormsService:
+    def __init__(self, open_worksheet, refresh_interval=REFRESH_INTERVAL_SECONDS, chunk_rows=READ_CHUNK_ROWS,
+                 max_chunks=MAX_CHUNKS_PER_REFRESH, on_read_error=None):
+        self.open_worksheet = open_worksheet
+        self.refresh_interval = refresh_interval
+        self.chunk_rows = chunk_rows
+        self.max_chunks = max_chunks
+        self.on_read_error = on_read_error
+        self._snapshot = NormsSnapshot({None: [np.empty(0, dtype=np.float32)] * len(TRAITS)}, 0)
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_column = column_letter(len(RESULT_HEADERS))
+
+    def snapshot(self):
+        # Attribute reads are atomic, so requests never wait on a refresh.
+        return self._snapshot
+
+    def refresh(self):
+        # Reads up to max_chunks ranges past the last row seen (row 1 is the
+        # header) and publishes the merged snapshot; returns rows added.
+        with self._refresh_lock:
+            snapshot = self._snapshot
+            worksheet = self.open_worksheet()
+            rows = []
+            next_row = snapshot.rows_read + 2
+            for _ in range(self.max_chunks):
+                last_row = next_row + self.chunk_rows - 1
+                external_call("sheets", "get")
+                try:
+                    chunk = worksheet.get(f"A{next_row}:{self._last_column}{last_row}")
+                except Exception:
+                    external_failure("sheets", "get")
+                    raise
+                rows.extend(chunk)
+                next_row += len(chunk)
+                if len(chunk) < self.chunk_rows:
+                    break
+            if rows:
+                bands, scores = parse_rows(rows)
+                self._snapshot = snapshot.merged(bands, scores, snapshot.rows_read + len(rows))
+            return len(rows)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="norms-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                # Catch up in full chunks before waiting for the next interval.
+                while self.refresh() >= self.chunk_rows * self.max_chunks:
+                    pass
+            except Exception as e:
+                logger.error("Norms refresh failed, keeping %d rows: %s", self._snapshot.rows_read, e)
+                if self.on_read_error is not None:
+                    self.on_read_error()
+            if self._stop.wait(self.refresh_interval):
+                return
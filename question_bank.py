@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from adaptive_engine import PARAM_COLUMNS, QUESTION_COLUMN, TRAIT_COLUMN
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Compiled Bank Format
+# ==============================================================================
+# The spreadsheet is parsed once and compiled to an uncompressed .npz next to
+# it: float64 item parameters, int16 trait codes, the original row labels and
+# the question text as one UTF-8 blob plus int64 offsets. A JSON header
+# records the source's size, mtime and SHA-256 so the artifact is reused until
+# the spreadsheet actually changes.
+FORMAT_VERSION = 1
+COMPILED_SUFFIX = ".bank.npz"
+PARAM_DEFAULTS = {"a": 1.0, "b": 0.0, "c": 0.0, "d": 0.0}
+
+def compiled_path(source):
+    return os.path.splitext(source)[0] + COMPILED_SUFFIX
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_fingerprint(source):
+    stat = os.stat(source)
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns, "source_sha256": file_sha256(source)}
+
+def encode_texts(texts):
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def decode_texts(blob, offsets):
+    data = blob.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+# ==============================================================================
+# 1. Source Parsing and Validation
+# ==============================================================================
+def validate_questions(df):
+    if TRAIT_COLUMN not in df.columns:
+        raise ValueError("ملف الأسئلة يجب أن يحتوي على عمود 'السمة'.")
+    if df[TRAIT_COLUMN].isnull().any():
+        raise ValueError("يوجد أسئلة بدون قيمة في عمود 'السمة'.")
+    params = df[PARAM_COLUMNS]
+    if not np.isfinite(params.to_numpy()).all():
+        raise ValueError("معاملات الأسئلة (a, b, c, d) يجب أن تكون أرقامًا صحيحة.")
+    if ((params["c"] < 0) | (params["d"] < 0) | (params["c"] + params["d"] >= 1)).any():
+        raise ValueError("يجب أن تكون c و d غير سالبة ومجموعهما أقل من 1.")
+
+def read_source_questions(source):
+    df = pd.read_excel(source)
+    df = df[df[QUESTION_COLUMN].notnull()]
+    for column, default in PARAM_DEFAULTS.items():
+        if column not in df.columns:
+            df[column] = default
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype(np.float64)
+    validate_questions(df)
+    df = df[[QUESTION_COLUMN, TRAIT_COLUMN] + PARAM_COLUMNS].copy()
+    df[QUESTION_COLUMN] = df[QUESTION_COLUMN].astype(str)
+    df[TRAIT_COLUMN] = df[TRAIT_COLUMN].astype(str)
+    return df
+
+# ==============================================================================
+# 2. Compile / Load
+# ==============================================================================
+def write_compiled_bank(df, target, fingerprint):
+    traits = list(dict.fromkeys(df[TRAIT_COLUMN]))
+    blob, offsets = encode_texts(df[QUESTION_COLUMN].tolist())
+    header = dict(fingerprint, format_version=FORMAT_VERSION, traits=traits)
+    arrays = {
+        "header": np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+        "params": np.ascontiguousarray(df[PARAM_COLUMNS].to_numpy(dtype=np.float64)),
+        "trait_codes": df[TRAIT_COLUMN].map({t: i for i, t in enumerate(traits)}).to_numpy(dtype=np.int16),
+        "labels": df.index.to_numpy(dtype=np.int64),
+        "text_blob": blob,
+        "text_offsets": offsets,
+    }
+    # Write to a temporary file and rename so readers never see a partial artifact.
+    with atomic_write(target) as f:
+        np.savez(f, **arrays)
+
+def read_compiled_bank(target):
+    with np.load(target, allow_pickle=False) as data:
+        header = json.loads(data["header"].tobytes().decode("utf-8"))
+        if header.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled bank version: {header.get('format_version')}")
+        traits = np.array(header["traits"], dtype=object)
+        df = pd.DataFrame(
+            {
+                QUESTION_COLUMN: decode_texts(data["text_blob"], data["text_offsets"]),
+                TRAIT_COLUMN: traits[data["trait_codes"]],
+            },
+            index=pd.Index(data["labels"]),
+        )
+        for i, column in enumerate(PARAM_COLUMNS):
+            df[column] = data["params"][:, i]
+    return df, header
+
+def compile_question_bank(source, target=None):
+    target = target or compiled_path(source)
+    df = read_source_questions(source)
+    write_compiled_bank(df, target, source_fingerprint(source))
+    return df
+
+def load_question_bank(source, target=None):
+    target = target or compiled_path(source)
+    if not os.path.exists(source):
+        # Deployments may ship only the compiled artifact.
+        if os.path.exists(target):
+            return read_compiled_bank(target)[0]
+        raise FileNotFoundError(source)
+    header = None
+    if os.path.exists(target):
+        try:
+            df, header = read_compiled_bank(target)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable compiled bank %s: %s", target, e)
+    if header is not None:
+        stat = os.stat(source)
+        if header["source_size"] == stat.st_size and header["source_mtime_ns"] == stat.st_mtime_ns:
+            return df
+        fingerprint = source_fingerprint(source)
+        if header["source_sha256"] == fingerprint["source_sha256"]:
+            # Touched but unchanged: keep the artifact and just record the new mtime.
+            _try_write(df, target, fingerprint)
+            return df
+    fingerprint = source_fingerprint(source)
+    df = read_source_questions(source)
+    _try_write(df, target, fingerprint)
+    return df
+
+def _try_write(df, target, fingerprint):
+    try:
+        write_compiled_bank(df, target, fingerprint)
+    except OSError as e:
+        logger.warning("Could not write compiled bank %s: %s", target, e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the question spreadsheet into the fast-loading bank format.")
+    parser.add_argument("source", nargs="?", default="edit.xlsx")
+    parser.add_argument("-o", "--output", help="compiled file (default: <source>.bank.npz)")
+    args = parser.parse_args()
+    questions = compile_question_bank(args.source, args.output)
+    print(f"Compiled {len(questions)} questions to {args.output or compiled_path(args.source)}")
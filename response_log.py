@@ -0,0 +1,183 @@
+import atexit
+import glob
+import logging
+import os
+import secrets
+import threading
+import time
+
+import numpy as np
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Settings and Record Layout
+# ==============================================================================
+# Item-level answers for calibration and analytics. Each answer is one
+# fixed-width record appended to an in-memory buffer; a daemon thread writes
+# full buffers (or whatever is waiting every FLUSH_INTERVAL_SECONDS) as one
+# immutable .npy part file per flush, partitioned by UTC day:
+#   response_log/date=2026-01-31/part-<unix ns>-<pid>-<seq>.npy
+# np.load(part, mmap_mode="r") maps a part without copying it, so batch jobs
+# can scan millions of responses straight from the page cache.
+RESPONSE_LOG_DIR = "response_log"
+BUFFER_ROWS = 4096
+FLUSH_INTERVAL_SECONDS = 30.0
+
+RESPONSE_DTYPE = np.dtype([
+    ("answered_at", "<f8"),       # unix seconds
+    ("session_id", "<u8"),        # random per started test
+    ("bank_fingerprint", "<u8"),  # ItemBank.fingerprint, the same in every process
+    ("position", "<u2"),          # order shown in the test, from 0
+    ("item", "<i4"),              # position in the bank with that fingerprint
+    ("item_key", "<u8"),          # ItemBank.item_keys, stable across bank versions
+    ("label", "<i8"),             # source spreadsheet row label at the time
+    ("trait", "<i2"),             # trait code
+    ("response", "u1"),           # CHOICE_VALUES value (1-4)
+])
+
+def new_session_id():
+    # 63 bits so the id also fits signed 64-bit columns downstream.
+    return secrets.randbits(63)
+
+def partition_dir(directory, timestamp):
+    return os.path.join(directory, time.strftime("date=%Y-%m-%d", time.gmtime(timestamp)))
+
+# ==============================================================================
+# 1. Buffered Writer
+# ==============================================================================
+class ResponseLog:
+    def __init__(self, directory=RESPONSE_LOG_DIR, buffer_rows=BUFFER_ROWS, flush_interval=FLUSH_INTERVAL_SECONDS):
+        self.directory = directory
+        self.buffer_rows = buffer_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.parts_written = 0
+        self.write_failures = 0
+        self._buffer = np.empty(buffer_rows, dtype=RESPONSE_DTYPE)
+        self._count = 0
+        # Full buffers waiting for the writer thread, oldest first.
+        self._pending = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="response-log-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def append(self, session_id, bank_fingerprint, position, item, item_key, label, trait, response):
+        # The hot path: one record copied into the buffer, no I/O.
+        with self._lock:
+            self._buffer[self._count] = (
+                time.time(), session_id, bank_fingerprint, position, item, item_key, label, trait, response
+            )
+            self._count += 1
+            if self._count == self.buffer_rows:
+                self._pending.append(self._buffer)
+                self._buffer = np.empty(self.buffer_rows, dtype=RESPONSE_DTYPE)
+                self._count = 0
+                self._wake.set()
+
+    def record_answer(self, session, item_bank, pos):
+        # Logs the answer submit_answer just recorded for bank position `pos`.
+        order = session.question_count - 1
+        self.append(
+            session.session_id, item_bank.fingerprint, order, pos,
+            item_bank.item_keys[pos], item_bank.labels[pos], item_bank.trait_codes[pos], session.responses[order]
+        )
+
+    def buffered(self):
+        with self._lock:
+            return self._count + sum(len(chunk) for chunk in self._pending)
+
+    def flush(self):
+        # Writes everything appended so far; returns the number of rows written.
+        with self._write_lock:
+            with self._lock:
+                chunks = self._pending
+                if self._count:
+                    chunks.append(self._buffer[:self._count].copy())
+                    self._count = 0
+                self._pending = []
+            written = 0
+            for position, chunk in enumerate(chunks):
+                try:
+                    self._write_part(chunk)
+                except Exception as e:
+                    self.write_failures += 1
+                    logger.error("Response log write of %d rows failed, keeping them for retry: %s", len(chunk), e)
+                    with self._lock:
+                        self._pending[:0] = chunks[position:]
+                    break
+                written += len(chunk)
+            return written
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(10.0)
+        self.flush()
+
+    def _write_part(self, rows):
+        timestamp = float(rows["answered_at"][0])
+        directory = partition_dir(self.directory, timestamp)
+        os.makedirs(directory, exist_ok=True)
+        self._sequence += 1
+        name = f"part-{int(timestamp * 1e9)}-{os.getpid()}-{self._sequence:06d}.npy"
+        # Written under a temporary name and renamed, so readers never see a
+        # partial part file.
+        with atomic_write(os.path.join(directory, name)) as f:
+            np.save(f, rows)
+        self.rows_written += len(rows)
+        self.parts_written += 1
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def start_response_log(directory=RESPONSE_LOG_DIR, **settings):
+    log = ResponseLog(directory, **settings).start()
+    atexit.register(log.close)
+    return log
+
+# ==============================================================================
+# 2. Readers
+# ==============================================================================
+def part_files(directory=RESPONSE_LOG_DIR, start_date=None, end_date=None):
+    # Part files in write order, optionally limited to "YYYY-MM-DD" dates.
+    paths = []
+    for partition in sorted(glob.glob(os.path.join(directory, "date=*"))):
+        date = os.path.basename(partition)[len("date="):]
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        paths.extend(sorted(glob.glob(os.path.join(partition, "part-*.npy"))))
+    return paths
+
+def iter_parts(directory=RESPONSE_LOG_DIR, start_date=None, end_date=None):
+    # Read-only memory maps, one per part; nothing is copied until touched.
+    # Parts in an older record layout cannot be joined to items and are skipped.
+    for path in part_files(directory, start_date, end_date):
+        part = np.load(path, mmap_mode="r")
+        if part.dtype != RESPONSE_DTYPE:
+            logger.warning("Skipping response log part %s with an older record layout", path)
+            continue
+        yield part
+
+def read_responses(directory=RESPONSE_LOG_DIR, start_date=None, end_date=None):
+    # All matching responses as one in-memory structured array.
+    parts = list(iter_parts(directory, start_date, end_date))
+    if not parts:
+        return np.empty(0, dtype=RESPONSE_DTYPE)
+    return np.concatenate(parts)
@@ -0,0 +1,115 @@
+import json
+import sqlite3
+import threading
+import time
+
+# ==============================================================================
+# Local Write-Ahead Result Store
+# ==============================================================================
+# Every finished test is committed here before anything talks to Google.
+# SQLite in WAL mode with synchronous=NORMAL makes an append a sub-millisecond
+# local write that survives a process crash; the Sheets sync replays records
+# past its stored offset, so an outage only delays results, never loses them.
+# Every process on the host may append, but only the holder of the sync
+# lease sends rows: the lease is claimed and renewed in a BEGIN IMMEDIATE
+# transaction and passes to another process once it lapses.
+RESULTS_DB_PATH = "results.db"
+SHEETS_SYNC = "sheets"
+SYNC_LEASE_SECONDS = 120.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    row TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_offsets (
+    name TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class ResultStore:
+    def __init__(self, path=RESULTS_DB_PATH, sync_name=SHEETS_SYNC, synchronous="NORMAL"):
+        self.path = path
+        self.sync_name = sync_name
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.executescript(_SCHEMA)
+
+    def append(self, row):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO results (created_at, row) VALUES (?, ?)",
+                (time.time(), json.dumps(list(row), ensure_ascii=False))
+            )
+            return cursor.lastrowid
+
+    def synced_offset(self):
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT offset FROM sync_offsets WHERE name = ?", (self.sync_name,)
+            ).fetchone()
+        return found[0] if found else 0
+
+    def read_unsynced(self, limit):
+        offset = self.synced_offset()
+        with self._lock:
+            records = self._conn.execute(
+                "SELECT id, row FROM results WHERE id > ? ORDER BY id LIMIT ?", (offset, limit)
+            ).fetchall()
+        return [(record_id, json.loads(row)) for record_id, row in records]
+
+    def mark_synced(self, record_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sync_offsets (name, offset) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET offset = MAX(offset, excluded.offset)",
+                (self.sync_name, record_id)
+            )
+
+    def claim_sync(self, owner, lease_seconds=SYNC_LEASE_SECONDS):
+        # True if `owner` holds (or has just taken) the sync lease, which is
+        # then extended for lease_seconds.
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                found = self._conn.execute(
+                    "SELECT owner, expires_at FROM sync_leases WHERE name = ?", (self.sync_name,)
+                ).fetchone()
+                claimed = found is None or found[0] == owner or found[1] <= now
+                if claimed:
+                    self._conn.execute(
+                        "INSERT INTO sync_leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                        (self.sync_name, owner, now + lease_seconds)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def release_sync(self, owner):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM sync_leases WHERE name = ? AND owner = ?", (self.sync_name, owner)
+            )
+
+    def unsynced_count(self):
+        offset = self.synced_offset()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results WHERE id > ?", (offset,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
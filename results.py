@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from adaptive_engine import ability_estimates, new_log_posterior
+from settings import TRAITS
+
+# ==============================================================================
+# Result Scoring and Sheet Rows
+# ==============================================================================
+RESULT_HEADERS = ['Timestamp', 'الاسم', 'السن', 'العنوان', 'السمة الأساسية'] + [f"درجة {trait}" for trait in TRAITS] + ["الدرجة العليا"]
+
+def calculate_results(session, user_info, traits=TRAITS):
+    # `traits` names the session's trait codes (the item bank's traits, which
+    # start with TRAITS).
+    trait_scores = session.trait_means(traits)
+    dominant_trait = max(trait_scores, key=trait_scores.get) if trait_scores else "غير محدد"
+    dominant_score = trait_scores.get(dominant_trait, 0.0)
+    summary_for_save = {
+        "name": user_info.get("name", ""),
+        "age": user_info.get("age", ""),
+        "location": user_info.get("location", ""),
+        "test_date": user_info.get("test_date", "")
+    }
+    for trait in TRAITS:
+        summary_for_save[f"درجة {trait}"] = round(trait_scores.get(trait, 0.0), 2)
+    # Model-based ability (theta) and its standard error; rows follow TRAITS
+    # because the item bank is built with TRAITS first.
+    trait_log_posterior = session.log_posterior
+    if trait_log_posterior is None:
+        trait_log_posterior = new_log_posterior(len(TRAITS))
+    thetas, standard_errors = ability_estimates(trait_log_posterior)
+    for i, trait in enumerate(TRAITS):
+        summary_for_save[f"ثيتا {trait}"] = round(float(thetas[i]), 3)
+        summary_for_save[f"الخطأ المعياري {trait}"] = round(float(standard_errors[i]), 3)
+    return trait_scores, dominant_trait, dominant_score, summary_for_save
+
+def build_result_row(user_data, results, dominant_trait):
+    max_score = max(results.values()) if results else 0.0
+    return [
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        user_data.get('name', 'N/A'),
+        user_data.get('age', 'N/A'),
+        user_data.get('location', 'N/A'),
+        dominant_trait
+    ] + [f"{results.get(trait, 0.0):.2f}" for trait in TRAITS] + [f"{max_score:.2f}"]
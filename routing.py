@@ -0,0 +1,174 @@
+import argparse
+import copy
+import random
+import threading
+import time
+
+import numpy as np
+
+from adaptive_engine import (
+    INFO_GRID, NUM_CATEGORIES, SELECTION_STRATEGY, build_item_bank, candidate_traits, current_theta,
+    select_next_item, selection_tiers, start_test, submit_answer
+)
+from session_record import SessionRecord
+
+# ==============================================================================
+# 0. Precomputed Routing
+# ==============================================================================
+# With four answers per question, the max-info policy's first `depth`
+# questions form a 4-ary tree keyed by the answers so far. The builder
+# expands the tree once per bank version, in a background thread, and keeps
+# one item position per node in a flat array, level by level:
+# node = level_offsets[level] + base-4 index of the answers.
+# Items with the same trait and identical a/b/c/d are interchangeable, so a
+# lookup draws uniformly among the unasked members of the stored item's
+# class, which is what the live selection's tie-breaking jitter does.
+# A node where items of different classes tie (within the jitter) is left
+# to the live selection, together with everything below it, since which one
+# wins changes the rest of the path.
+ROUTING_DEPTH = 6
+ROUTED_STRATEGIES = ("max_info",)
+TIE_TOLERANCE = 1e-6
+
+def equivalence_classes(bank):
+    # CSR layout: members of item i's class are
+    # class_members[class_offsets[class_of[i]]:class_offsets[class_of[i] + 1]].
+    keys = np.column_stack([bank.trait_codes.astype(np.float64), bank.params.T])
+    _, class_of = np.unique(keys, axis=0, return_inverse=True)
+    class_of = class_of.reshape(-1).astype(np.int32)
+    class_members = np.argsort(class_of, kind="stable").astype(np.int32)
+    class_offsets = np.zeros(class_of.max() + 2 if len(class_of) else 1, dtype=np.int32)
+    np.cumsum(np.bincount(class_of), out=class_offsets[1:])
+    return class_of, class_members, class_offsets
+
+
+class RoutingTable:
+    __slots__ = ("depth", "strategy", "level_offsets", "items", "class_of", "class_members", "class_offsets")
+
+    def __init__(self, depth, strategy, items, class_of, class_members, class_offsets):
+        self.depth = depth
+        self.strategy = strategy
+        self.level_offsets = [(NUM_CATEGORIES ** level - 1) // (NUM_CATEGORIES - 1) for level in range(depth + 1)]
+        self.items = items
+        self.class_of = class_of
+        self.class_members = class_members
+        self.class_offsets = class_offsets
+        for array in (items, class_of, class_members, class_offsets):
+            array.flags.writeable = False
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.items, self.class_of, self.class_members, self.class_offsets))
+
+    def node(self, responses):
+        index = 0
+        for score in responses:
+            index = index * NUM_CATEGORIES + score - 1
+        return self.level_offsets[len(responses)] + index
+
+    def lookup(self, session):
+        # The next item position, or -1 past the table's depth.
+        level = session.question_count
+        if level >= self.depth:
+            return -1
+        pos = int(self.items[self.node(session.responses[:level].tolist())])
+        if pos < 0:
+            return -1
+        code = self.class_of[pos]
+        start, stop = self.class_offsets[code], self.class_offsets[code + 1]
+        if stop - start == 1:
+            return pos
+        # The path asks the same number of this class's items as the build
+        # did, so an unasked member exists; rejection sampling is O(1) expected.
+        asked = set(session.asked_positions().tolist())
+        while True:
+            candidate = int(self.class_members[start + random.randrange(stop - start)])
+            if candidate not in asked:
+                return candidate
+
+
+def routed_item(bank, session, class_of, strategy):
+    # The policy's pick when it is unambiguous up to interchangeable items,
+    # else -1.
+    pos = select_next_item(bank, session, strategy, jitter=False)
+    if pos < 0:
+        return -1
+    traits, _ = candidate_traits(bank, session, selection_tiers(bank, session))
+    theta = current_theta(bank, session)
+    grid = np.abs(theta[:, None] - INFO_GRID).argmin(axis=1)
+    best = bank.info_table[grid[bank.trait_codes[pos]], pos]
+    asked = session.asked_positions()
+    for code in traits:
+        items = bank.trait_items(code)
+        info = bank.info_table[grid[code], items].astype(np.float64)
+        asked_here = asked[bank.trait_codes[asked] == code]
+        info[bank.trait_slot[asked_here] - bank.trait_start[code]] = -np.inf
+        if np.any(class_of[items[info >= best - TIE_TOLERANCE]] != class_of[pos]):
+            return -1
+    return pos
+
+def _child(session, pos, score, bank):
+    # A shallow copy (not counted as a live session) with its own arrays.
+    child = copy.copy(session)
+    child.asked = session.asked.copy()
+    child.responses = session.responses.copy()
+    child.question_count = session.question_count
+    child.trait_sums = session.trait_sums.copy()
+    child.trait_counts = session.trait_counts.copy()
+    child.log_posterior = session.log_posterior.copy()
+    child.asked[child.question_count] = pos
+    child.current_item = pos
+    submit_answer(bank, child, score)
+    return child
+
+def build_routing_table(bank, depth=ROUTING_DEPTH, max_questions=None, strategy=SELECTION_STRATEGY):
+    # None when the strategy is not deterministic or there is nothing to route;
+    # unrouted nodes hold -1.
+    if strategy not in ROUTED_STRATEGIES or bank.size == 0:
+        return None
+    if max_questions is not None:
+        depth = min(depth, max_questions)
+    if depth <= 0:
+        return None
+    dtype = np.int16 if bank.size <= np.iinfo(np.int16).max else np.int32
+    items = np.full((NUM_CATEGORIES ** depth - 1) // (NUM_CATEGORIES - 1), -1, dtype=dtype)
+    classes = equivalence_classes(bank)
+    root = SessionRecord(max(depth, max_questions or depth))
+    start_test(bank, root)
+    # Breadth-first, so a level's nodes are written in base-4 order.
+    level_sessions = [root]
+    node = 0
+    for level in range(depth):
+        next_sessions = []
+        for session in level_sessions:
+            pos = routed_item(bank, session, classes[0], strategy) if session is not None else -1
+            items[node] = pos
+            node += 1
+            if level + 1 < depth:
+                for score in range(1, NUM_CATEGORIES + 1):
+                    next_sessions.append(_child(session, pos, score, bank) if pos >= 0 else None)
+        level_sessions = next_sessions
+    return RoutingTable(depth, strategy, items, *classes)
+
+def start_routing_build(bank, depth=ROUTING_DEPTH, max_questions=None, strategy=SELECTION_STRATEGY):
+    # Builds in a daemon thread and attaches the table to the bank when done;
+    # until then every question is selected live.
+    def build():
+        bank.routing = build_routing_table(bank, depth, max_questions, strategy)
+    thread = threading.Thread(target=build, name="routing-build", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from question_bank import load_question_bank
+    from settings import MAX_QUESTIONS, TRAITS
+    parser = argparse.ArgumentParser(description="Build the routing table for a bank and report its size.")
+    parser.add_argument("source", nargs="?", default="edit.xlsx")
+    parser.add_argument("--depth", type=int, default=ROUTING_DEPTH)
+    args = parser.parse_args()
+    bank = build_item_bank(load_question_bank(args.source), TRAITS)
+    start = time.perf_counter()
+    table = build_routing_table(bank, args.depth, MAX_QUESTIONS)
+    print(f"Routed {int((table.items >= 0).sum())} of {len(table.items)} nodes ({table.depth} levels) "
+          f"of a {bank.size}-item bank in {time.perf_counter() - start:.2f}s, {table.nbytes / 1024:.1f} KiB")
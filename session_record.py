@@ -0,0 +1,98 @@
+import secrets
+import weakref
+from datetime import datetime
+
+import numpy as np
+
+from response_log import new_session_id
+
+# ==============================================================================
+# Per-Session Record
+# ==============================================================================
+# Everything one respondent's session needs, in one fixed-size object stored
+# under a single st.session_state key. Item positions and answers live in
+# arrays preallocated to the test length, per-trait running sums/counts
+# replace the growing answer lists, and the current question is an index
+# into the shared item bank rather than a copy of its text.
+# Every record still held by a session, for the active-session gauges.
+LIVE_SESSIONS = weakref.WeakSet()
+
+class SessionRecord:
+    __slots__ = (
+        "page", "user_info", "user_registered", "registration_status", "test_started", "results_saved",
+        "bank_version", "bank_fingerprint", "session_id", "asked", "responses", "question_count", "current_item",
+        "trait_sums", "trait_counts", "log_posterior", "token", "__weakref__",
+    )
+
+    def __init__(self, max_questions):
+        self.page = "onboarding"
+        self.user_info = {}
+        self.user_registered = False
+        self.registration_status = ""
+        self.test_started = False
+        self.results_saved = False
+        self.bank_version = None
+        self.bank_fingerprint = None
+        self.session_id = None
+        self.asked = np.full(max_questions, -1, dtype=np.int16)
+        self.responses = np.zeros(max_questions, dtype=np.uint8)
+        self.question_count = 0
+        self.current_item = -1
+        self.trait_sums = None
+        self.trait_counts = None
+        self.log_posterior = None
+        # Key of this record in the session store (see session_store.py).
+        self.token = secrets.token_urlsafe(16)
+        LIVE_SESSIONS.add(self)
+
+    def register(self, name, age, location):
+        # Validates the onboarding form; returns the error to show, or None
+        # once user_info is set.
+        if not name or not age or not location:
+            return "❌ يرجى ملء جميع الحقول."
+        if age < 13 or age > 120:
+            return "❌ يرجى إدخال عمر صحيح (13-120)."
+        self.user_info = {
+            "name": name,
+            "age": age,
+            "location": location,
+            "test_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self.user_registered = True
+        return None
+
+    def start_test(self, item_bank, log_posterior, bank_version=None):
+        # int16 positions cover banks up to 32767 items; larger banks widen the array.
+        dtype = np.int16 if item_bank.size <= np.iinfo(np.int16).max else np.int32
+        self.asked = np.full(len(self.asked), -1, dtype=dtype)
+        self.responses[:] = 0
+        self.question_count = 0
+        self.current_item = -1
+        self.trait_sums = np.zeros(item_bank.num_traits, dtype=np.uint16)
+        self.trait_counts = np.zeros(item_bank.num_traits, dtype=np.uint8)
+        self.log_posterior = log_posterior
+        self.bank_version = bank_version
+        self.bank_fingerprint = item_bank.fingerprint
+        # Ties this test's rows in the response log together.
+        self.session_id = new_session_id()
+        self.results_saved = False
+
+    @property
+    def max_questions(self):
+        return len(self.asked)
+
+    @property
+    def last_score(self):
+        return int(self.responses[self.question_count - 1]) if self.question_count else None
+
+    def asked_positions(self):
+        return self.asked[:self.question_count]
+
+    def trait_means(self, traits):
+        # Mean 1-4 answer per trait that has at least one answer, keyed by name.
+        if self.trait_counts is None:
+            return {}
+        return {
+            trait: int(self.trait_sums[code]) / int(self.trait_counts[code])
+            for code, trait in enumerate(traits) if self.trait_counts[code]
+        }
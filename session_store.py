@@ -0,0 +1,304 @@
+import json
+import logging
+import sqlite3
+import struct
+import threading
+import time
+
+import numpy as np
+
+from session_record import SessionRecord
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Settings and Binary Format
+# ==============================================================================
+# Where in-flight tests live between requests. The in-memory store keeps the
+# SessionRecord objects themselves; the SQLite store lets several processes
+# (or nodes sharing the file) serve the same test. What is stored is only
+# the state that cannot be derived: a small header, the asked item
+# positions and the answers. The log-posterior and per-trait sums are
+# rebuilt from those on load (adaptive_engine.restore_test), except for a
+# finished test: its header also carries them, so its results page needs no
+# item bank and survives the bank being evicted.
+SESSION_DB_PATH = "sessions.db"
+SESSION_TTL_SECONDS = 3600.0
+EVICT_INTERVAL_SECONDS = 60.0
+FORMAT_VERSION = 2
+PAGES = ("onboarding", "test", "results")
+_FLAG_REGISTERED, _FLAG_STARTED, _FLAG_SAVED, _FLAG_SCORES = 1, 2, 4, 8
+# version, flags, page, question count, max questions, current item, bank
+# fingerprint and session id (0 for none), user-info and status lengths. The
+# bank is named by its content fingerprint: registry version numbers are
+# per process.
+_HEADER = struct.Struct("<BBBBBiQQHH")
+# With _FLAG_SCORES, after the status: trait and quadrature node counts, then
+# uint16 trait sums, uint8 trait counts and the float64 log-posterior.
+_SCORES = struct.Struct("<BB")
+
+def encode_scores(session):
+    log_posterior = np.ascontiguousarray(session.log_posterior, dtype="<f8")
+    return (_SCORES.pack(*log_posterior.shape) + session.trait_sums.astype("<u2").tobytes()
+            + session.trait_counts.astype(np.uint8).tobytes() + log_posterior.tobytes())
+
+def decode_scores(session, data, offset):
+    num_traits, num_nodes = _SCORES.unpack_from(data, offset)
+    offset += _SCORES.size
+    session.trait_sums = np.frombuffer(data, dtype="<u2", count=num_traits, offset=offset).astype(np.uint16)
+    offset += 2 * num_traits
+    session.trait_counts = np.frombuffer(data, dtype=np.uint8, count=num_traits, offset=offset).copy()
+    offset += num_traits
+    session.log_posterior = np.frombuffer(
+        data, dtype="<f8", count=num_traits * num_nodes, offset=offset
+    ).reshape(num_traits, num_nodes).astype(np.float64)
+    return offset + 8 * num_traits * num_nodes
+
+def encode_header(session):
+    user_info = json.dumps(session.user_info, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    status = session.registration_status.encode("utf-8")
+    scores = session.page == "results" and session.log_posterior is not None
+    flags = ((_FLAG_REGISTERED if session.user_registered else 0) | (_FLAG_STARTED if session.test_started else 0)
+             | (_FLAG_SAVED if session.results_saved else 0) | (_FLAG_SCORES if scores else 0))
+    return _HEADER.pack(
+        FORMAT_VERSION, flags, PAGES.index(session.page), session.question_count, session.max_questions,
+        session.current_item, session.bank_fingerprint or 0, session.session_id or 0, len(user_info), len(status)
+    ) + user_info + status + (encode_scores(session) if scores else b"")
+
+def decode_header(data):
+    # A fresh SessionRecord with the header fields set; returns it and the
+    # offset where the header ends.
+    (version, flags, page, question_count, max_questions, current_item, bank_fingerprint, session_id,
+     user_info_length, status_length) = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported session format version: {version}")
+    session = SessionRecord(max_questions)
+    session.user_registered = bool(flags & _FLAG_REGISTERED)
+    session.test_started = bool(flags & _FLAG_STARTED)
+    session.results_saved = bool(flags & _FLAG_SAVED)
+    session.page = PAGES[page]
+    session.question_count = question_count
+    session.bank_fingerprint = bank_fingerprint or None
+    session.current_item = current_item
+    session.session_id = session_id or None
+    offset = _HEADER.size
+    session.user_info = json.loads(bytes(data[offset:offset + user_info_length]).decode("utf-8"))
+    offset += user_info_length
+    session.registration_status = bytes(data[offset:offset + status_length]).decode("utf-8")
+    offset += status_length
+    if flags & _FLAG_SCORES:
+        offset = decode_scores(session, data, offset)
+    return session, offset
+
+def encode_session(session):
+    # Header, then int32 positions and uint8 answers of the questions asked
+    # so far: under 200 bytes for a full 15-question test.
+    count = session.question_count
+    return (encode_header(session) + session.asked[:count].astype("<i4").tobytes()
+            + session.responses[:count].tobytes())
+
+def decode_session(data):
+    session, offset = decode_header(data)
+    count = session.question_count
+    set_answers(session, np.frombuffer(data, dtype="<i4", count=count, offset=offset),
+                np.frombuffer(data, dtype=np.uint8, count=count, offset=offset + 4 * count))
+    return session
+
+def set_answers(session, positions, responses):
+    # The answered positions, then the on-screen item in the next slot, where
+    # selection put it. Positions widen to int32 when any exceeds int16, as
+    # in start_test.
+    largest = max(int(positions.max()) if len(positions) else -1, session.current_item)
+    if largest > np.iinfo(session.asked.dtype).max:
+        session.asked = session.asked.astype(np.int32)
+    session.asked[:len(positions)] = positions
+    session.responses[:len(responses)] = responses
+    if session.current_item >= 0 and len(positions) < session.max_questions:
+        session.asked[len(positions)] = session.current_item
+
+# ==============================================================================
+# 1. In-Memory Store
+# ==============================================================================
+class MemorySessionStore:
+    # Process-local default: records are kept as objects, so load/save cost a
+    # dict lookup. Idle sessions expire after `ttl` seconds.
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, token):
+        now = time.monotonic()
+        with self._lock:
+            found = self._sessions.get(token)
+            if found is None:
+                return None
+            session, expires_at = found
+            if expires_at <= now:
+                del self._sessions[token]
+                return None
+            self._sessions[token] = (session, now + self.ttl)
+            return session
+
+    def save(self, token, session):
+        with self._lock:
+            self._sessions[token] = (session, time.monotonic() + self.ttl)
+
+    def delete(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def evict_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [token for token, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for token in expired:
+                del self._sessions[token]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._sessions)
+
+# ==============================================================================
+# 2. SQLite Store
+# ==============================================================================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    header BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+CREATE TABLE IF NOT EXISTS answers (
+    token TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    item INTEGER NOT NULL,
+    response INTEGER NOT NULL,
+    PRIMARY KEY (token, seq)
+) WITHOUT ROWID;
+"""
+
+
+class SqliteSessionStore:
+    # Shared store for several processes: WAL mode, one header row per
+    # session and one row per answer. A save rewrites the header and inserts
+    # only the answers added since this process last loaded or saved the
+    # session, so an answer costs two small writes in one transaction.
+    # Expiry uses wall-clock time, which every process sharing the file sees.
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL_SECONDS, synchronous="NORMAL"):
+        self.path = path
+        self.ttl = ttl
+        self._persisted = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.executescript(_SCHEMA)
+
+    def load(self, token):
+        now = time.time()
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT header FROM sessions WHERE token = ? AND expires_at > ?", (token, now)
+            ).fetchone()
+            if found is None:
+                self._persisted.pop(token, None)
+                return None
+            session, _ = decode_header(found[0])
+            session.token = token
+            rows = self._conn.execute(
+                "SELECT item, response FROM answers WHERE token = ? AND seq < ? ORDER BY seq",
+                (token, session.question_count)
+            ).fetchall()
+            self._conn.execute("UPDATE sessions SET expires_at = ? WHERE token = ?", (now + self.ttl, token))
+            self._persisted[token] = len(rows)
+        answers = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        session.question_count = len(answers)
+        set_answers(session, answers[:, 0], answers[:, 1])
+        return session
+
+    def save(self, token, session):
+        count = session.question_count
+        with self._lock:
+            persisted = self._persisted.get(token, 0)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO sessions (token, header, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(token) DO UPDATE SET header = excluded.header, expires_at = excluded.expires_at",
+                    (token, encode_header(session), time.time() + self.ttl)
+                )
+                if count < persisted:
+                    # The test was restarted: drop the old answers.
+                    self._conn.execute("DELETE FROM answers WHERE token = ? AND seq >= ?", (token, count))
+                    persisted = count
+                if count > persisted:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO answers (token, seq, item, response) VALUES (?, ?, ?, ?)",
+                        [(token, seq, int(session.asked[seq]), int(session.responses[seq]))
+                         for seq in range(persisted, count)]
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._persisted[token] = count
+
+    def delete(self, token):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+                self._conn.execute("DELETE FROM answers WHERE token = ?", (token,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._persisted.pop(token, None)
+
+    def evict_expired(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = [row[0] for row in self._conn.execute(
+                    "SELECT token FROM sessions WHERE expires_at <= ?", (time.time(),)
+                )]
+                for token in expired:
+                    self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+                    self._conn.execute("DELETE FROM answers WHERE token = ?", (token,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            for token in expired:
+                self._persisted.pop(token, None)
+        return len(expired)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def start_session_sweeper(store, interval=EVICT_INTERVAL_SECONDS):
+    # Evicts expired sessions in a daemon thread; loads also skip them.
+    def sweep():
+        while True:
+            time.sleep(interval)
+            try:
+                store.evict_expired()
+            except Exception as e:
+                logger.warning("Session eviction failed: %s", e)
+    thread = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+def open_session_store(kind="memory", path=SESSION_DB_PATH, ttl=SESSION_TTL_SECONDS):
+    if kind == "sqlite":
+        return SqliteSessionStore(path, ttl)
+    if kind == "memory":
+        return MemorySessionStore(ttl)
+    raise ValueError(f"Unknown session store: {kind}")
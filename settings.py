@@ -0,0 +1,47 @@
+# ==============================================================================
+# 0. General Settings and Constants
+# ==============================================================================
+GOOGLE_SHEET_ID = "1dzXIAD7xYUX_QM37flfqQTetaui-vycwANgvIzsOoaY"
+MAX_QUESTIONS = 15
+# Import plotly and the Google Sheets stack in a background thread once the
+# first page has been sent (see warmup.py).
+WARMUP_HEAVY_IMPORTS = True
+# Results-page charts and trait rows kept per rounded score vector (LRU).
+REPORT_CACHE_SIZE = 256
+# Prometheus-format metrics (see metrics.py): rewritten to METRICS_FILE every
+# few seconds (None disables) and served on METRICS_PORT at /metrics if set.
+METRICS_FILE = "metrics.prom"
+METRICS_PORT = None
+# Where in-flight tests are kept between reruns (see session_store.py):
+# "memory" for one process, "sqlite" to share SESSION_DB_PATH between
+# replicas so a restarted or rebalanced session resumes its test.
+SESSION_STORE = "memory"
+# Folded-stack output of the sampling profiler; None leaves it off.
+PROFILE_FILE = None
+CHOICES = ["لا أوافق إطلاقًا", "أوافق إلى حد ما", "أوافق", "أوافق بشدة"]
+CHOICE_VALUES = [1, 2, 3, 4]
+
+# Trait Definitions
+TRAITS = [
+    "الانبساط (ذاتي)",
+    "العصبية (ذاتي)",
+    "التوافق (ذاتي)",
+    "الضمير (ذاتي)",
+    "الانفتاح (ذاتي)"
+]
+
+TRAIT_DESCRIPTIONS = {
+    "الانبساط (ذاتي)": "يقيس الانبساط مدى تفاعلك مع العالم الخارجي. الأشخاص ذوو الدرجات العالية يميلون إلى أن يكونوا اجتماعيين ونشيطين ومتحمسين.",
+    "العصبية (ذاتي)": "تشير العصبية إلى مدى استقرارك العاطفي. الأشخاص ذوو الدرجات العالية قد يكونون أكثر عرضة للقلق والتقلبات المزاجية.",
+    "التوافق (ذاتي)": "يعكس التوافق مدى ميلك للتعاون والتعاطف. الأشخاص ذوو الدرجات العالية يكونون عادةً طيبين ومتعاونين وجديرين بالثقة.",
+    "الضمير (ذاتي)": "يقيس الضمير مدى تنظيمك ومسؤوليتك. الأشخاص ذوو الدرجات العالية يتميزون بالاجتهاد والانضباط والتخطيط.",
+    "الانفتاح (ذاتي)": "يشير الانفتاح إلى مدى اهتمامك بالتجارب الجديدة والأفكار الإبداعية. الأشخاص ذوو الدرجات العالية فضوليون ومبتكرون ومتقبلون للتغيير."
+}
+
+TRAIT_COLORS = {
+    "الانبساط (ذاتي)": '#FFD700',
+    "العصبية (ذاتي)": '#FF6347',
+    "التوافق (ذاتي)": '#3CB371',
+    "الضمير (ذاتي)": '#4169E1',
+    "الانفتاح (ذاتي)": '#9370DB'
+}
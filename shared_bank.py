@@ -0,0 +1,162 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from adaptive_engine import INFO_GRID, ItemBank, build_item_bank
+from atomic_file import atomic_write
+from question_bank import load_question_bank
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Shared Bank File Format
+# ==============================================================================
+# The built item bank, written once per source version to a flat file that
+# every worker process maps read-only: the arrays are views into the shared
+# page cache, so a worker's private memory does not grow with the bank.
+# Layout: MAGIC, a little-endian uint64 header length, a JSON header (source
+# size/mtime, traits, the bank's content fingerprint, INFO_GRID and each
+# array's dtype/shape/offset), then the arrays, each aligned to ALIGNMENT
+# bytes. Question text is one UTF-8 blob plus int64 offsets and is decoded
+# per item on access.
+MAGIC = b"ITEMBANK"
+FORMAT_VERSION = 3
+SHARED_SUFFIX = ".bank.mmap"
+ALIGNMENT = 64
+_LENGTH = struct.Struct("<Q")
+
+def shared_path(source):
+    return os.path.splitext(source)[0] + SHARED_SUFFIX
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class QuestionTexts:
+    # Read-only sequence of the question strings over the mapped blob.
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, pos):
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError(pos)
+        return self.blob[self.offsets[pos]:self.offsets[pos + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[pos] for pos in range(len(self)))
+
+# ==============================================================================
+# 1. Write / Attach
+# ==============================================================================
+def write_shared_bank(bank, target, fingerprint):
+    blob = np.frombuffer("".join(bank.questions).encode("utf-8"), dtype=np.uint8)
+    lengths = [len(text.encode("utf-8")) for text in bank.questions]
+    text_offsets = np.zeros(bank.size + 1, dtype=np.int64)
+    np.cumsum(lengths, out=text_offsets[1:])
+    arrays = {
+        "params": np.ascontiguousarray(bank.params, dtype=np.float64),
+        "trait_codes": bank.trait_codes,
+        "labels": np.asarray(bank.labels, dtype=np.int64),
+        "item_keys": bank.item_keys,
+        "trait_order": bank.trait_order,
+        "trait_slot": bank.trait_slot,
+        "info_table": bank.info_table,
+        "text_offsets": text_offsets,
+        "text_blob": blob,
+    }
+    table = {}
+    offset = 0
+    for name, array in arrays.items():
+        table[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header = dict(fingerprint, format_version=FORMAT_VERSION, traits=list(bank.traits),
+                  fingerprint=bank.fingerprint, info_grid=INFO_GRID.tolist(), arrays=table)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + _LENGTH.size + len(header_bytes))
+    # Written to a temporary file and renamed: workers that mapped the old
+    # version keep it until they drop it, new ones get the complete file.
+    with atomic_write(target) as f:
+        f.write(MAGIC + _LENGTH.pack(len(header_bytes)) + header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + table[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+
+def read_shared_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a shared bank file: {path}")
+        (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length).decode("utf-8"))
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported shared bank version: {header.get('format_version')}")
+    return header, _aligned(len(MAGIC) + _LENGTH.size + length)
+
+def attach_shared_bank(path):
+    # An ItemBank whose arrays are read-only views of the mapped file.
+    header, data_start = read_shared_header(path)
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arrays[name] = np.frombuffer(
+            mapped, dtype=dtype, count=count, offset=data_start + spec["offset"]
+        ).reshape(spec["shape"])
+    return ItemBank(
+        arrays["params"], arrays["trait_codes"], tuple(header["traits"]),
+        QuestionTexts(arrays["text_blob"], arrays["text_offsets"]), arrays["labels"],
+        trait_order=arrays["trait_order"], trait_slot=arrays["trait_slot"], info_table=arrays["info_table"],
+        fingerprint=header["fingerprint"], item_keys=arrays["item_keys"]
+    )
+
+def _is_current(header, source, traits):
+    stat = os.stat(source)
+    return (header["source_size"] == stat.st_size and header["source_mtime_ns"] == stat.st_mtime_ns
+            and header["traits"][:len(traits)] == list(traits) and header["info_grid"] == INFO_GRID.tolist())
+
+def load_shared_bank(source, traits=(), target=None):
+    # Attaches to the shared file when it matches the source; otherwise the
+    # first worker to get here builds the bank, writes the file and attaches
+    # like the rest. Falls back to a private bank if the file cannot be written.
+    target = target or shared_path(source)
+    if os.path.exists(target):
+        try:
+            header, _ = read_shared_header(target)
+            if not os.path.exists(source) or _is_current(header, source, traits):
+                return attach_shared_bank(target)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable shared bank %s: %s", target, e)
+    stat = os.stat(source)
+    bank = build_item_bank(load_question_bank(source), traits)
+    if bank.size == 0:
+        return bank
+    try:
+        write_shared_bank(bank, target, {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns})
+    except OSError as e:
+        logger.warning("Could not write shared bank %s: %s", target, e)
+        return bank
+    return attach_shared_bank(target)
+
+
+if __name__ == "__main__":
+    from settings import TRAITS
+    parser = argparse.ArgumentParser(description="Build the shared, memory-mapped item bank for a question file.")
+    parser.add_argument("source", nargs="?", default="edit.xlsx")
+    args = parser.parse_args()
+    bank = load_shared_bank(args.source, TRAITS)
+    print(f"{bank.size} items in {shared_path(args.source)} ({os.path.getsize(shared_path(args.source)) / 1024:.1f} KiB)")
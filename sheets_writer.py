@@ -0,0 +1,268 @@
+import atexit
+import logging
+import os
+import random
+import secrets
+import threading
+import time
+
+from metrics import external_call, external_failure, timer
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# 0. Settings
+# ==============================================================================
+BATCH_SIZE = 50
+FLUSH_INTERVAL_SECONDS = 2.0
+# Failed batches are retried until they go through. After a quota (429),
+# transient server or connection error the delay doubles from
+# BACKOFF_BASE_SECONDS, at most MAX_BACKOFF_DOUBLINGS times and never past
+# BACKOFF_MAX_SECONDS; anything else (e.g. a 400) is logged as an error and
+# retried only every BACKOFF_MAX_SECONDS.
+MAX_BACKOFF_DOUBLINGS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def is_retryable(error):
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ConnectionError, TimeoutError, OSError))
+
+# ==============================================================================
+# 1. Outboxes
+# ==============================================================================
+class MemoryOutbox:
+    # Non-durable outbox with the same interface as result_store.ResultStore:
+    # records get increasing ids and a sync offset marks the last one sent.
+    def __init__(self):
+        self._records = []
+        self._next_id = 1
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def append(self, row):
+        with self._lock:
+            record_id = self._next_id
+            self._next_id += 1
+            self._records.append((record_id, list(row)))
+            return record_id
+
+    def read_unsynced(self, limit):
+        with self._lock:
+            return self._records[:limit]
+
+    def mark_synced(self, record_id):
+        with self._lock:
+            self._offset = record_id
+            self._records = [record for record in self._records if record[0] > record_id]
+
+    def unsynced_count(self):
+        with self._lock:
+            return len(self._records)
+
+    def synced_offset(self):
+        return self._offset
+
+    def claim_sync(self, owner, lease_seconds=None):
+        # Process-local, so the writer that owns it always syncs.
+        return True
+
+    def release_sync(self, owner):
+        pass
+
+# ==============================================================================
+# 2. Background Batch Writer
+# ==============================================================================
+class SheetsBatchWriter:
+    # Process-wide sync from an outbox to the results worksheet. submit()
+    # commits a row to the outbox and returns; a daemon thread replays the
+    # unsynced rows with one append_rows call per batch, as soon as
+    # BATCH_SIZE rows are waiting or every FLUSH_INTERVAL_SECONDS. The outbox
+    # offset only advances once Google accepts a batch, so failed batches are
+    # retried with backoff until they go through instead of being dropped.
+    # With a store shared by several processes, only the writer holding the
+    # store's sync lease sends; the others just append and keep checking.
+    def __init__(self, open_worksheet, outbox=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL_SECONDS,
+                 max_backoff_doublings=MAX_BACKOFF_DOUBLINGS, backoff_base=BACKOFF_BASE_SECONDS,
+                 backoff_max=BACKOFF_MAX_SECONDS,
+                 on_write_error=None):
+        self.open_worksheet = open_worksheet
+        self.outbox = outbox if outbox is not None else MemoryOutbox()
+        self.on_write_error = on_write_error
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff_doublings = max_backoff_doublings
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self.rows_written = 0
+        self.write_failures = 0
+        self.api_calls = 0
+        self._last_error_retryable = True
+        self._worksheet = None
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._synced = threading.Condition()
+
+    def start(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("SheetsBatchWriter is closed.")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sheets-batch-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        record_id = self.outbox.append(row)
+        self.start()
+        if self.outbox.unsynced_count() >= self.batch_size:
+            self._wake.set()
+        return record_id
+
+    def pending(self):
+        return self.outbox.unsynced_count()
+
+    def flush(self, timeout=None):
+        # Blocks until the outbox is fully synced or the timeout expires.
+        if self._thread is None:
+            return not self.pending()
+        self._wake.set()
+        with self._synced:
+            return self._synced.wait_for(lambda: not self.pending(), timeout)
+
+    def close(self, timeout=10.0):
+        # One last attempt to drain; anything still unsynced stays in the outbox.
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._wake.set()
+            thread.join(timeout)
+        self.outbox.release_sync(self.owner)
+
+    def _run(self):
+        failures = 0
+        while True:
+            if failures:
+                delay = self.backoff_max
+                if self._last_error_retryable:
+                    delay = min(delay, self.backoff_base * 2 ** min(failures - 1, self.max_backoff_doublings))
+                self._wake.wait(delay * random.uniform(0.5, 1.0))
+            else:
+                self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            failures = 0 if self._drain() else failures + 1
+            with self._synced:
+                self._synced.notify_all()
+            if self._closed:
+                return
+
+    def _drain(self):
+        while True:
+            # Renewed before every batch, so as long as one batch takes less
+            # than the lease no other process can resend it.
+            if not self.outbox.claim_sync(self.owner):
+                return True
+            records = self.outbox.read_unsynced(self.batch_size)
+            if not records:
+                return True
+            if not self._write([row for _, row in records]):
+                return False
+            self.outbox.mark_synced(records[-1][0])
+
+    def _write(self, rows):
+        try:
+            if self._worksheet is None:
+                self._worksheet = self.open_worksheet()
+                if self._worksheet is None:
+                    raise ConnectionError("Worksheet is not available.")
+            self.api_calls += 1
+            external_call("sheets", "append_rows")
+            with timer("append_rows"):
+                self._worksheet.append_rows(rows)
+            self.rows_written += len(rows)
+            return True
+        except Exception as e:
+            external_failure("sheets", "append_rows")
+            self._worksheet = None
+            self.write_failures += 1
+            if self.on_write_error is not None:
+                self.on_write_error()
+            self._last_error_retryable = is_retryable(e)
+            log = logger.warning if self._last_error_retryable else logger.error
+            log("Sheets write of %d rows failed, keeping them for retry: %s", len(rows), e)
+            return False
+
+
+def start_batch_writer(open_worksheet, **settings):
+    writer = SheetsBatchWriter(open_worksheet, **settings)
+    atexit.register(writer.close)
+    # Catch up on rows a previous process committed but never synced.
+    if writer.pending():
+        writer.start()
+    return writer
+
+# ==============================================================================
+# 3. Local Worksheet Stand-in
+# ==============================================================================
+class LocalWorksheet:
+    # Minimal in-memory substitute for a gspread Worksheet, for benchmarks and
+    # local runs without credentials. `fail_next` makes the next N calls
+    # raise `error`, to exercise the retry path.
+    def __init__(self, latency=0.0, error=None, fail_next=0):
+        self.rows = []
+        self.latency = latency
+        self.error = error
+        self.fail_next = fail_next
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise self.error or ConnectionError("Simulated Sheets failure.")
+        if self.latency:
+            time.sleep(self.latency)
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self._call()
+        with self._lock:
+            self.rows.extend(list(row) for row in values)
+
+    def row_values(self, row, **kwargs):
+        self._call()
+        with self._lock:
+            return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def get(self, range_name, **kwargs):
+        # Rectangular A1 ranges only, e.g. "A2:K501"; rows past the end are
+        # left out, as the Sheets API does.
+        self._call()
+        (first_col, first_row), (last_col, last_row) = (_a1_cell(cell) for cell in range_name.split(":"))
+        with self._lock:
+            return [list(row[first_col - 1:last_col]) for row in self.rows[first_row - 1:last_row]]
+
+    def get_all_values(self):
+        self._call()
+        with self._lock:
+            return [list(row) for row in self.rows]
+
+
+def _a1_cell(cell):
+    letters = cell.rstrip("0123456789")
+    column = 0
+    for letter in letters.upper():
+        column = column * 26 + ord(letter) - ord("A") + 1
+    return column, int(cell[len(letters):])
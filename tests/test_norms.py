@@ -0,0 +1,31 @@
+import numpy as np
+
+from norms import NormsSnapshot
+from settings import TRAITS
+
+
+def snapshot_of(values):
+    scores = np.zeros((len(values), len(TRAITS)))
+    scores[:, 0] = values
+    return NormsSnapshot({None: [np.empty(0, dtype=np.float32)] * len(TRAITS)}, 0).merged(
+        [None] * len(values), scores, len(values)
+    )
+
+
+def test_ties_count_half():
+    # Scores that equal stored values (as saved to the sheet, two decimals)
+    # sit in the middle of their tie group.
+    snapshot = snapshot_of([1.0] * 10 + [2.33] * 10 + [3.0] * 10)
+    assert snapshot.percentile(0, 1.0) == 100.0 * 5 / 30
+    assert snapshot.percentile(0, 2.33) == 50.0
+    assert snapshot.percentile(0, 3.0) == 100.0 * 25 / 30
+
+
+def test_between_stored_values():
+    snapshot = snapshot_of([1.0] * 10 + [2.33] * 10 + [3.0] * 10)
+    assert snapshot.percentile(0, 2.5) == 100.0 * 20 / 30
+    assert snapshot.percentile(0, 0.5) == 0.0
+
+
+def test_too_few_respondents():
+    assert snapshot_of([2.33] * 5).percentile(0, 2.33) is None
@@ -0,0 +1,42 @@
+import numpy as np
+
+from adaptive_engine import build_item_bank, get_next_question_logic, start_test, submit_answer
+from question_bank import load_question_bank
+from session_record import SessionRecord
+from session_store import SqliteSessionStore, decode_session, encode_session
+from settings import MAX_QUESTIONS, TRAITS
+
+
+def finished_session():
+    bank = build_item_bank(load_question_bank("edit.xlsx"), TRAITS)
+    session = SessionRecord(MAX_QUESTIONS)
+    session.register("مستخدم", 30, "القاهرة")
+    start_test(bank, session)
+    session.test_started = True
+    session.page = "test"
+    get_next_question_logic(bank, session)
+    for answer in (1, 4, 2, 3, 3):
+        submit_answer(bank, session, answer)
+        get_next_question_logic(bank, session)
+    return session
+
+
+def test_in_flight_session_is_stored_without_scores():
+    session = finished_session()
+    restored = decode_session(encode_session(session))
+    assert restored.log_posterior is None
+    assert np.array_equal(restored.asked_positions(), session.asked_positions())
+
+
+def test_finished_session_keeps_its_scores(tmp_path):
+    # The results page must not need the bank the test ran on.
+    session = finished_session()
+    session.test_started = False
+    session.page = "results"
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+    store.save(session.token, session)
+    restored = SqliteSessionStore(str(tmp_path / "sessions.db")).load(session.token)
+    assert restored.page == "results"
+    assert restored.trait_means(TRAITS) == session.trait_means(TRAITS)
+    assert np.array_equal(restored.log_posterior, session.log_posterior)
+    store.close()
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from result_store import ResultStore
+from sheets_writer import LocalWorksheet, SheetsBatchWriter
+
+FAST = {"batch_size": 10, "flush_interval": 0.01, "backoff_base": 0.01, "backoff_max": 0.05}
+
+
+class ApiError(Exception):
+    # Shaped like gspread's APIError: the status is on error.response.
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type("Response", (), {"status_code": status_code})()
+
+
+def submit_rows(writer, prefix, count):
+    for i in range(count):
+        writer.submit([prefix, i])
+
+
+def test_failed_batches_are_retried_without_loss_or_duplicates():
+    sheet = LocalWorksheet(fail_next=4)
+    writer = SheetsBatchWriter(lambda: sheet, **FAST)
+    submit_rows(writer, "a", 95)
+    assert writer.flush(10)
+    writer.close()
+    assert sheet.rows == [["a", i] for i in range(95)]
+    assert writer.write_failures == 4
+
+
+def test_non_retryable_errors_wait_the_maximum_backoff():
+    elapsed = {}
+    for status in (429, 400):
+        sheet = LocalWorksheet(error=ApiError(status), fail_next=1)
+        writer = SheetsBatchWriter(lambda: sheet, batch_size=1, flush_interval=0.01, backoff_base=0.01,
+                                   backoff_max=1.0)
+        start = time.perf_counter()
+        writer.submit(["row", status])
+        assert writer.flush(10)
+        elapsed[status] = time.perf_counter() - start
+        writer.close()
+        assert sheet.rows == [["row", status]]
+    # Jittered to between half and all of the delay.
+    assert elapsed[429] < 0.4
+    assert elapsed[400] >= 0.5
+
+
+def test_writers_sharing_a_store_send_each_row_once(tmp_path):
+    path = str(tmp_path / "results.db")
+    sheet = LocalWorksheet(latency=0.005, fail_next=3)
+    writers = [SheetsBatchWriter(lambda: sheet, outbox=ResultStore(path), **FAST) for _ in range(2)]
+    threads = [threading.Thread(target=submit_rows, args=(writer, k, 100)) for k, writer in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(writer.flush(30) for writer in writers)
+    assert sorted(map(tuple, sheet.rows)) == sorted((k, i) for k in range(2) for i in range(100))
+    # The lease holder is gone: the other writer takes over.
+    writers[0].close()
+    writers[1].submit(["after", 0])
+    assert writers[1].flush(10)
+    writers[1].close()
+    assert sheet.rows[-1] == ["after", 0] and len(sheet.rows) == 201
+
+
+def test_an_expired_lease_is_taken_over(tmp_path):
+    # A process that died holding the lease blocks syncing only until it expires.
+    path = str(tmp_path / "results.db")
+    assert ResultStore(path).claim_sync("dead-process", lease_seconds=0.3)
+    sheet = LocalWorksheet()
+    writer = SheetsBatchWriter(lambda: sheet, outbox=ResultStore(path), **FAST)
+    writer.submit(["row", 0])
+    time.sleep(0.1)
+    assert sheet.rows == []
+    assert writer.flush(10)
+    writer.close()
+    assert sheet.rows == [["row", 0]]
@@ -0,0 +1,34 @@
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Background Import Warm-up
+# ==============================================================================
+# Heavy dependencies the app imports on demand: plotly only for the results
+# chart, the Google Sheets stack only when results are saved. After the first
+# page has been sent, a daemon thread can import them so the first results
+# page of a fresh replica does not pay for them.
+HEAVY_MODULES = ("plotly.express", "gspread", "google.oauth2.service_account")
+
+def import_modules(modules=HEAVY_MODULES):
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            # The on-demand import will surface the error where it matters.
+            logger.warning("Warm-up import of %s failed: %s", name, e)
+            continue
+        timings[name] = time.perf_counter() - start
+    logger.info("Warm-up imports done: %s", ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
+
+def start_warmup(modules=HEAVY_MODULES):
+    thread = threading.Thread(target=import_modules, args=(modules,), name="import-warmup", daemon=True)
+    thread.start()
+    return thread